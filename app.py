@@ -4,13 +4,34 @@ import os
 import pandas as pd
 import time
 import json
-import re
+from functools import partial
+
+from assistant_registry import registered_assistant_id, registry_is_stale
+from assistant_runs import RunNotCompleted, ask_assistant_run
+from farm_cache import cache_stats, cached_json, cached_listdir
+from farm_data import ensure_parquet, file_metadata, ingest_csv, read_bytes, read_preview, read_rows, save_upload
+from farm_files import FORECAST_REPORT_NAME
+from farm_metrics import daily_trend, latency_summary, load_metrics, record, timed
+from farm_state import refresh_state
+from job_queue import ACTIVE_STATUSES, list_jobs, submit_all_jobs, submit_job
+from milk_forecast import forecast_milk
+from openai_client import client_stats
+from reports import FORECAST_PROMPT, REPORTS
+from response_cache import CacheMiss, ask_cached, cache_mode, cache_summary
+from run_all_reports import ALL_REPORTS
+from sustainability_kpis import write_sustainability_report
+from ui_components import show_job_status, show_saved_report
+from upload_cache import files_fingerprint, list_data_files, stream_sha256
 
 # === OpenAI API Key ===
 openai.api_key = st.secrets["OPENAI_API_KEY"]
 
 # === Load assistant ID ===
-agent_id = st.secrets["dairy_sustainability_agent"]["id"]
+# From the registry written by create-agent.py (no network lookup); older
+# deployments only have it in the secrets
+agent_id = registered_assistant_id() or st.secrets["dairy_sustainability_agent"]["id"]
+if registry_is_stale():
+    st.sidebar.warning("⚠️ Assistant instructions changed. Run create-agent.py to update the assistant.")
 
 # === Base folder for all farms ===
 FOLDER_BASE = "streamlet/farm_data"
@@ -20,7 +41,7 @@ os.makedirs(FOLDER_BASE, exist_ok=True)
 st.sidebar.title("🐄 Dairy Twin AI")
 
 mode = st.sidebar.radio("🔄 Select Mode", ["🔍 Select existing farm", "➕ Create new farm"])
-existing_farms = [d for d in os.listdir(FOLDER_BASE) if os.path.isdir(os.path.join(FOLDER_BASE, d))]
+existing_farms = [d for d in cached_listdir(FOLDER_BASE) if os.path.isdir(os.path.join(FOLDER_BASE, d))]
 
 farm_name = None
 if mode == "🔍 Select existing farm":
@@ -37,10 +58,30 @@ if not farm_name:
 
 st.session_state["farm_name"] = farm_name
 
+# === Shared file cache and OpenAI client statistics ===
+stats = cache_stats()
+st.sidebar.caption(
+    f"🗄️ Cache: {stats['hits']} hits / {stats['misses']} misses · "
+    f"{stats['entries']} entries · {stats['bytes'] / 1024 / 1024:.1f} MB"
+)
+api = client_stats()
+st.sidebar.caption(
+    f"🔁 OpenAI: {api['calls']} calls · {api['throttled']} throttled · "
+    f"{api['rate_limited']} rate-limited · {api['retried']} retried · {api['failed']} failed"
+)
+
 # === Folder for selected farm ===
 FOLDER = os.path.join(FOLDER_BASE, farm_name.replace(" ", "_"))
 os.makedirs(FOLDER, exist_ok=True)
 
+# === Recorded assistant answers of this farm ===
+responses = cache_summary(FOLDER)
+st.sidebar.caption(f"💾 Recorded answers: {responses['entries']} · {responses['bytes'] / 1024 / 1024:.1f} MB")
+if cache_mode() == "replay":
+    st.sidebar.info("🎬 Replay-only mode: recorded answers only, no OpenAI calls.")
+elif cache_mode() == "off":
+    st.sidebar.caption("💾 Response cache disabled (RESPONSE_CACHE=off).")
+
 # === Sidebar menu ===
 view = st.sidebar.radio("📋 Menu", [
     "🧪 Run Sustainability Analysis",
@@ -51,7 +92,9 @@ view = st.sidebar.radio("📋 Menu", [
     "♻️ Biogas & Manure",
     "🌦️ Weather & Climate",
     "🩺 Health Monitoring",
-    "🌍 Sustainability Dashboard"
+    "🌍 Sustainability Dashboard",
+    "🚀 Run All Reports",
+    "⏱️ Analysis Metrics"
 ])
 
 st.title(f"🐄 Dairy Sustainability AI – `{farm_name}`")
@@ -59,87 +102,44 @@ st.title(f"🐄 Dairy Sustainability AI – `{farm_name}`")
 # === 1. Run analysis ===
 if view == "🧪 Run Sustainability Analysis":
     uploaded_files = st.file_uploader("📂 Upload your farm CSV files", type="csv", accept_multiple_files=True)
-    file_ids = []
+    saved_paths = []
 
     if uploaded_files:
         st.subheader("📥 Uploaded Data Preview")
+        # Uploads already ingested in this session (content hash -> path) are
+        # not written, parsed or converted again on reruns
+        ingested = st.session_state.setdefault("ingested_files", {})
+        upload_hashes = st.session_state.setdefault("upload_hashes", {})
         for file in uploaded_files:
-            df = pd.read_csv(file)
-            st.dataframe(df.head())
             path = os.path.join(FOLDER, file.name)
-            df.to_csv(path, index=False)
-            uploaded = openai.files.create(file=open(path, "rb"), purpose="assistants")
-            file_ids.append(uploaded.id)
-
-    if file_ids and st.button("🚀 Run Sustainability Analysis"):
-        thread = openai.beta.threads.create()
-
-        openai.beta.threads.messages.create(
-            thread_id=thread.id,
-            role="user",
-            content="""
-You are an AI agent analyzing dairy farm sustainability.
-
-Strictly return your output as valid JSON in this format:
-
-{
-  "summary": "...",
-  "sustainability": {
-    "economic": {
-      "total_milk_income": float,
-      "total_treatment_costs": float,
-      "monthly_profit_loss": float
-    },
-    "environmental": {
-      "antibiotic_usage_frequency": int,
-      "treatment_intensity": float
-    },
-    "animal_welfare": {
-      "percentage_sick_cows": float,
-      "avg_treatment_duration": float,
-      "high_risk_animals_percentage": float
-    }
-  },
-  "recommendations": [
-    "Recommendation 1",
-    "Recommendation 2",
-    "Recommendation 3"
-  ]
-}
-
-Do NOT include explanations. Only return valid JSON.
-""",
-            attachments=[{"file_id": fid, "tools": [{"type": "code_interpreter"}]} for fid in file_ids]
-        )
-
-        run = openai.beta.threads.runs.create(thread_id=thread.id, assistant_id=agent_id)
-
-        with st.spinner("♻️ Running sustainability analysis..."):
-            while run.status not in ["completed", "failed"]:
-                time.sleep(2)
-                run = openai.beta.threads.runs.retrieve(run.id, thread_id=thread.id)
-
-        messages = openai.beta.threads.messages.list(thread_id=thread.id)
-        for msg in messages.data[::-1]:
-            if msg.role == "assistant":
-                raw = msg.content[0].text.value
-                match = re.search(r"\{[\s\S]*\}", raw)
-                if match:
-                    try:
-                        result = json.loads(match.group(0))
-                        with open(os.path.join(FOLDER, "sustainability_report.json"), "w") as f:
-                            json.dump(result, f, indent=2)
-
-                        st.success("✅ Analysis completed and saved.")
-                        st.experimental_rerun()
-
-                    except Exception as e:
-                        st.error(f"❌ JSON parsing error: {e}")
-                        st.code(match.group(0))
-                else:
-                    st.warning("⚠️ AI did not return valid JSON.")
-                    st.markdown(raw)
-                break
+            if file.file_id not in upload_hashes:
+                file.seek(0)
+                upload_hashes[file.file_id] = stream_sha256(file)
+            sha256 = upload_hashes[file.file_id]
+
+            if ingested.get(sha256) != path or not os.path.exists(path):
+                # Original bytes are kept as-is, plus a typed Parquet copy for the readers
+                save_upload(file, path)
+                ingest_csv(path)
+                ingested[sha256] = path
+
+            st.dataframe(read_preview(path))
+            saved_paths.append(path)
+
+    # === KPIs are computed locally; the AI only writes the summary text ===
+    use_ai_text = st.checkbox("✍️ Let the AI write the summary and recommendations")
+    show_job_status(FOLDER, "sustainability")
+
+    if saved_paths and st.button("🚀 Run Sustainability Analysis"):
+        try:
+            write_sustainability_report(FOLDER)
+        except ValueError as e:
+            st.error(f"❌ {e}")
+        else:
+            st.success("✅ Analysis completed and saved. Open 📊 View Last Report to see it.")
+            if use_ai_text:
+                submit_job(FOLDER, "sustainability", agent_id)
+                st.rerun()
 
 # === 2. View last result ===
 elif view == "📊 View Last Report":
@@ -147,8 +147,7 @@ elif view == "📊 View Last Report":
     if not os.path.exists(report_path):
         st.warning("No analysis report found. Run analysis first.")
     else:
-        with open(report_path, "r") as f:
-            result = json.load(f)
+        result = cached_json(report_path)
 
         st.subheader("📋 Sustainability Analysis Summary")
         st.write(result.get("summary", "No summary provided."))
@@ -177,32 +176,47 @@ elif view == "📊 View Last Report":
 elif view == "📂 Farm Files Overview":
     st.title(f"📂 Uploaded Files for Farm: {farm_name}")
 
-    files = os.listdir(FOLDER)
+    # Parquet copies and the aggregates folder are derived from the CSVs,
+    # only the originals are listed
+    files = [
+        f for f in cached_listdir(FOLDER)
+        if not f.endswith((".parquet", ".tmp")) and os.path.isfile(os.path.join(FOLDER, f))
+    ]
     if not files:
         st.warning("No files found for this farm.")
     else:
-        for file in sorted(files):
-            file_path = os.path.join(FOLDER, file)
-            st.markdown(f"---\n### 📄 {file}")
-
-            # Náhled obsahu souboru (jen CSV/JSON)
-            if file.endswith(".csv"):
-                try:
-                    df = pd.read_csv(file_path)
-                    st.dataframe(df)
-                except Exception as e:
-                    st.error(f"Unable to read CSV: {e}")
-            elif file.endswith(".json"):
-                try:
-                    with open(file_path, "r") as f:
-                        data = json.load(f)
-                        st.json(data)
-                except Exception as e:
-                    st.error(f"Unable to read JSON: {e}")
-
-            # Tlačítko pro stažení
-            with open(file_path, "rb") as f:
-                st.download_button(f"⬇️ Download {file}", f.read(), file_name=file)
+        # === File list from metadata only, no file contents are loaded ===
+        st.dataframe(pd.DataFrame([file_metadata(os.path.join(FOLDER, f)) for f in files]), hide_index=True)
+
+        # === Preview of one file on demand ===
+        st.markdown("---")
+        file = st.selectbox("📄 Preview file", files)
+        file_path = os.path.join(FOLDER, file)
+
+        # Náhled obsahu souboru (jen CSV/JSON)
+        if file.endswith(".csv"):
+            try:
+                # Opening a CSV ingests it if it has no Parquet copy yet
+                ensure_parquet(file_path)
+                total_rows = file_metadata(file_path)["rows"]
+                col1, col2 = st.columns(2)
+                page_size = col1.selectbox("Rows per page", [50, 200, 1000])
+                pages = max(1, -(-total_rows // page_size)) if total_rows else None
+                page = col2.number_input("Page", min_value=1, max_value=pages, value=1)
+                start = (page - 1) * page_size
+                df = read_rows(file_path, start, page_size)
+                st.dataframe(df)
+                st.caption(f"Rows {start + 1}–{start + len(df)}" + (f" of {total_rows}" if total_rows else ""))
+            except Exception as e:
+                st.error(f"Unable to read CSV: {e}")
+        elif file.endswith(".json"):
+            try:
+                st.json(cached_json(file_path))
+            except Exception as e:
+                st.error(f"Unable to read JSON: {e}")
+
+        # Tlačítko pro stažení – the file is only read when the button is clicked
+        st.download_button(f"⬇️ Download {file}", partial(read_bytes, file_path), file_name=file)
 
 
 # === 1. Milk Production Forecast ===
@@ -216,61 +230,89 @@ elif view == "📈 Milk Production Forecast":
         st.warning("Farm folder not found.")
         st.stop()
 
-    data_files = [os.path.join(FOLDER, f) for f in os.listdir(FOLDER) if f.endswith(".csv") or f.endswith(".json")]
-    if not data_files:
-        st.warning("No data files found for this farm.")
+    report_path = os.path.join(FOLDER, FORECAST_REPORT_NAME)
+
+    data_files = list_data_files(FOLDER)
+
+    # === Forecast computed locally for the herd and every cow; only rows
+    # appended since the last refresh are read ===
+    forecast = forecast_milk(refresh_state(FOLDER))
+    if forecast is None:
+        st.warning("No milk yield data with valid dates found for this farm.")
         st.stop()
+    herd = forecast["herd"]
+
+    st.subheader(f"📋 Milk Production up to {herd['last_date']}")
+    col1, col2, col3 = st.columns(3)
+    col1.metric("Average Daily Yield", f"{herd['avg_daily_yield']:.0f} L", f"{herd['avg_daily_yield_per_cow']:.1f} L per cow", delta_color="off")
+    col2.metric("Last 7 Days", f"{herd['last_7d_avg']:.0f} L/day", f"{herd['trend_l_per_day']:+.0f} L/day trend")
+    col3.metric("Cows with Production Drop", herd["cows_with_drop"])
+
+    st.markdown("### 📈 Herd Yield and 3-Day Forecast")
+    chart = pd.concat([forecast["history"], forecast["future"]]).set_index("date")
+    st.line_chart(chart[["herd_yield", "rolling_avg", "forecast"]])
+    st.dataframe(forecast["future"], hide_index=True)
+
+    cows = forecast["cows"]
+    st.markdown("### 🚨 Cows with Production Drops")
+    drops = cows[cows["production_drop"]].sort_values("change_pct")
+    if drops.empty:
+        st.success("No cows with a production drop in the last 7 days.")
+    else:
+        st.dataframe(drops, hide_index=True)
 
-    attachments = []
-    for path in data_files:
-        with open(path, "rb") as f:
-            uploaded = openai.files.create(file=f, purpose="assistants")
-            attachments.append({"file_id": uploaded.id, "tools": [{"type": "code_interpreter"}]})
-
-    prompt = """
-You are a dairy farm assistant. Based on the uploaded data files (milk yield, animals, treatments, etc.),
-analyze milk production trends. Return:
-- Average daily yield
-- Recent 7-day trend
-- Forecast for the next 3 days
-- Any risks or drops in production
-Respond in English. Do not use markdown.
-"""
-
-    thread = openai.beta.threads.create()
-    openai.beta.threads.messages.create(
-        thread_id=thread.id,
-        role="user",
-        content=prompt,
-        attachments=attachments
-    )
-    run = openai.beta.threads.runs.create(thread_id=thread.id, assistant_id=st.secrets["dairy_sustainability_agent"]["id"])
-
-    with st.spinner("🔍 Analyzing milk production trends..."):
-        while run.status not in ["completed", "failed"]:
-            time.sleep(2)
-            run = openai.beta.threads.runs.retrieve(run.id, thread_id=thread.id)
-
-    messages = openai.beta.threads.messages.list(thread_id=thread.id)
-    for msg in messages.data[::-1]:
-        if msg.role == "assistant":
-            st.subheader("📋 Milk Production Report")
-            response = msg.content[0].text.value.strip()
-            sections = response.split("\n")
-            for line in sections:
-                if ":" in line:
-                    key, value = line.split(":", 1)
-                    st.markdown(f"**{key.strip()}**: {value.strip()}")
-                else:
-                    st.write(line)
-            break
+    with st.expander("🐄 Forecast per Cow"):
+        st.dataframe(cows, hide_index=True)
+
+    # === Optional AI commentary, reused while the input files are unchanged ===
+    st.markdown("### 🤖 AI Commentary")
+    fingerprint = files_fingerprint(FOLDER, data_files)
+    saved = None
+    if os.path.exists(report_path):
+        saved = cached_json(report_path)
+
+    if st.button("🔄 Run Forecast Commentary"):
+        summary = dict(herd, dropping_cows=drops["cow_id"].head(20).tolist())
+        stages = {}
+        with st.spinner("🔍 Analyzing milk production trends..."):
+            try:
+                with timed(stages, "total"):
+                    prompt = FORECAST_PROMPT.format(forecast=json.dumps(summary, indent=2))
+                    response, run = ask_cached(FOLDER, prompt, [], agent_id, partial(ask_assistant_run, prompt, [], agent_id, stages=stages))
+            except (RunNotCompleted, CacheMiss, openai.APIError) as e:
+                record(FOLDER, "forecast", stages, getattr(e, "run", None), "failed")
+                st.error(f"❌ {e}")
+                st.stop()
+        record(FOLDER, "forecast", stages, run)
+        saved = {
+            "fingerprint": fingerprint,
+            "generated_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "report": response.strip(),
+        }
+        with open(report_path, "w", encoding="utf-8") as f:
+            json.dump(saved, f, indent=2, ensure_ascii=False)
+        st.success("✅ New commentary generated and saved.")
+
+    if saved:
+        for line in saved["report"].split("\n"):
+            if ":" in line:
+                key, value = line.split(":", 1)
+                st.markdown(f"**{key.strip()}**: {value.strip()}")
+            else:
+                st.write(line)
+
+        if saved.get("fingerprint") != fingerprint:
+            st.warning("⚠️ Farm data changed since this commentary was generated. Click above to refresh it.")
+        else:
+            st.info(f"📁 Loaded from saved commentary ({saved.get('generated_at', 'unknown time')}).")
+    else:
+        st.info("No saved commentary found. Click above to generate one.")
 
 elif view == "🥕 Feed Optimization":
     st.title("🥕 Feed Optimization for Herd Management")
 
     farm_name = st.session_state.get("farm_name")
     FOLDER = os.path.join("streamlet/farm_data", farm_name.replace(" ", "_"))
-    report_path = os.path.join(FOLDER, "feed_optimization_report.txt")
 
     if not os.path.exists(FOLDER):
         st.warning("Farm folder not found.")
@@ -279,106 +321,16 @@ elif view == "🥕 Feed Optimization":
     st.markdown("### 📋 Feed Optimization Report")
 
     # === Show saved report if exists ===
-    if os.path.exists(report_path):
-        with open(report_path, "r", encoding="utf-8") as f:
-            saved_report = f.read().replace("```markdown", "").replace("```", "").replace("undefined", "").strip()
-
-            # Rozdělit na sekce podle nadpisů
-            sections = saved_report.split("## ")
-            for section in sections:
-                if section.strip():
-                    lines = section.strip().split("\n")
-                    title = lines[0]
-                    content = "\n".join(lines[1:])
-                    with st.expander(title.strip(), expanded=True):
-                        st.markdown(content)
-        st.info("📁 Loaded from saved report.")
-    else:
-        st.info("No saved report found. Click below to generate a new one.")
+    show_saved_report(FOLDER, "feed")
 
-    # === Button to run analysis ===
+    # === Button to queue the analysis as a background job ===
+    show_job_status(FOLDER, "feed")
     if st.button("🔄 Run Feed Analysis"):
-        data_files = [
-            os.path.join(FOLDER, f)
-            for f in os.listdir(FOLDER)
-            if f.endswith(".csv") or f.endswith(".json")
-        ]
-
-        if not data_files:
+        if not list_data_files(FOLDER):
             st.warning("No data files found.")
             st.stop()
-
-        attachments = []
-        for path in data_files:
-            with open(path, "rb") as f:
-                uploaded = openai.files.create(file=f, purpose="assistants")
-                attachments.append({
-                    "file_id": uploaded.id,
-                    "tools": [{"type": "code_interpreter"}]
-                })
-
-        prompt = """
-You are a feed advisor for dairy cows.
-
-Use the following data files (milk yield, cow info, treatments, cost) to generate a clear, structured report.
-
-Return in plain Markdown (NO code blocks) and include only the following sections:
-
-## 🥛 Underperforming Cows
-- List cows with low milk yield and high lactation number.
-- Add concrete suggestions (e.g. energy supplements).
-
-## 🐘 Over-conditioned Cows
-- List cows with low output but high age/lactation and good health.
-- Suggest reducing feeding or changing rations.
-
-## 🧪 Feed Strategy Recommendations
-- Summary of changes (reduce/increase).
-- Suggestions on nutrient balancing.
-
-No introductions, no explanations. Respond only with the report in plain Markdown (no ```markdown).
-        """
-
-        thread = openai.beta.threads.create()
-        openai.beta.threads.messages.create(
-            thread_id=thread.id,
-            role="user",
-            content=prompt,
-            attachments=attachments
-        )
-
-        run = openai.beta.threads.runs.create(
-            thread_id=thread.id,
-            assistant_id=st.secrets["dairy_sustainability_agent"]["id"]
-        )
-
-        with st.spinner("🐄 Optimizing feeding strategy..."):
-            while run.status not in ["completed", "failed"]:
-                time.sleep(2)
-                run = openai.beta.threads.runs.retrieve(run.id, thread_id=thread.id)
-
-        messages = openai.beta.threads.messages.list(thread_id=thread.id)
-        for msg in messages.data[::-1]:
-            if msg.role == "assistant":
-                report = msg.content[0].text.value
-                report_clean = report.replace("```markdown", "").replace("```", "").replace("undefined", "").strip()
-
-                # Save report
-                with open(report_path, "w", encoding="utf-8") as f:
-                    f.write(report_clean)
-
-                # Show report nicely
-                sections = report_clean.split("## ")
-                for section in sections:
-                    if section.strip():
-                        lines = section.strip().split("\n")
-                        title = lines[0]
-                        content = "\n".join(lines[1:])
-                        with st.expander(title.strip(), expanded=True):
-                            st.markdown(content)
-
-                st.success("✅ New report generated and saved.")
-                break
+        submit_job(FOLDER, "feed", agent_id)
+        st.rerun()
 
     # Tlačítko "zpět nahoru"
     st.markdown("---")
@@ -389,7 +341,6 @@ elif view == "♻️ Biogas & Manure":
 
     farm_name = st.session_state.get("farm_name")
     FOLDER = os.path.join("streamlet/farm_data", farm_name.replace(" ", "_"))
-    report_path = os.path.join(FOLDER, "biogas_manure_report.txt")
 
     if not os.path.exists(FOLDER):
         st.warning("Farm folder not found.")
@@ -398,103 +349,16 @@ elif view == "♻️ Biogas & Manure":
     st.markdown("### 📋 Biogas & Manure Report")
 
     # === Show saved report if exists ===
-    if os.path.exists(report_path):
-        with open(report_path, "r", encoding="utf-8") as f:
-            saved_report = f.read().replace("```markdown", "").replace("```", "").replace("undefined", "").strip()
-
-            # Split into sections
-            sections = saved_report.split("## ")
-            for section in sections:
-                if section.strip():
-                    lines = section.strip().split("\n")
-                    title = lines[0]
-                    content = "\n".join(lines[1:])
-                    with st.expander(title.strip(), expanded=True):
-                        st.markdown(content)
-        st.info("📁 Loaded from saved report.")
-    else:
-        st.info("No saved report found. Click below to generate a new one.")
+    show_saved_report(FOLDER, "biogas")
 
-    # === Button to run analysis ===
+    # === Button to queue the analysis as a background job ===
+    show_job_status(FOLDER, "biogas")
     if st.button("🔄 Run Biogas Analysis"):
-        data_files = [
-            os.path.join(FOLDER, f)
-            for f in os.listdir(FOLDER)
-            if f.endswith(".csv") or f.endswith(".json")
-        ]
-
-        if not data_files:
+        if not list_data_files(FOLDER):
             st.warning("No data files found.")
             st.stop()
-
-        attachments = []
-        for path in data_files:
-            with open(path, "rb") as f:
-                uploaded = openai.files.create(file=f, purpose="assistants")
-                attachments.append({
-                    "file_id": uploaded.id,
-                    "tools": [{"type": "code_interpreter"}]
-                })
-
-        prompt = """
-You are an expert in farm waste management and renewable energy.
-
-Using the provided files (manure data, biogas capacity, cow excretion records), generate a structured Markdown report with the following:
-
-## 💩 Manure Production Overview
-- Estimate total manure output per day/month.
-- Identify which cow groups produce the most manure.
-
-## ⚡️ Biogas Capacity & Usage
-- Compare manure production with biogas plant capacity.
-- Identify if there's excess/insufficient manure for optimal biogas production.
-
-## 🔧 Recommendations
-- Suggest optimization of manure collection.
-- Recommend strategies for improving biogas conversion efficiency.
-- If applicable, suggest how to use excess manure (e.g., fertilizer, compost).
-
-Do NOT include any explanations. Respond only with the report. Do NOT use code blocks.
-        """
-
-        thread = openai.beta.threads.create()
-        openai.beta.threads.messages.create(
-            thread_id=thread.id,
-            role="user",
-            content=prompt,
-            attachments=attachments
-        )
-
-        run = openai.beta.threads.runs.create(
-            thread_id=thread.id,
-            assistant_id=st.secrets["dairy_sustainability_agent"]["id"]
-        )
-
-        with st.spinner("🥼 Generating biogas & manure strategy..."):
-            while run.status not in ["completed", "failed"]:
-                time.sleep(2)
-                run = openai.beta.threads.runs.retrieve(run.id, thread_id=thread.id)
-
-        messages = openai.beta.threads.messages.list(thread_id=thread.id)
-        for msg in messages.data[::-1]:
-            if msg.role == "assistant":
-                report = msg.content[0].text.value
-                report_clean = report.replace("```markdown", "").replace("```", "").replace("undefined", "").strip()
-
-                with open(report_path, "w", encoding="utf-8") as f:
-                    f.write(report_clean)
-
-                sections = report_clean.split("## ")
-                for section in sections:
-                    if section.strip():
-                        lines = section.strip().split("\n")
-                        title = lines[0]
-                        content = "\n".join(lines[1:])
-                        with st.expander(title.strip(), expanded=True):
-                            st.markdown(content)
-
-                st.success("✅ New report generated and saved.")
-                break
+        submit_job(FOLDER, "biogas", agent_id)
+        st.rerun()
 
     st.markdown("---")
     st.markdown("<a href='#top' style='font-size:20px;'>⬆️ Back to Top</a>", unsafe_allow_html=True)
@@ -504,7 +368,6 @@ elif view == "🌦️ Weather & Climate":
 
     farm_name = st.session_state.get("farm_name")
     FOLDER = os.path.join("streamlet/farm_data", farm_name.replace(" ", "_"))
-    report_path = os.path.join(FOLDER, "weather_climate_report.txt")
 
     if not os.path.exists(FOLDER):
         st.warning("Farm folder not found.")
@@ -512,99 +375,17 @@ elif view == "🌦️ Weather & Climate":
 
     st.markdown("### 📋 Weather & Climate Analysis Report")
 
-    if os.path.exists(report_path):
-        with open(report_path, "r", encoding="utf-8") as f:
-            saved_report = f.read().replace("```markdown", "").replace("```", "").replace("undefined", "").strip()
-            sections = saved_report.split("## ")
-            for section in sections:
-                if section.strip():
-                    lines = section.strip().split("\n")
-                    title = lines[0]
-                    content = "\n".join(lines[1:])
-                    with st.expander(title.strip(), expanded=True):
-                        st.markdown(content)
-        st.info("📁 Loaded from saved report.")
-    else:
-        st.info("No saved report found. Click below to generate a new one.")
+    # === Show saved report if exists ===
+    show_saved_report(FOLDER, "weather")
 
+    # === Button to queue the analysis as a background job ===
+    show_job_status(FOLDER, "weather")
     if st.button("🔄 Run Weather Analysis"):
-        data_files = [
-            os.path.join(FOLDER, f)
-            for f in os.listdir(FOLDER)
-            if f.endswith(".csv") or f.endswith(".json")
-        ]
-
-        if not data_files:
+        if not list_data_files(FOLDER):
             st.warning("No data files found.")
             st.stop()
-
-        attachments = []
-        for path in data_files:
-            with open(path, "rb") as f:
-                uploaded = openai.files.create(file=f, purpose="assistants")
-                attachments.append({
-                    "file_id": uploaded.id,
-                    "tools": [{"type": "code_interpreter"}]
-                })
-
-        prompt = """
-You are a weather and climate impact analyst for dairy farms.
-
-Based on the uploaded weather and farm data (precipitation, temperature, treatments, yield), generate a professional Markdown report with the following structure:
-
-## 🌫️ Climate Trends
-- Describe relevant patterns in temperature, precipitation or extreme events.
-- Note any seasonal or long-term trends.
-
-## 💧 Impact on Production
-- Highlight effects on milk yield or feed needs due to weather.
-- Mention possible droughts, heat stress, or wet conditions.
-
-## 🧠 Recommendations
-- Suggest actions like weather protection, irrigation, or ventilation.
-- Mention adaptation strategies for upcoming climate variability.
-
-Respond only in plain Markdown (NO code blocks).
-        """
-
-        thread = openai.beta.threads.create()
-        openai.beta.threads.messages.create(
-            thread_id=thread.id,
-            role="user",
-            content=prompt,
-            attachments=attachments
-        )
-
-        run = openai.beta.threads.runs.create(
-            thread_id=thread.id,
-            assistant_id=st.secrets["dairy_sustainability_agent"]["id"]
-        )
-
-        with st.spinner("🌬️ Analyzing climate impact..."):
-            while run.status not in ["completed", "failed"]:
-                time.sleep(2)
-                run = openai.beta.threads.runs.retrieve(run.id, thread_id=thread.id)
-
-        messages = openai.beta.threads.messages.list(thread_id=thread.id)
-        for msg in messages.data[::-1]:
-            if msg.role == "assistant":
-                report = msg.content[0].text.value
-                report_clean = report.replace("```markdown", "").replace("```", "").replace("undefined", "").strip()
-
-                with open(report_path, "w", encoding="utf-8") as f:
-                    f.write(report_clean)
-
-                sections = report_clean.split("## ")
-                for section in sections:
-                    if section.strip():
-                        lines = section.strip().split("\n")
-                        title = lines[0]
-                        content = "\n".join(lines[1:])
-                        with st.expander(title.strip(), expanded=True):
-                            st.markdown(content)
-
-                st.success("✅ New weather report generated and saved.")
-                break
+        submit_job(FOLDER, "weather", agent_id)
+        st.rerun()
 
     st.markdown("---")
     st.markdown("<a href='#top' style='font-size:20px;'>⬆️ Back to Top</a>", unsafe_allow_html=True)
@@ -614,7 +395,6 @@ elif view == "🩺 Health Monitoring":
 
     farm_name = st.session_state.get("farm_name")
     FOLDER = os.path.join("streamlet/farm_data", farm_name.replace(" ", "_"))
-    report_path = os.path.join(FOLDER, "health_monitoring_report.txt")
 
     if not os.path.exists(FOLDER):
         st.warning("Farm folder not found.")
@@ -623,103 +403,16 @@ elif view == "🩺 Health Monitoring":
     st.markdown("### 📋 Health Status Report")
 
     # === Show saved report if exists ===
-    if os.path.exists(report_path):
-        with open(report_path, "r", encoding="utf-8") as f:
-            saved_report = f.read().replace("```markdown", "").replace("```", "").replace("undefined", "").strip()
-            sections = saved_report.split("## ")
-            for section in sections:
-                if section.strip():
-                    lines = section.strip().split("\n")
-                    title = lines[0]
-                    content = "\n".join(lines[1:])
-                    with st.expander(title.strip(), expanded=True):
-                        st.markdown(content)
-        st.info("📁 Loaded from saved report.")
-    else:
-        st.info("No saved report found. Click below to generate a new one.")
+    show_saved_report(FOLDER, "health")
 
-    # === Button to run analysis ===
+    # === Button to queue the analysis as a background job ===
+    show_job_status(FOLDER, "health")
     if st.button("🔄 Run Health Analysis"):
-        data_files = [
-            os.path.join(FOLDER, f)
-            for f in os.listdir(FOLDER)
-            if f.endswith(".csv") or f.endswith(".json")
-        ]
-
-        if not data_files:
+        if not list_data_files(FOLDER):
             st.warning("No data files found.")
             st.stop()
-
-        attachments = []
-        for path in data_files:
-            with open(path, "rb") as f:
-                uploaded = openai.files.create(file=f, purpose="assistants")
-                attachments.append({
-                    "file_id": uploaded.id,
-                    "tools": [{"type": "code_interpreter"}]
-                })
-
-        prompt = """
-You are a veterinary health advisor for dairy farms.
-
-Using the provided data files (diagnoses, treatments, cow health, productivity), return a structured health status report.
-
-Return in plain Markdown (NO code blocks). Include exactly these sections:
-
-## 🧾 Key Health Metrics
-- Total number of treated cows
-- Average treatment duration
-- Most common diagnoses
-
-## 🚨 High-Risk Animals
-- List of animal IDs (or summaries) with repeated or severe diseases
-- Suggested monitoring or preventive measures
-
-## 💊 Recommendations
-- Preventive strategies to reduce illness rate
-- Suggestions for improving herd health management
-
-Do not add introductions or explanations. Return ONLY the report.
-        """
-
-        thread = openai.beta.threads.create()
-        openai.beta.threads.messages.create(
-            thread_id=thread.id,
-            role="user",
-            content=prompt,
-            attachments=attachments
-        )
-
-        run = openai.beta.threads.runs.create(
-            thread_id=thread.id,
-            assistant_id=st.secrets["dairy_sustainability_agent"]["id"]
-        )
-
-        with st.spinner("🩺 Analyzing herd health data..."):
-            while run.status not in ["completed", "failed"]:
-                time.sleep(2)
-                run = openai.beta.threads.runs.retrieve(run.id, thread_id=thread.id)
-
-        messages = openai.beta.threads.messages.list(thread_id=thread.id)
-        for msg in messages.data[::-1]:
-            if msg.role == "assistant":
-                report = msg.content[0].text.value
-                report_clean = report.replace("```markdown", "").replace("```", "").replace("undefined", "").strip()
-
-                with open(report_path, "w", encoding="utf-8") as f:
-                    f.write(report_clean)
-
-                sections = report_clean.split("## ")
-                for section in sections:
-                    if section.strip():
-                        lines = section.strip().split("\n")
-                        title = lines[0]
-                        content = "\n".join(lines[1:])
-                        with st.expander(title.strip(), expanded=True):
-                            st.markdown(content)
-
-                st.success("✅ New report generated and saved.")
-                break
+        submit_job(FOLDER, "health", agent_id)
+        st.rerun()
 
     # Back to top link
     st.markdown("---")
@@ -730,7 +423,6 @@ elif view == "🌍 Sustainability Dashboard":
 
     farm_name = st.session_state.get("farm_name")
     FOLDER = os.path.join("streamlet/farm_data", farm_name.replace(" ", "_"))
-    report_path = os.path.join(FOLDER, "sustainability_dashboard_report.txt")
 
     if not os.path.exists(FOLDER):
         st.warning("Farm folder not found.")
@@ -738,110 +430,79 @@ elif view == "🌍 Sustainability Dashboard":
 
     st.markdown("### 📋 Sustainability Report")
 
-    # === Show saved report if it exists ===
-    if os.path.exists(report_path):
-        with open(report_path, "r", encoding="utf-8") as f:
-            saved_report = f.read().replace("```markdown", "").replace("```", "").replace("undefined", "").strip()
-            sections = saved_report.split("## ")
-            for section in sections:
-                if section.strip():
-                    lines = section.strip().split("\n")
-                    title = lines[0]
-                    content = "\n".join(lines[1:])
-                    with st.expander(title.strip(), expanded=True):
-                        st.markdown(content)
-        st.info("📁 Loaded from saved report.")
-    else:
-        st.info("No saved report found. Click below to generate a new one.")
+    # === Show saved report if exists ===
+    show_saved_report(FOLDER, "dashboard")
 
-    # === Button to run analysis ===
+    # === Button to queue the analysis as a background job ===
+    show_job_status(FOLDER, "dashboard")
     if st.button("🔄 Run Sustainability Analysis"):
-        data_files = [
-            os.path.join(FOLDER, f)
-            for f in os.listdir(FOLDER)
-            if f.endswith(".csv") or f.endswith(".json")
-        ]
+        if not list_data_files(FOLDER):
+            st.warning("No data files found.")
+            st.stop()
+        submit_job(FOLDER, "dashboard", agent_id)
+        st.rerun()
+
+    # Back to top link
+    st.markdown("---")
+    st.markdown("<a href='#top' style='font-size:20px;'>⬆️ Back to Top</a>", unsafe_allow_html=True)
 
-        if not data_files:
+elif view == "🚀 Run All Reports":
+    st.title("🚀 Run All Reports")
+    st.markdown("Uploads the farm files once and refreshes all reports at the same time.")
+
+    # === Status of each report in the latest run ===
+    for report_key in ALL_REPORTS:
+        st.markdown(f"#### {REPORTS[report_key]['title']}")
+        if show_job_status(FOLDER, report_key) is None:
+            st.caption("Never run.")
+
+    # === Wall-clock time of the last finished batch ===
+    jobs = list_jobs(FOLDER)
+    batch_id = next((job["batch"] for job in reversed(jobs) if job.get("batch")), None)
+    batch_jobs = [job for job in jobs if batch_id and job.get("batch") == batch_id]
+    if batch_jobs and all(job["status"] not in ACTIVE_STATUSES for job in batch_jobs):
+        started = min(time.mktime(time.strptime(job["created_at"], "%Y-%m-%d %H:%M:%S")) for job in batch_jobs)
+        finished = max(time.mktime(time.strptime(job["finished_at"], "%Y-%m-%d %H:%M:%S")) for job in batch_jobs)
+        st.metric("⏱️ Last batch wall-clock time", f"{finished - started:.0f} s")
+
+    if st.button("🚀 Run All Reports"):
+        if not list_data_files(FOLDER):
             st.warning("No data files found.")
             st.stop()
+        submit_all_jobs(FOLDER, agent_id)
+        st.rerun()
+
+    st.markdown("---")
+    st.markdown("<a href='#top' style='font-size:20px;'>⬆️ Back to Top</a>", unsafe_allow_html=True)
 
-        attachments = []
-        for path in data_files:
-            with open(path, "rb") as f:
-                uploaded = openai.files.create(file=f, purpose="assistants")
-                attachments.append({
-                    "file_id": uploaded.id,
-                    "tools": [{"type": "code_interpreter"}]
-                })
-
-        prompt = """
-You are a sustainability advisor for dairy farms.
-
-Using the provided farm data (economy, health, environment), return a structured sustainability dashboard.
-
-Return in plain Markdown (NO code blocks). Include exactly the following sections:
-
-## 💰 Economic Overview
-- Monthly milk income
-- Total treatment and feed costs
-- Profit or loss summary
-
-## 🐄 Animal Health Status
-- % of treated cows
-- Average duration of treatments
-- Risk profile of the herd
-
-## 🌱 Environmental Metrics
-- Antibiotic usage (if data available)
-- Manure production (estimates if needed)
-- Any sustainability concerns
-
-## ✅ Recommendations
-- Actionable suggestions to improve sustainability in each area
-
-Do NOT explain what you're doing. Return ONLY the formatted report.
-        """
-
-        thread = openai.beta.threads.create()
-        openai.beta.threads.messages.create(
-            thread_id=thread.id,
-            role="user",
-            content=prompt,
-            attachments=attachments
-        )
-
-        run = openai.beta.threads.runs.create(
-            thread_id=thread.id,
-            assistant_id=st.secrets["dairy_sustainability_agent"]["id"]
-        )
-
-        with st.spinner("🌍 Generating sustainability dashboard..."):
-            while run.status not in ["completed", "failed"]:
-                time.sleep(2)
-                run = openai.beta.threads.runs.retrieve(run.id, thread_id=thread.id)
-
-        messages = openai.beta.threads.messages.list(thread_id=thread.id)
-        for msg in messages.data[::-1]:
-            if msg.role == "assistant":
-                report = msg.content[0].text.value
-                report_clean = report.replace("```markdown", "").replace("```", "").replace("undefined", "").strip()
-
-                with open(report_path, "w", encoding="utf-8") as f:
-                    f.write(report_clean)
-
-                sections = report_clean.split("## ")
-                for section in sections:
-                    if section.strip():
-                        lines = section.strip().split("\n")
-                        title = lines[0]
-                        content = "\n".join(lines[1:])
-                        with st.expander(title.strip(), expanded=True):
-                            st.markdown(content)
-
-                st.success("✅ New report generated and saved.")
-                break
+elif view == "⏱️ Analysis Metrics":
+    st.title("⏱️ Analysis Latency and Cost")
+    st.markdown("Time per stage, token usage and estimated cost of every AI analysis run for this farm.")
+
+    metrics = load_metrics(FOLDER)
+    summary = latency_summary(metrics)
+    if summary is None:
+        st.info("No analyses recorded yet. Run a report to collect metrics.")
+        st.stop()
+
+    # === p50/p95 per stage and cost per analysis type ===
+    st.dataframe(summary, hide_index=True)
+
+    # === Over time ===
+    st.markdown("### 📈 Total latency per day")
+    col1, col2 = st.columns(2)
+    col1.caption("p50 (s)")
+    col1.line_chart(daily_trend(metrics, "total", 0.5))
+    col2.caption("p95 (s)")
+    col2.line_chart(daily_trend(metrics, "total", 0.95))
+
+    cost = daily_trend(metrics, "cost_usd")
+    if cost is not None:
+        st.markdown("### 💵 Estimated cost per day (USD)")
+        st.bar_chart(cost)
+
+    with st.expander("🧾 All recorded runs"):
+        st.dataframe(metrics.sort_values("at", ascending=False), hide_index=True)
 
-    # Back to top link
     st.markdown("---")
     st.markdown("<a href='#top' style='font-size:20px;'>⬆️ Back to Top</a>", unsafe_allow_html=True)
@@ -0,0 +1,135 @@
+import hashlib
+import json
+import os
+import time
+
+import openai
+
+from farm_cache import cached_json
+from openai_client import create_assistant, delete_assistant, list_assistants, retrieve_assistant, update_assistant
+
+# === Assistant definition and local registry ===
+# create-agent.py provisions the assistant from ASSISTANT_SPEC: an existing
+# assistant (the registered one, else one with the same name) is updated in
+# place when the spec changed, and only created when none exists. The spec
+# hash is kept in the assistant's metadata and, with its id, in AGENT_FILE,
+# which the app and the CLIs read without any network lookup.
+AGENT_FILE = "dairy_sustainability_agent.json"
+
+ASSISTANT_SPEC = {
+    "name": "DairySustainabilityAgent",
+    "instructions": """
+You are a dairy sustainability AI analyst.
+
+You receive multiple CSV files related to:
+- milk yield
+- treatment and medicine usage
+- cow data (birth, sickness, reproduction)
+- general farm performance
+
+Your job:
+1. Load and understand all uploaded CSV files.
+2. Identify indicators across 3 areas:
+   - ECONOMIC: total milk income, treatment costs, monthly profit/loss.
+   - ENVIRONMENTAL: antibiotic usage frequency, treatment intensity.
+   - ANIMAL WELFARE: % of sick cows, avg treatment duration, high-risk animals.
+
+Respond only in this format:
+{
+  "summary": "...",
+  "sustainability": {
+    "economic": { ... },
+    "environmental": { ... },
+    "animal_welfare": { ... }
+  },
+  "recommendations": ["...", "..."]
+}
+Do NOT refer to other agents. Perform all calculations yourself.
+""",
+    "model": "gpt-4o",
+    "tools": [{"type": "code_interpreter"}],
+}
+
+
+def spec_hash(spec=ASSISTANT_SPEC):
+    return hashlib.sha256(json.dumps(spec, sort_keys=True).encode()).hexdigest()
+
+
+def load_registry(path=AGENT_FILE):
+    if not os.path.exists(path):
+        return {}
+    try:
+        return cached_json(path)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_registry(entry, path=AGENT_FILE):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(entry, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def registered_assistant_id(path=AGENT_FILE):
+    # Local file only; None when create-agent.py has not been run here
+    return load_registry(path).get("id")
+
+
+def registry_is_stale(path=AGENT_FILE, spec=ASSISTANT_SPEC):
+    # The registered assistant was provisioned from an older spec
+    entry = load_registry(path)
+    return bool(entry) and entry.get("spec_sha256") != spec_hash(spec)
+
+
+def _spec_of(assistant):
+    return (assistant.metadata or {}).get("spec_sha256")
+
+
+def provision(spec=ASSISTANT_SPEC, prune=False, path=AGENT_FILE):
+    # -> (registry entry, "created"|"updated"|"unchanged", ids of deleted
+    # duplicates). prune deletes the other assistants with the same name.
+    digest = spec_hash(spec)
+    assistant = None
+    registered = registered_assistant_id(path)
+    if registered:
+        try:
+            assistant = retrieve_assistant(registered)
+        except openai.NotFoundError:
+            assistant = None
+
+    same_name = []
+    if assistant is None or prune:
+        same_name = [a for a in list_assistants() if a.name == spec["name"]]
+    if assistant is None and same_name:
+        # Prefer one already built from this spec, else the newest
+        same_name.sort(key=lambda a: (_spec_of(a) == digest, a.created_at), reverse=True)
+        assistant = same_name[0]
+
+    metadata = {"spec_sha256": digest}
+    if assistant is None:
+        assistant, action = create_assistant(**spec, metadata=metadata), "created"
+    elif _spec_of(assistant) != digest:
+        assistant, action = update_assistant(assistant.id, **spec, metadata=metadata), "updated"
+    else:
+        action = "unchanged"
+
+    pruned = []
+    if prune:
+        for other in same_name:
+            if other.id != assistant.id:
+                delete_assistant(other.id)
+                pruned.append(other.id)
+
+    entry = load_registry(path)
+    if action == "unchanged" and entry.get("id") == assistant.id and entry.get("spec_sha256") == digest:
+        return entry, action, pruned
+    entry = {
+        "id": assistant.id,
+        "name": spec["name"],
+        "model": spec["model"],
+        "spec_sha256": digest,
+        "provisioned_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+    }
+    save_registry(entry, path)
+    return entry, action, pruned
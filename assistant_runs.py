@@ -0,0 +1,170 @@
+import asyncio
+import time
+
+import openai
+
+from farm_metrics import timed
+from openai_async import cancel_run, create_message, create_run, create_thread, list_messages, list_runs, retrieve_run, run_sync
+
+# === Waiting for assistant runs ===
+# Runs are streamed so completion is noticed as soon as the server emits it.
+# If streaming is unavailable or the stream drops, the run is polled with an
+# adaptive backoff instead of a fixed sleep. Everything runs as coroutines on
+# the shared event loop (openai_async.py); the sync functions at the end
+# wait for them from a script or worker thread.
+
+# requires_action is final for us: the assistant has no function tools to answer it
+TERMINAL_STATUSES = {"completed", "failed", "cancelled", "expired", "incomplete", "requires_action"}
+
+DEFAULT_TIMEOUT = 600  # seconds
+MIN_POLL_INTERVAL = 0.25
+MAX_POLL_INTERVAL = 3.0
+POLL_BACKOFF = 1.5
+
+
+class RunNotCompleted(Exception):
+    def __init__(self, run):
+        message = f"Assistant run ended with status `{run.status}`."
+        if getattr(run, "last_error", None):
+            message += f" {run.last_error.message}"
+        super().__init__(message)
+        self.run = run
+
+
+async def _cancel(thread_id, run):
+    try:
+        return await cancel_run(thread_id, run.id)
+    except openai.APIError:
+        return run
+
+
+def _should_stop(deadline, cancel_event):
+    return time.monotonic() >= deadline or (cancel_event is not None and cancel_event.is_set())
+
+
+async def wait_for_run_async(thread_id, run, timeout=DEFAULT_TIMEOUT, cancel_event=None, deadline=None):
+    if deadline is None:
+        deadline = time.monotonic() + timeout
+    delay = MIN_POLL_INTERVAL
+
+    while run.status not in TERMINAL_STATUSES:
+        if _should_stop(deadline, cancel_event):
+            return await _cancel(thread_id, run)
+        await asyncio.sleep(max(0.0, min(delay, deadline - time.monotonic())))
+        delay = min(delay * POLL_BACKOFF, MAX_POLL_INTERVAL)
+        run = await retrieve_run(thread_id, run.id)
+    return run
+
+
+async def _stream_run(thread_id, assistant_id, deadline, cancel_event, seen, params):
+    # Records every run object in seen["run"] so the caller can keep polling
+    # it if the stream drops; the last one may still be non-terminal. The
+    # stream can be silent for long, so the timeout and cancel_event are
+    # checked alongside it.
+    async def consume():
+        remaining = max(1.0, deadline - time.monotonic())
+        async with await create_run(thread_id, assistant_id, stream=True, timeout=remaining, **params) as events:
+            async for event in events:
+                if event.event.startswith("thread.run.") and not event.event.startswith("thread.run.step"):
+                    seen["run"] = event.data
+                    if event.data.status in TERMINAL_STATUSES:
+                        return
+
+    task = asyncio.ensure_future(consume())
+    try:
+        while not task.done():
+            await asyncio.wait({task}, timeout=MIN_POLL_INTERVAL)
+            if not task.done() and "run" in seen and _should_stop(deadline, cancel_event):
+                task.cancel()
+                await asyncio.wait({task})
+    finally:
+        # Also when this coroutine itself is cancelled
+        if not task.done():
+            task.cancel()
+    if not task.cancelled():
+        task.result()
+
+
+async def _created_run(thread_id, since):
+    # The run a failed create may still have started: the thread's latest
+    # run, if it is active (a thread runs one at a time) or newer than since
+    runs = await list_runs(thread_id, limit=1)
+    run = runs.data[0] if runs.data else None
+    if run is not None and (run.status not in TERMINAL_STATUSES or run.created_at >= since):
+        return run
+    return None
+
+
+async def start_run_async(thread_id, assistant_id, timeout=DEFAULT_TIMEOUT, cancel_event=None, stream=True, **params):
+    # Creates a run and waits until it reaches a terminal status, the timeout
+    # passes or cancel_event is set. Timed out / cancelled runs are cancelled
+    # remotely. Returns the final run object; callers check run.status.
+    # params go to runs.create (e.g. truncation_strategy).
+    deadline = time.monotonic() + timeout
+    started_at = int(time.time())
+    seen = {}
+    try:
+        if stream:
+            try:
+                await _stream_run(thread_id, assistant_id, deadline, cancel_event, seen, params)
+            except openai.APIConnectionError:
+                # Stream dropped or not supported: fall back to polling below.
+                # Without any event the POST may still have created the run;
+                # a second create would fail or start a duplicate.
+                if "run" not in seen:
+                    run = await _created_run(thread_id, started_at)
+                    if run is not None:
+                        seen["run"] = run
+
+        if "run" not in seen:
+            seen["run"] = await create_run(thread_id, assistant_id, **params)
+        return await wait_for_run_async(thread_id, seen["run"], cancel_event=cancel_event, deadline=deadline)
+    except BaseException:
+        # Task cancelled (script stopped) or crashed while waiting: don't
+        # leave the run going
+        run = seen.get("run")
+        if run is not None and run.status not in TERMINAL_STATUSES:
+            await _cancel(thread_id, run)
+        raise
+
+
+async def last_assistant_text_async(thread_id, run_id=None):
+    # Latest assistant message of the run, i.e. its final answer
+    messages = await list_messages(thread_id, run_id=run_id, order="desc")
+    for msg in messages.data:
+        if msg.role == "assistant":
+            for part in msg.content:
+                if part.type == "text":
+                    return part.text.value
+    return ""
+
+
+async def ask_assistant_run_async(prompt, attachments, assistant_id, timeout=DEFAULT_TIMEOUT, cancel_event=None, stages=None):
+    # thread -> message -> run -> (answer, run); raises RunNotCompleted.
+    # Time per stage is added to stages (farm_metrics.py).
+    with timed(stages, "setup"):
+        thread = await create_thread()
+        await create_message(thread.id, prompt, attachments)
+    with timed(stages, "run"):
+        run = await start_run_async(thread.id, assistant_id, timeout=timeout, cancel_event=cancel_event)
+    if run.status != "completed":
+        raise RunNotCompleted(run)
+    with timed(stages, "fetch"):
+        return await last_assistant_text_async(thread.id, run.id), run
+
+
+# --- Sync bridges for Streamlit scripts and CLIs ---
+def start_run(thread_id, assistant_id, timeout=DEFAULT_TIMEOUT, cancel_event=None, stream=True, **params):
+    return run_sync(start_run_async(thread_id, assistant_id, timeout=timeout, cancel_event=cancel_event, stream=stream, **params))
+
+
+def last_assistant_text(thread_id, run_id=None):
+    return run_sync(last_assistant_text_async(thread_id, run_id))
+
+
+def ask_assistant_run(prompt, attachments, assistant_id, timeout=DEFAULT_TIMEOUT, cancel_event=None, stages=None):
+    return run_sync(ask_assistant_run_async(prompt, attachments, assistant_id, timeout=timeout, cancel_event=cancel_event, stages=stages))
+
+
+def ask_assistant(prompt, attachments, assistant_id, timeout=DEFAULT_TIMEOUT, cancel_event=None, stages=None):
+    return ask_assistant_run(prompt, attachments, assistant_id, timeout=timeout, cancel_event=cancel_event, stages=stages)[0]
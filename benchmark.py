@@ -0,0 +1,178 @@
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+import urllib.request
+
+import openai
+
+import fake_openai
+from assistant_registry import provision
+from assistant_runs import ask_assistant_run
+from farm_context import run_prompt
+from farm_generator import generate_farm
+from farm_state import refresh_state
+from job_queue import ACTIVE_STATUSES, list_jobs, submit_all_jobs, submit_job
+from milk_forecast import forecast_milk
+from reports import FORECAST_PROMPT
+from sustainability_kpis import write_sustainability_report
+from upload_cache import list_data_files
+
+# === Offline benchmark of the analysis paths ===
+# Runs every view's analysis end to end against the local stand-in API
+# (fake_openai.py) on synthetic farms (farm_generator.py) of increasing
+# size. Per view it records wall-clock latency, uploaded bytes and API
+# calls, and saves the results to benchmarks/<time>-<commit>.json for
+# comparison across commits:
+#
+#   python benchmark.py --sizes 50x90 400x365
+#   python benchmark.py --compare benchmarks/20250101-120000-abc1234.json
+RESULTS_FOLDER = "benchmarks"
+DEFAULT_SIZES = ["50x90", "200x365", "800x730"]  # cows x days
+VIEWS = ["sustainability", "forecast", "feed", "biogas", "weather", "health", "dashboard", "run_all", "profile"]
+JOB_POLL_SECONDS = 0.05
+
+PROFILE_PROMPT = "Based on the uploaded farm CSVs, generate a farm profile as JSON with location, farm_size_ha, num_animals and owner."
+
+
+# === Analysis paths, as the views run them ===
+def _wait_jobs(folder, job_ids):
+    while True:
+        jobs = [job for job in list_jobs(folder) if job["id"] in job_ids]
+        if all(job["status"] not in ACTIVE_STATUSES for job in jobs):
+            failed = [f"{job['report']}: {job['error']}" for job in jobs if job["status"] != "done"]
+            if failed:
+                raise RuntimeError("; ".join(failed))
+            return
+        time.sleep(JOB_POLL_SECONDS)
+
+
+def run_view(folder, view, assistant_id):
+    if view == "sustainability":
+        write_sustainability_report(folder)
+        _wait_jobs(folder, {submit_job(folder, "sustainability", assistant_id)["id"]})
+    elif view == "forecast":
+        forecast = forecast_milk(refresh_state(folder))
+        cows = forecast["cows"]
+        drops = cows[cows["production_drop"]].sort_values("change_pct")
+        summary = dict(forecast["herd"], dropping_cows=drops["cow_id"].head(20).tolist())
+        ask_assistant_run(FORECAST_PROMPT.format(forecast=json.dumps(summary, indent=2)), [], assistant_id)
+    elif view == "run_all":
+        batch_id = submit_all_jobs(folder, assistant_id)
+        _wait_jobs(folder, {job["id"] for job in list_jobs(folder) if job.get("batch") == batch_id})
+    elif view == "profile":
+        paths = [p for p in list_data_files(folder) if p.endswith(".csv")]
+        run_prompt(folder, PROFILE_PROMPT, paths, assistant_id)
+    else:
+        _wait_jobs(folder, {submit_job(folder, view, assistant_id)["id"]})
+
+
+# === Harness ===
+def _server_stats(base_url, reset=False):
+    root = base_url.rstrip("/").rsplit("/v1", 1)[0]
+    request = urllib.request.Request(f"{root}/_reset" if reset else f"{root}/_stats", method="POST" if reset else "GET")
+    with urllib.request.urlopen(request) as response:
+        return json.load(response)
+
+
+def git_commit():
+    try:
+        repo = os.path.dirname(os.path.abspath(__file__))
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=repo, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def run_benchmark(sizes, views=VIEWS, passes=2, run_seconds=0.5, run_seconds_per_mb=0.5, keep=False):
+    # -> list of result rows; pass 1 starts from an empty farm folder, later
+    # passes show what the upload and state caches save
+    server, base_url = fake_openai.serve(run_seconds=run_seconds, run_seconds_per_mb=run_seconds_per_mb)
+    openai.base_url, openai.api_key = base_url, "sk-benchmark"
+    base = tempfile.mkdtemp(prefix="dairy-bench-")
+    rows = []
+    try:
+        assistant_id = provision(path=os.path.join(base, "agent.json"))[0]["id"]
+        for size in sizes:
+            cows, days = (int(x) for x in size.split("x"))
+            folder = os.path.join(base, f"farm_{size}")
+            generate_farm(folder, cows, days)
+            data_bytes = sum(os.path.getsize(p) for p in list_data_files(folder))
+            for pass_no in range(1, passes + 1):
+                for view in views:
+                    _server_stats(base_url, reset=True)
+                    started = time.monotonic()
+                    error = None
+                    try:
+                        run_view(folder, view, assistant_id)
+                    except Exception as e:
+                        error = str(e)
+                    latency = time.monotonic() - started
+                    stats = _server_stats(base_url)
+                    row = {
+                        "size": size, "cows": cows, "days": days, "data_bytes": data_bytes,
+                        "view": view, "pass": pass_no, "latency_s": round(latency, 3),
+                        "upload_bytes": stats["upload_bytes"], "api_calls": sum(stats["calls"].values()),
+                        "runs": stats["runs"], "calls": stats["calls"], "error": error,
+                    }
+                    rows.append(row)
+                    print(f"{size:>10} {view:<15} pass {pass_no}: {latency:6.2f} s, "
+                          f"{row['upload_bytes'] / 1024:8.0f} KB up, {row['api_calls']:3d} calls" + (f"  ❌ {error}" if error else ""), flush=True)
+    finally:
+        server.shutdown()
+        if not keep:
+            shutil.rmtree(base, ignore_errors=True)
+    return rows
+
+
+def save_results(rows, config, folder=RESULTS_FOLDER):
+    os.makedirs(folder, exist_ok=True)
+    commit = git_commit()
+    path = os.path.join(folder, f"{time.strftime('%Y%m%d-%H%M%S')}-{commit}.json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"commit": commit, "created_at": time.strftime("%Y-%m-%d %H:%M:%S"), "config": config, "results": rows}, f, indent=2)
+    return path
+
+
+def compare(rows, baseline_path):
+    # Latency, upload and call deltas against an earlier results file
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = json.load(f)
+    old = {(r["size"], r["view"], r["pass"]): r for r in baseline["results"]}
+    print(f"\nCompared with {baseline['commit']} ({baseline['created_at']}):")
+    for row in rows:
+        before = old.get((row["size"], row["view"], row["pass"]))
+        if before is None:
+            continue
+        change = (row["latency_s"] - before["latency_s"]) / before["latency_s"] * 100 if before["latency_s"] else 0.0
+        print(f"{row['size']:>10} {row['view']:<15} pass {row['pass']}: "
+              f"{before['latency_s']:6.2f} -> {row['latency_s']:6.2f} s ({change:+.0f} %), "
+              f"upload {before['upload_bytes'] / 1024:.0f} -> {row['upload_bytes'] / 1024:.0f} KB, "
+              f"calls {before['api_calls']} -> {row['api_calls']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the analysis paths against a local stand-in API.")
+    parser.add_argument("--sizes", nargs="+", default=DEFAULT_SIZES, help="farm sizes as COWSxDAYS")
+    parser.add_argument("--views", nargs="+", choices=VIEWS, default=VIEWS)
+    parser.add_argument("--passes", type=int, default=2)
+    parser.add_argument("--run-seconds", type=float, default=0.5, help="simulated run time")
+    parser.add_argument("--run-seconds-per-mb", type=float, default=0.5, help="extra run time per MB of attached files")
+    parser.add_argument("--compare", help="earlier results file to compare with")
+    parser.add_argument("--keep", action="store_true", help="keep the generated farm folders")
+    parser.add_argument("--response-cache", choices=["on", "off"], default="off",
+                        help="replay recorded answers (off measures every run against the API)")
+    args = parser.parse_args()
+
+    os.environ["RESPONSE_CACHE"] = args.response_cache
+    config = {k: getattr(args, k) for k in ("sizes", "views", "passes", "run_seconds", "run_seconds_per_mb", "response_cache")}
+    rows = run_benchmark(args.sizes, args.views, args.passes, args.run_seconds, args.run_seconds_per_mb, args.keep)
+    print(f"\nSaved to {save_results(rows, config)}")
+    if args.compare:
+        compare(rows, args.compare)
+
+
+if __name__ == "__main__":
+    main()
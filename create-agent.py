@@ -1,49 +1,22 @@
+import argparse
+
 import streamlit as st
 import openai
-import pandas as pd
-import os
-import json
-import time
-import re
-
-openai.api_key = st.secrets["OPENAI_API_KEY"]
 
-assistant = openai.beta.assistants.create(
-    name="DairySustainabilityAgent",
-    instructions="""
-You are a dairy sustainability AI analyst.
+from assistant_registry import AGENT_FILE, provision
 
-You receive multiple CSV files related to:
-- milk yield
-- treatment and medicine usage
-- cow data (birth, sickness, reproduction)
-- general farm performance
+# === Create or update the DairySustainabilityAgent ===
+# Safe to run on every deploy: an existing assistant is reused and updated in
+# place, and its id is written to the registry the app reads at startup.
+parser = argparse.ArgumentParser(description="Provision the DairySustainabilityAgent assistant.")
+parser.add_argument("--prune", action="store_true", help="delete other assistants with the same name")
+args = parser.parse_args()
 
-Your job:
-1. Load and understand all uploaded CSV files.
-2. Identify indicators across 3 areas:
-   - ECONOMIC: total milk income, treatment costs, monthly profit/loss.
-   - ENVIRONMENTAL: antibiotic usage frequency, treatment intensity.
-   - ANIMAL WELFARE: % of sick cows, avg treatment duration, high-risk animals.
-
-Respond only in this format:
-{
-  "summary": "...",
-  "sustainability": {
-    "economic": { ... },
-    "environmental": { ... },
-    "animal_welfare": { ... }
-  },
-  "recommendations": ["...", "..."]
-}
-Do NOT refer to other agents. Perform all calculations yourself.
-""",
-    model="gpt-4o",
-    tools=[{"type": "code_interpreter"}]
-)
+openai.api_key = st.secrets["OPENAI_API_KEY"]
 
-# Ulož ID agenta
-with open("dairy_sustainability_agent.json", "w") as f:
-    json.dump({"id": assistant.id}, f)
+entry, action, pruned = provision(prune=args.prune)
 
-print("✅ Created agent:", assistant.id)
+for assistant_id in pruned:
+    print("🗑️ Deleted duplicate agent:", assistant_id)
+icon = {"created": "✅ Created", "updated": "🔄 Updated", "unchanged": "✔️ Unchanged"}[action]
+print(f"{icon} agent: {entry['id']} (registry: {AGENT_FILE})")
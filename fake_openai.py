@@ -0,0 +1,347 @@
+import argparse
+import itertools
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+# === Local stand-in for the OpenAI Files/Threads/Runs/Messages API ===
+# Answers the endpoints the app uses with a fixed latency and canned
+# answers, so benchmark.py can measure the app without API costs or remote
+# queue times. Runs last RUN_SECONDS plus RUN_SECONDS_PER_MB for every MB of
+# files attached to the thread and message, like the code interpreter
+# loading them. GET /_stats returns the call counts and uploaded bytes,
+# POST /_reset clears them.
+#
+#   python fake_openai.py --port 8765
+#   OPENAI_BASE_URL=http://127.0.0.1:8765/v1 streamlit run app.py
+
+# Seconds added to every request of an endpoint group
+LATENCY = {"files": 0.2, "threads": 0.05, "messages": 0.05, "runs": 0.05, "assistants": 0.05}
+RUN_SECONDS = 2.0
+RUN_SECONDS_PER_MB = 1.0
+MODEL = "gpt-4o"
+
+# (regex on the prompt, answer); the first match wins
+CANNED_ANSWERS = [
+    (r"farm profile", '{"location": "Benchmark Farm, Czech Republic", "farm_size_ha": 250.0, "num_animals": 180, "owner": "Benchmark"}'),
+    (r"valid JSON", '{"summary": "Stable herd with moderate treatment costs.", "recommendations": ["Review feed costs", "Monitor antibiotic use", "Track high-risk cows"]}'),
+    (r"Do not use markdown", "Average daily yield: stable\nRecent 7-day trend: flat\nForecast for the next 3 days: unchanged\nRisks: none detected"),
+    (r".", "## 📊 Overview\n- Herd performance is stable.\n\n## ⚠️ Risks\n- No critical issues found.\n\n## 💡 Recommendations\n- Keep monitoring the herd."),
+]
+
+
+class FakeOpenAI:
+    # In-memory state of the stand-in; all methods are called under _lock
+    def __init__(self, latency=None, run_seconds=RUN_SECONDS, run_seconds_per_mb=RUN_SECONDS_PER_MB, answers=CANNED_ANSWERS):
+        self.latency = dict(LATENCY, **(latency or {}))
+        self.run_seconds = run_seconds
+        self.run_seconds_per_mb = run_seconds_per_mb
+        self.answers = answers
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self.files, self.threads, self.messages, self.runs, self.assistants = {}, {}, {}, {}, {}
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.stats = {"calls": {}, "upload_bytes": 0, "runs": 0}
+
+    def new_id(self, prefix):
+        return f"{prefix}_{next(self._ids):06d}"
+
+    def count(self, endpoint):
+        self.stats["calls"][endpoint] = self.stats["calls"].get(endpoint, 0) + 1
+
+    def answer_for(self, prompt):
+        return next(text for pattern, text in self.answers if re.search(pattern, prompt))
+
+    def attached_bytes(self, thread_id):
+        file_ids = set(self.threads[thread_id].get("file_ids", []))
+        for message in self.messages[thread_id]:
+            file_ids.update(a["file_id"] for a in message.get("attachments") or [])
+        return sum(self.files[f]["bytes"] for f in file_ids if f in self.files)
+
+    def run_object(self, run):
+        # Runs finish lazily: the answer is added once their time has passed
+        if run["status"] in ("queued", "in_progress") and time.time() >= run["finish_at"]:
+            run["status"] = "completed"
+            run["completed_at"] = int(time.time())
+            self.messages[run["thread_id"]].append(self.message(run["thread_id"], "assistant", run["answer"], run_id=run["id"]))
+        elif run["status"] == "queued":
+            run["status"] = "in_progress"
+        body = {k: v for k, v in run.items() if k not in ("finish_at", "answer")}
+        body["usage"] = {"prompt_tokens": run["prompt_tokens"], "completion_tokens": run["completion_tokens"],
+                         "total_tokens": run["prompt_tokens"] + run["completion_tokens"]} if run["status"] == "completed" else None
+        return body
+
+    def message(self, thread_id, role, text, attachments=None, run_id=None):
+        return {
+            "id": self.new_id("msg"), "object": "thread.message", "created_at": int(time.time()),
+            "thread_id": thread_id, "role": role, "run_id": run_id, "attachments": attachments or [],
+            "content": [{"type": "text", "text": {"value": text, "annotations": []}}],
+            "assistant_id": None, "metadata": {}, "status": "completed",
+        }
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    fake = None  # set by serve()
+
+    def log_message(self, *args):
+        pass
+
+    # --- plumbing ---
+    def _body(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        return self.rfile.read(length) if length else b""
+
+    def _send(self, payload, status=200):
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _not_found(self, what):
+        self._send({"error": {"message": f"No {what} found.", "type": "invalid_request_error", "code": None}}, 404)
+
+    def _route(self, method):
+        url = urlparse(self.path)
+        parts = [p for p in url.path.split("/") if p]
+        if parts[:1] == ["v1"]:
+            parts = parts[1:]
+        query = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        body = self._body()
+        if parts and not parts[0].startswith("_"):
+            group = "messages" if "messages" in parts else "runs" if "runs" in parts else parts[0]
+            time.sleep(self.fake.latency.get(group, 0.0))
+        try:
+            self._dispatch(method, parts, query, body)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    def do_GET(self):
+        self._route("GET")
+
+    def do_POST(self):
+        self._route("POST")
+
+    def do_DELETE(self):
+        self._route("DELETE")
+
+    # --- endpoints ---
+    def _dispatch(self, method, parts, query, body):
+        fake = self.fake
+        endpoint = f"{method} /" + "/".join("{id}" if i % 2 else p for i, p in enumerate(parts))
+        with fake._lock:
+            if parts == ["_stats"]:
+                return self._send(json.loads(json.dumps(fake.stats)))
+            if parts == ["_reset"]:
+                fake.reset_stats()
+                return self._send({"ok": True})
+            fake.count(endpoint)
+
+        if parts[0] == "files":
+            return self._files(method, parts, body)
+        if parts[0] == "assistants":
+            return self._assistants(method, parts, body)
+        if parts[0] == "threads":
+            return self._threads(method, parts, query, body)
+        return self._not_found("endpoint")
+
+    def _files(self, method, parts, body):
+        fake = self.fake
+        with fake._lock:
+            if method == "POST" and len(parts) == 1:
+                name, content = _multipart_file(self.headers.get("Content-Type", ""), body)
+                file = {"id": fake.new_id("file"), "object": "file", "bytes": len(content), "created_at": int(time.time()),
+                        "filename": name, "purpose": "assistants", "status": "processed"}
+                fake.files[file["id"]] = file
+                fake.stats["upload_bytes"] += len(content)
+                return self._send(file)
+            if method == "GET" and len(parts) == 1:
+                data = sorted(fake.files.values(), key=lambda f: f["created_at"], reverse=True)
+                return self._send({"object": "list", "data": data, "has_more": False,
+                                   "first_id": data[0]["id"] if data else None, "last_id": data[-1]["id"] if data else None})
+            if len(parts) == 2 and parts[1] in fake.files:
+                if method == "DELETE":
+                    fake.files.pop(parts[1])
+                    return self._send({"id": parts[1], "object": "file", "deleted": True})
+                return self._send(fake.files[parts[1]])
+        return self._not_found("file")
+
+    def _assistants(self, method, parts, body):
+        fake = self.fake
+        params = json.loads(body or b"{}")
+        with fake._lock:
+            if len(parts) == 1 and method == "GET":
+                data = sorted(fake.assistants.values(), key=lambda a: a["created_at"], reverse=True)
+                return self._send({"object": "list", "data": data, "has_more": False,
+                                   "first_id": data[0]["id"] if data else None, "last_id": data[-1]["id"] if data else None})
+            if len(parts) == 1 and method == "POST":
+                assistant = {"id": fake.new_id("asst"), "object": "assistant", "created_at": int(time.time()),
+                             "description": None, "tool_resources": {}, "metadata": {}, **params}
+                fake.assistants[assistant["id"]] = assistant
+                return self._send(assistant)
+            assistant = fake.assistants.get(parts[1]) if len(parts) == 2 else None
+            if assistant is None:
+                return self._not_found("assistant")
+            if method == "POST":
+                assistant.update(params)
+            elif method == "DELETE":
+                fake.assistants.pop(parts[1])
+                return self._send({"id": parts[1], "object": "assistant.deleted", "deleted": True})
+            return self._send(assistant)
+
+    def _threads(self, method, parts, query, body):
+        fake = self.fake
+        params = json.loads(body or b"{}")
+        with fake._lock:
+            # Deleted or unknown files are rejected, like the real API does
+            attached = _file_ids(params) + [a["file_id"] for a in params.get("attachments") or []]
+            unknown = [f for f in attached if f not in fake.files]
+            if method == "POST" and unknown:
+                return self._send({"error": {"message": f"Invalid file id '{unknown[0]}'.", "type": "invalid_request_error", "code": None}}, 400)
+            if len(parts) == 1 and method == "POST":
+                thread = {"id": fake.new_id("thread"), "object": "thread", "created_at": int(time.time()),
+                          "metadata": params.get("metadata") or {}, "tool_resources": params.get("tool_resources") or {}}
+                fake.threads[thread["id"]] = dict(thread, file_ids=_file_ids(params))
+                fake.messages[thread["id"]] = []
+                return self._send(thread)
+
+            thread_id = parts[1]
+            if thread_id not in fake.threads:
+                return self._not_found("thread")
+            thread = fake.threads[thread_id]
+
+            if len(parts) == 2:
+                if method == "DELETE":
+                    fake.threads.pop(thread_id)
+                    return self._send({"id": thread_id, "object": "thread.deleted", "deleted": True})
+                if method == "POST" and "tool_resources" in params:
+                    thread["tool_resources"] = params["tool_resources"]
+                    thread["file_ids"] = _file_ids(params)
+                return self._send({k: v for k, v in thread.items() if k != "file_ids"})
+
+            active = [r for r in fake.runs.values() if r["thread_id"] == thread_id and fake.run_object(r)["status"] in ("queued", "in_progress")]
+
+            if parts[2] == "messages" and method == "POST":
+                if active:
+                    return self._send({"error": {"message": f"Can't add messages to {thread_id} while a run {active[0]['id']} is active.",
+                                                 "type": "invalid_request_error", "code": None}}, 400)
+                message = fake.message(thread_id, params.get("role", "user"), params.get("content", ""), params.get("attachments"))
+                fake.messages[thread_id].append(message)
+                return self._send(message)
+            if parts[2] == "messages":
+                data = [m for m in fake.messages[thread_id] if not query.get("run_id") or m["run_id"] == query["run_id"]]
+                if query.get("order", "desc") == "desc":
+                    data = data[::-1]
+                return self._send({"object": "list", "data": data, "has_more": False,
+                                   "first_id": data[0]["id"] if data else None, "last_id": data[-1]["id"] if data else None})
+
+            if len(parts) == 3 and method == "GET":
+                runs = sorted((r for r in fake.runs.values() if r["thread_id"] == thread_id), key=lambda r: (r["created_at"], r["id"]), reverse=True)
+                data = [fake.run_object(r) for r in runs[:int(query.get("limit", 20))]]
+                return self._send({"object": "list", "data": data, "has_more": len(runs) > len(data),
+                                   "first_id": data[0]["id"] if data else None, "last_id": data[-1]["id"] if data else None})
+            if len(parts) == 3 and method == "POST":
+                if active:
+                    return self._send({"error": {"message": f"Thread {thread_id} already has an active run {active[0]['id']}.",
+                                                 "type": "invalid_request_error", "code": None}}, 400)
+                run = self._new_run(thread_id, params)
+                if not params.get("stream"):
+                    return self._send(fake.run_object(run))
+            elif len(parts) >= 4 and parts[3] in fake.runs:
+                run = fake.runs[parts[3]]
+                if len(parts) == 5 and parts[4] == "cancel" and run["status"] in ("queued", "in_progress"):
+                    run["status"] = "cancelled"
+                return self._send(fake.run_object(run))
+            else:
+                return self._not_found("run")
+
+        self._stream(run)
+
+    def _new_run(self, thread_id, params):
+        fake = self.fake
+        prompt = next((m["content"][0]["text"]["value"] for m in reversed(fake.messages[thread_id]) if m["role"] == "user"), "")
+        seconds = fake.run_seconds + fake.run_seconds_per_mb * fake.attached_bytes(thread_id) / 1024 / 1024
+        answer = fake.answer_for(prompt)
+        run = {
+            "id": fake.new_id("run"), "object": "thread.run", "created_at": int(time.time()), "thread_id": thread_id,
+            "assistant_id": params.get("assistant_id"), "status": "queued", "model": MODEL, "last_error": None,
+            "instructions": "", "tools": [{"type": "code_interpreter"}], "metadata": {},
+            "truncation_strategy": params.get("truncation_strategy"), "finish_at": time.time() + seconds,
+            "answer": answer, "prompt_tokens": len(prompt) // 4, "completion_tokens": len(answer) // 4,
+        }
+        fake.runs[run["id"]] = run
+        fake.stats["runs"] += 1
+        return run
+
+    def _stream(self, run):
+        # Server-sent events until the run ends, like runs.create(stream=True)
+        fake = self.fake
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+
+        def emit(event, data):
+            self.wfile.write(f"event: {event}\ndata: {json.dumps(data)}\n\n".encode())
+            self.wfile.flush()
+
+        with fake._lock:
+            emit("thread.run.created", fake.run_object(run))
+            emit("thread.run.in_progress", fake.run_object(run))
+        time.sleep(max(0.0, run["finish_at"] - time.time()))
+        with fake._lock:
+            body = fake.run_object(run)
+        emit(f"thread.run.{body['status']}", body)
+        self.wfile.write(b"event: done\ndata: [DONE]\n\n")
+        self.wfile.flush()
+
+
+def _multipart_file(content_type, body):
+    # -> (file name, bytes) of the "file" part of a multipart upload
+    match = re.search(r'boundary="?([^";]+)"?', content_type)
+    for part in body.split(b"--" + match.group(1).encode()) if match else []:
+        header, _, content = part.partition(b"\r\n\r\n")
+        name = re.search(rb'filename="([^"]*)"', header)
+        if name:
+            return name.group(1).decode(), content[:-2] if content.endswith(b"\r\n") else content
+    return "upload", body
+
+
+def _file_ids(params):
+    return list(((params.get("tool_resources") or {}).get("code_interpreter") or {}).get("file_ids") or [])
+
+
+def serve(port=0, **config):
+    # Starts the stand-in on a background thread -> (server, base_url)
+    handler = type("FakeHandler", (Handler,), {"fake": FakeOpenAI(**config)})
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True, name="fake-openai").start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/v1/"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local stand-in for the OpenAI Assistants API.")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--run-seconds", type=float, default=RUN_SECONDS)
+    parser.add_argument("--run-seconds-per-mb", type=float, default=RUN_SECONDS_PER_MB)
+    args = parser.parse_args()
+
+    server, base_url = serve(args.port, run_seconds=args.run_seconds, run_seconds_per_mb=args.run_seconds_per_mb)
+    print(f"Fake OpenAI API on {base_url} (set OPENAI_BASE_URL to use it)")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,220 @@
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+
+from farm_cache import cached_text
+from farm_state import month_of, refresh_state, table_kind
+from milk_forecast import WINDOW, daily_matrix, window_mean, window_slope
+from reports import REPORTS
+from sustainability_kpis import DEFAULT_MILK_PRICE
+
+# === Compact summaries attached to the assistant instead of raw rows ===
+# The milk, treatment and cow tables are reduced locally to per-cow, per-day,
+# per-month and per-diagnosis tables of a few KB. Each report attaches the
+# summaries named in its "aggregates" list (reports.py) plus every farm file
+# that is not one of those tables (weather, biogas capacity, ...), unchanged.
+# The summaries are built from the incremental farm state (farm_state.py).
+AGGREGATE_FOLDER = "aggregates"
+
+_lock = threading.Lock()
+
+
+def _counts(df, columns):
+    # Days, months or cows without treatments had none, not an unknown number
+    columns = [c for c in columns if c in df.columns]
+    df[columns] = df[columns].fillna(0).astype(int)
+    return df
+
+
+def cow_summary(state):
+    # One row per cow: yield, recent trend, treatments and master data
+    parts = []
+    last_date = state["day"]["date"].max() if not state["day"].empty else pd.Timestamp.today()
+
+    cow_month = state["cow_month"]
+    if not cow_month.empty:
+        totals = cow_month.groupby("cow_id")[["days", "milk_yield"]].sum()
+        dates = pd.date_range(end=last_date, periods=WINDOW, freq="D")
+        matrix = daily_matrix(state["recent"], totals.index, dates)
+        parts.append(pd.DataFrame({
+            "cow_id": totals.index,
+            "days_recorded": totals["days"].to_numpy(dtype=int),
+            "total_yield": totals["milk_yield"].to_numpy(dtype=float),
+            "avg_daily_yield": (totals["milk_yield"] / totals["days"]).to_numpy(dtype=float),
+            f"last_{WINDOW}d_avg": window_mean(matrix, WINDOW, WINDOW),
+            "trend_l_per_day": window_slope(matrix, WINDOW),
+        }))
+
+    treat = state["treat"]
+    if not treat.empty:
+        per_cow = treat.groupby("cow_id").agg(
+            treatments=("treatments", "sum"),
+            antibiotic_treatments=("antibiotic_treatments", "sum"),
+            treatment_days=("days_sum", "sum"),
+            treatment_cost=("cost", "sum"),
+            last_treatment=("last_treatment", "max"),
+        )
+        per_cow["last_treatment"] = per_cow["last_treatment"].dt.strftime("%Y-%m-%d")
+        if state["label"] == "diagnosis":
+            # Most frequent known diagnosis per cow
+            known = treat[treat["label"] != "unknown"]
+            counts = known.groupby(["cow_id", "label"])["treatments"].sum().reset_index(name="n")
+            top = counts.sort_values(["n", "label"], ascending=[False, True]).drop_duplicates("cow_id").set_index("cow_id")
+            per_cow["main_diagnosis"] = top["label"]
+        parts.append(per_cow.reset_index())
+
+    cows = state["cows"]
+    if cows is not None and not cows.empty:
+        info = cows.drop_duplicates("cow_id").copy()
+        info["cow_id"] = info["cow_id"].astype(str)
+        if "birth_date" in info.columns:
+            birth = pd.to_datetime(info.pop("birth_date"), errors="coerce")
+            info["age_years"] = (last_date - birth).dt.days / 365.25
+        parts.append(info)
+
+    if not parts:
+        return None
+    summary = parts[0]
+    for part in parts[1:]:
+        summary = summary.merge(part, on="cow_id", how="outer")
+    summary = _counts(summary, ["treatments", "antibiotic_treatments"])
+    return summary.sort_values("cow_id").round(2)
+
+
+def herd_daily(state):
+    # One row per day: herd yield, cows milked and treatments started
+    parts = []
+
+    day = state["day"]
+    if not day.empty:
+        daily = day.set_index("date")[["herd_yield", "cows_milked"]].astype(float)
+        daily["yield_per_cow"] = daily["herd_yield"] / daily["cows_milked"]
+        parts.append(daily)
+
+    if not state["treat_day"].empty:
+        parts.append(state["treat_day"].set_index("date")[["treatments_started", "antibiotic_treatments"]])
+
+    if not parts:
+        return None
+    daily = _counts(pd.concat(parts, axis=1).sort_index(), ["cows_milked", "treatments_started", "antibiotic_treatments"])
+    daily.index = daily.index.strftime("%Y-%m-%d")
+    return daily.rename_axis("date").reset_index().round(2)
+
+
+def herd_monthly(state):
+    # One row per month: milk, income, treatments and their cost
+    parts = []
+
+    cow_month, day = state["cow_month"], state["day"]
+    if not cow_month.empty:
+        milk = cow_month.groupby("month").agg(
+            milk_total=("milk_yield", "sum"),
+            income_priced=("income_priced", "sum"),
+            yield_unpriced=("yield_unpriced", "sum"),
+            cows_milked=("cow_id", "nunique"),
+        )
+        milk["milk_income"] = milk.pop("income_priced") + DEFAULT_MILK_PRICE * milk.pop("yield_unpriced")
+        milk["days_recorded"] = day.groupby(month_of(day["date"])).size()
+        parts.append(milk[["milk_total", "milk_income", "cows_milked", "days_recorded"]])
+
+    treat = state["treat"].dropna(subset=["month"])
+    if not treat.empty:
+        parts.append(treat.groupby("month").agg(
+            treatments=("treatments", "sum"),
+            treated_cows=("cow_id", "nunique"),
+            antibiotic_treatments=("antibiotic_treatments", "sum"),
+            treatment_days=("days_sum", "sum"),
+            treatment_cost=("cost", "sum"),
+        ))
+
+    if not parts:
+        return None
+    monthly = _counts(pd.concat(parts, axis=1).sort_index(), ["treatments", "treated_cows", "antibiotic_treatments"])
+    monthly.index = pd.DatetimeIndex(monthly.index).strftime("%Y-%m")
+    return monthly.rename_axis("month").reset_index().round(2)
+
+
+def diagnosis_summary(state):
+    # One row per diagnosis (or medicine when there are no diagnoses)
+    treat = state["treat"]
+    if treat.empty or state["label"] is None:
+        return None
+    summary = treat.groupby("label").agg(
+        treatments=("treatments", "sum"),
+        cows=("cow_id", "nunique"),
+        antibiotic_treatments=("antibiotic_treatments", "sum"),
+        days_sum=("days_sum", "sum"),
+        days_count=("days_count", "sum"),
+        total_cost=("cost", "sum"),
+    )
+    summary.insert(3, "avg_duration_days", summary.pop("days_sum") / summary.pop("days_count").replace(0, np.nan))
+    return summary.sort_values("treatments", ascending=False).rename_axis(state["label"]).reset_index().round(2)
+
+
+# name -> (file name, builder, description given to the assistant)
+AGGREGATES = {
+    "cows": ("agg_cows.csv", cow_summary, "one row per cow with milk yield, recent trend, treatments, age and lactation"),
+    "daily": ("agg_daily.csv", herd_daily, "one row per day with herd milk yield, cows milked and treatments started"),
+    "monthly": ("agg_monthly.csv", herd_monthly, "one row per month with milk, milk income, treatments and treatment costs"),
+    "diagnoses": ("agg_diagnoses.csv", diagnosis_summary, "one row per diagnosis with cases, cows, antibiotic use, duration and cost"),
+}
+
+
+def _write_if_changed(path, text):
+    # Unchanged summaries keep their mtime, so they are not hashed or uploaded again
+    if os.path.exists(path) and cached_text(path) == text:
+        return
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+
+def write_aggregates(folder, names=AGGREGATES):
+    # Builds the named summaries of the farm; returns the paths of the files
+    # written (empty summaries are skipped)
+    state = refresh_state(folder)
+    target = os.path.join(folder, AGGREGATE_FOLDER)
+    os.makedirs(target, exist_ok=True)
+
+    written = []
+    with _lock:
+        for name in names:
+            file_name, build, _ = AGGREGATES[name]
+            df = build(state)
+            if df is None or df.empty:
+                continue
+            path = os.path.join(target, file_name)
+            _write_if_changed(path, df.to_csv(index=False))
+            written.append(path)
+    return written
+
+
+def report_inputs(folder, report_key, paths):
+    # Files to attach for a report: its summaries instead of the raw farm
+    # tables, plus all other files as they are
+    names = REPORTS[report_key].get("aggregates")
+    if not names:
+        return list(paths)
+    tables = [p for p in paths if p.endswith(".csv") and table_kind(p)]
+    if not tables:
+        return list(paths)
+    others = [p for p in paths if p not in tables]
+    return write_aggregates(folder, names) + others
+
+
+def aggregate_note(paths):
+    # Tells the assistant what the attached summary files contain
+    lines = [
+        f"- {file_name}: {description}"
+        for file_name, _, description in AGGREGATES.values()
+        if any(os.path.basename(p) == file_name for p in paths)
+    ]
+    if not lines:
+        return ""
+    return (
+        "\nThe milk, treatment and cow records are attached as pre-computed summaries "
+        "instead of raw rows:\n" + "\n".join(lines) + "\n"
+    )
@@ -0,0 +1,98 @@
+import json
+import os
+import sys
+import threading
+from collections import OrderedDict
+
+import pandas as pd
+
+# === Process-wide cache for parsed farm files ===
+# Shared by every Streamlit session in the process. Entries are keyed by
+# path plus mtime and size, so a changed file is simply a cache miss; the
+# least recently used entries are dropped once MAX_CACHE_BYTES is exceeded.
+# Cached objects are shared: callers must not modify them in place.
+MAX_CACHE_BYTES = 256 * 1024 * 1024
+
+_lock = threading.Lock()
+_entries = OrderedDict()  # key -> (value, size in bytes)
+_stats = {"hits": 0, "misses": 0, "evictions": 0, "bytes": 0}
+
+
+def _estimate_size(value):
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(deep=True).sum())
+    if isinstance(value, pd.Series):
+        return int(value.memory_usage(deep=True))
+    if isinstance(value, str):
+        return len(value)
+    # Containers of frames (e.g. the farm state) count each frame's memory;
+    # json.dumps would only see their short printout
+    if isinstance(value, dict):
+        return sum(len(str(k)) + _estimate_size(v) for k, v in value.items())
+    if isinstance(value, (list, tuple)):
+        return sum(_estimate_size(v) for v in value)
+    try:
+        return len(json.dumps(value, default=str))
+    except (TypeError, ValueError):
+        return sys.getsizeof(value)
+
+
+def _file_key(kind, path, extra):
+    stat = os.stat(path)
+    return (kind, os.path.abspath(path), stat.st_mtime_ns, stat.st_size, extra)
+
+
+def cached(kind, path, loader, extra=None):
+    # Returns loader() for this version of path, computing it at most once
+    key = _file_key(kind, path, extra)
+    with _lock:
+        if key in _entries:
+            _entries.move_to_end(key)
+            _stats["hits"] += 1
+            return _entries[key][0]
+        _stats["misses"] += 1
+
+    value = loader()
+    size = _estimate_size(value)
+    with _lock:
+        # Older versions of the same file are dead entries
+        for old_key in [k for k in _entries if k[:2] == key[:2] and k[4] == extra and k != key]:
+            _stats["bytes"] -= _entries.pop(old_key)[1]
+        if key not in _entries and size <= MAX_CACHE_BYTES:
+            _entries[key] = (value, size)
+            _stats["bytes"] += size
+        while _stats["bytes"] > MAX_CACHE_BYTES:
+            _, (_, evicted) = _entries.popitem(last=False)
+            _stats["bytes"] -= evicted
+            _stats["evictions"] += 1
+    return value
+
+
+def cached_listdir(folder):
+    # A directory's mtime changes when entries are added or removed
+    return cached("listdir", folder, lambda: sorted(os.listdir(folder)))
+
+
+def cached_text(path):
+    def load():
+        with open(path, "r", encoding="utf-8") as f:
+            return f.read()
+    return cached("text", path, load)
+
+
+def cached_json(path):
+    def load():
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    return cached("json", path, load)
+
+
+def cache_stats():
+    with _lock:
+        return dict(_stats, entries=len(_entries))
+
+
+def clear_cache():
+    with _lock:
+        _entries.clear()
+        _stats["bytes"] = 0
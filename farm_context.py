@@ -0,0 +1,180 @@
+import json
+import os
+import threading
+import time
+
+import openai
+
+from assistant_runs import DEFAULT_TIMEOUT, RunNotCompleted, ask_assistant_run_async, last_assistant_text_async, start_run_async
+from farm_files import CONTEXT_NAME
+from farm_metrics import timed
+from openai_async import create_message, create_thread, delete_thread, relay, run_sync, update_thread
+from response_cache import ask_cached_async
+from upload_cache import attachments_for, forget_missing_files, upload_files_async
+
+# === One persistent assistant thread per farm ===
+# Instead of a new thread with freshly attached files for every analysis, a
+# farm keeps one thread whose code interpreter already holds the farm files.
+# Its id and files are stored in <farm folder>/assistant_context.json, next to
+# profile.json. Files a report needs that are new to the thread are added to
+# it; when a file the thread holds has changed or is gone, the thread is
+# replaced. Runs only read the latest message, so earlier reports in the
+# thread do not add to the prompt.
+
+# Code interpreter accepts at most this many files per thread
+MAX_CONTEXT_FILES = 20
+HISTORY_MESSAGES = 1
+
+_lock = threading.Lock()
+_farm_locks = {}  # farm folder -> lock held while a run uses its thread
+
+
+def _farm_lock(folder):
+    with _lock:
+        return _farm_locks.setdefault(os.path.abspath(folder), threading.Lock())
+
+
+def load_context(folder):
+    path = os.path.join(folder, CONTEXT_NAME)
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_context(folder, context):
+    path = os.path.join(folder, CONTEXT_NAME)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(context, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def _tool_resources(files):
+    return {"code_interpreter": {"file_ids": list(dict.fromkeys(files.values()))}}
+
+
+def _thread_busy(error):
+    # The 400s for a thread with an active run: "Can't add messages to ...
+    # while a run ... is active." and "Thread ... already has an active run"
+    message = getattr(error, "message", "") or ""
+    return "while a run" in message or "already has an active run" in message
+
+
+async def _context_thread(folder, files, fresh=False):
+    # files: {path relative to the farm folder: file_id}; returns the id of the
+    # farm thread holding all of them
+    context = load_context(folder)
+    known = context.get("files", {})
+    current = {name: fid for name, fid in known.items() if os.path.exists(os.path.join(folder, name))}
+    changed = len(current) < len(known) or any(current.get(name, fid) != fid for name, fid in files.items())
+    merged = {**current, **files}
+
+    thread_id = None if fresh or changed else context.get("thread_id")
+    if thread_id and merged == known:
+        return thread_id
+    if thread_id and len(set(merged.values())) <= MAX_CONTEXT_FILES:
+        await update_thread(thread_id, tool_resources=_tool_resources(merged))
+        context.update(files=merged, updated_at=time.strftime("%Y-%m-%d %H:%M:%S"))
+        save_context(folder, context)
+        return thread_id
+
+    thread = await create_thread(tool_resources=_tool_resources(files))
+    if context.get("thread_id") and not fresh:
+        try:
+            await delete_thread(context["thread_id"])
+        except openai.APIError:
+            pass
+    now = time.strftime("%Y-%m-%d %H:%M:%S")
+    save_context(folder, {"thread_id": thread.id, "files": files, "created_at": now, "updated_at": now})
+    return thread.id
+
+
+async def _ask_in_thread(folder, prompt, files, assistant_id, timeout, cancel_event, stages):
+    with timed(stages, "setup"):
+        try:
+            thread_id = await _context_thread(folder, files)
+            await create_message(thread_id, prompt)
+        except openai.NotFoundError:
+            # The thread was deleted or expired on the OpenAI side
+            thread_id = await _context_thread(folder, files, fresh=True)
+            await create_message(thread_id, prompt)
+
+    truncation = {"type": "last_messages", "last_messages": HISTORY_MESSAGES}
+    with timed(stages, "run"):
+        run = await start_run_async(thread_id, assistant_id, timeout=timeout, cancel_event=cancel_event, truncation_strategy=truncation)
+    if run.status != "completed":
+        raise RunNotCompleted(run)
+    with timed(stages, "fetch"):
+        return await last_assistant_text_async(thread_id, run.id), run
+
+
+async def ask_farm_async(folder, prompt, files, assistant_id, timeout=DEFAULT_TIMEOUT, cancel_event=None, stages=None):
+    # files: {path: file_id} -> (answer, run). Asks in the farm thread; while
+    # another report is running there (a thread runs one at a time) a one-off
+    # thread is used.
+    names = {os.path.relpath(path, folder): fid for path, fid in files.items()}
+    lock = _farm_lock(folder)
+    if len(set(names.values())) <= MAX_CONTEXT_FILES and lock.acquire(blocking=False):
+        try:
+            return await _ask_in_thread(folder, prompt, names, assistant_id, timeout, cancel_event, stages)
+        except openai.BadRequestError as e:
+            # Busy with a run started by another process (e.g. the fleet CLI);
+            # any other 400 is a real error
+            if not _thread_busy(e):
+                raise
+        finally:
+            lock.release()
+    return await ask_assistant_run_async(prompt, attachments_for(files.values()), assistant_id, timeout=timeout, cancel_event=cancel_event, stages=stages)
+
+
+async def ask_with_files(folder, paths, ask, files=None, progress=None, stages=None):
+    # ask({path: file_id}) -> result, with the files uploaded unless given.
+    # When a 404 or 400 comes from files that are gone on the OpenAI side,
+    # they are dropped from the upload registry and the thread context,
+    # uploaded again and the request repeated once.
+    for attempt in range(2):
+        if files is None:
+            with timed(stages, "upload"):
+                files = dict(zip(paths, await upload_files_async(folder, paths, progress=progress)))
+        try:
+            return await ask(files)
+        except (openai.NotFoundError, openai.BadRequestError):
+            if attempt:
+                raise
+            context = load_context(folder)
+            known = context.get("files", {})
+            missing = await forget_missing_files(folder, [*files.values(), *known.values()])
+            if not missing:
+                raise
+            if any(fid in missing for fid in known.values()):
+                # No await between load and save: atomic on the event loop
+                context = load_context(folder)
+                context["files"] = {name: fid for name, fid in context.get("files", {}).items() if fid not in missing}
+                save_context(folder, context)
+            files = None
+
+
+async def run_prompt_async(folder, prompt, paths, assistant_id, timeout=DEFAULT_TIMEOUT, cancel_event=None, progress=None, stages=None, max_age_s=None):
+    # A recorded answer for the same prompt and files (at most max_age_s old)
+    # skips upload and run
+    async def ask():
+        async def ask_farm(files):
+            return await ask_farm_async(folder, prompt, files, assistant_id, timeout=timeout, cancel_event=cancel_event, stages=stages)
+        return await ask_with_files(folder, paths, ask_farm, progress=progress, stages=stages)
+    return await ask_cached_async(folder, prompt, paths, assistant_id, ask, max_age_s)
+
+
+# --- Sync bridges for Streamlit scripts and CLIs ---
+def ask_farm(folder, prompt, files, assistant_id, timeout=DEFAULT_TIMEOUT, cancel_event=None, stages=None):
+    return run_sync(ask_farm_async(folder, prompt, files, assistant_id, timeout=timeout, cancel_event=cancel_event, stages=stages))
+
+
+def run_prompt(folder, prompt, paths, assistant_id, timeout=DEFAULT_TIMEOUT, cancel_event=None, progress=None, stages=None, max_age_s=None):
+    # progress(done, total) is called from the calling thread
+    updates, on_progress = relay(progress)
+    coro = run_prompt_async(folder, prompt, paths, assistant_id, timeout=timeout, cancel_event=cancel_event, progress=on_progress, stages=stages, max_age_s=max_age_s)
+    return run_sync(coro, updates, progress)
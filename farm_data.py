@@ -0,0 +1,333 @@
+import io
+import json
+import os
+import re
+import shutil
+import time
+from itertools import chain
+
+import pandas as pd
+
+from farm_cache import cached
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # without pyarrow everything is read from the CSVs
+    pa = pq = None
+
+# === Farm CSV tables ===
+# Farm exports come from different milking robots and herd software, so
+# tables are recognised by their columns. Column names are normalised to
+# lower_snake_case and mapped to one canonical name per field.
+#
+# Each CSV is ingested once into a typed Parquet copy next to it
+# (milk.csv -> milk.parquet); readers load that copy with column projection
+# and memory mapping instead of re-parsing the CSV.
+COLUMN_ALIASES = {
+    "cow_id": ["cow_id", "cow", "animal_id", "animal", "cow_number", "ear_tag"],
+    "date": ["date", "milking_date", "day", "record_date"],
+    "milk_yield": ["milk_yield", "milk_yield_l", "milk_yield_kg", "yield", "milk_l", "milk_kg", "milk"],
+    "milk_price": ["milk_price", "price", "price_per_l", "milk_price_czk"],
+    "start_date": ["start_date", "treatment_start", "treatment_date", "date_start"],
+    "end_date": ["end_date", "treatment_end", "date_end"],
+    "duration_days": ["duration_days", "treatment_duration", "duration"],
+    "diagnosis": ["diagnosis", "disease", "illness"],
+    "medicine": ["medicine", "drug", "medication", "treatment"],
+    "antibiotic": ["antibiotic", "is_antibiotic", "antibiotics"],
+    "cost": ["cost", "treatment_cost", "cost_czk", "price_czk"],
+    "birth_date": ["birth_date", "date_of_birth", "born"],
+    "lactation_number": ["lactation_number", "lactation", "parity"],
+    "breed": ["breed"],
+}
+
+# kind -> canonical columns that identify it; checked in this order
+TABLE_KINDS = {
+    "milk": {"cow_id", "date", "milk_yield"},
+    "treatments": {"cow_id", "start_date"},
+    "cows": {"cow_id", "birth_date"},
+}
+
+DATE_COLUMNS = {"date", "start_date", "end_date", "birth_date"}
+
+# Large exports are converted this many rows at a time, in constant memory
+CHUNK_ROWS = 250_000
+
+# Parquet schema metadata key holding the source CSV's size and mtime
+SOURCE_KEY = b"farm_source_csv"
+
+_ALIAS_LOOKUP = {alias: name for name, aliases in COLUMN_ALIASES.items() for alias in aliases}
+
+
+def normalize_column(column):
+    key = re.sub(r"[^0-9a-z]+", "_", str(column).strip().lower()).strip("_")
+    return _ALIAS_LOOKUP.get(key, key)
+
+
+def normalize_columns(df):
+    renamed = df.rename(columns=normalize_column)
+    # Two source columns mapping to one name: keep the first
+    return renamed.loc[:, ~renamed.columns.duplicated()]
+
+
+def detect_kind(columns):
+    names = {normalize_column(c) for c in columns}
+    for kind, required in TABLE_KINDS.items():
+        if required <= names:
+            return kind
+    # Cow master data without birth dates still carries lactation or breed
+    if "cow_id" in names and names & {"lactation_number", "breed"}:
+        return "cows"
+    return None
+
+
+def parquet_path(csv_path):
+    return os.path.splitext(csv_path)[0] + ".parquet"
+
+
+def _typed(df):
+    # Dates and cow ids get fixed types; numeric columns keep pandas' inference
+    for column in df.columns:
+        name = normalize_column(column)
+        if name in DATE_COLUMNS:
+            df[column] = pd.to_datetime(df[column], errors="coerce")
+        elif name == "cow_id":
+            df[column] = df[column].astype(str)
+    return df
+
+
+def _source_metadata(schema, stat):
+    # The CSV a Parquet copy was made from, compared by has_fresh_parquet
+    source = json.dumps({"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}).encode()
+    return schema.with_metadata({**(schema.metadata or {}), SOURCE_KEY: source})
+
+
+def _chunk_schema(table):
+    # A later chunk with gaps turns integer columns into floats
+    return pa.schema([
+        pa.field(field.name, pa.float64()) if pa.types.is_integer(field.type) else field
+        for field in table.schema
+    ])
+
+
+def ingest_csv(csv_path, chunksize=CHUNK_ROWS):
+    # Writes the typed Parquet copy chunk by chunk; returns the row count
+    if pq is None:
+        return None
+    target = parquet_path(csv_path)
+    tmp_path = target + ".tmp"
+    # Taken before reading: a CSV changed meanwhile makes the copy stale
+    stat = os.stat(csv_path)
+
+    with pd.read_csv(csv_path, chunksize=chunksize) as chunks:
+        first = next(chunks, None)
+        if first is None:
+            first = pd.read_csv(csv_path, nrows=0)
+        table = pa.Table.from_pandas(_typed(first), preserve_index=False)
+        rows = len(first)
+
+        second = next(chunks, None)
+        if second is None:
+            # Fits in one chunk: keep the exact inferred types
+            pq.write_table(table.replace_schema_metadata(_source_metadata(table.schema, stat).metadata), tmp_path)
+        else:
+            schema = _source_metadata(_chunk_schema(table), stat)
+            try:
+                with pq.ParquetWriter(tmp_path, schema) as writer:
+                    writer.write_table(table.cast(schema))
+                    for chunk in chain([second], chunks):
+                        writer.write_table(pa.Table.from_pandas(_typed(chunk), schema=schema, preserve_index=False, safe=False))
+                        rows += len(chunk)
+            except (pa.ArrowInvalid, pa.ArrowTypeError):
+                # Column types change between chunks: convert the file in one go
+                df = _typed(pd.read_csv(csv_path))
+                table = pa.Table.from_pandas(df, preserve_index=False)
+                pq.write_table(table.replace_schema_metadata(_source_metadata(table.schema, stat).metadata), tmp_path)
+                rows = len(df)
+
+    os.replace(tmp_path, target)
+    return rows
+
+
+def save_upload(fileobj, path):
+    # Copies an uploaded file to disk without parsing it
+    fileobj.seek(0)
+    with open(path, "wb") as f:
+        shutil.copyfileobj(fileobj, f, length=1024 * 1024)
+
+
+def read_preview(csv_path, rows=5):
+    return pd.read_csv(csv_path, nrows=rows)
+
+
+def csv_header(csv_path):
+    # -> (column names, byte offset of the first data row)
+    with open(csv_path, "rb") as f:
+        line = f.readline()
+    return list(pd.read_csv(io.BytesIO(line), nrows=0).columns), len(line)
+
+
+class _ByteRange(io.RawIOBase):
+    # The bytes of an open file up to `end`, for pandas to read in chunks
+    def __init__(self, f, end):
+        self.f = f
+        self.left = end - f.tell()
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        data = self.f.read(max(min(len(buffer), self.left), 0))
+        buffer[:len(data)] = data
+        self.left -= len(data)
+        return len(data)
+
+
+def _complete_end(f, offset, size, block=64 * 1024):
+    # Position after the last newline at or after offset (offset if none)
+    pos = size
+    while pos > offset:
+        start = max(pos - block, offset)
+        f.seek(start)
+        found = f.read(pos - start).rfind(b"\n")
+        if found >= 0:
+            return start + found + 1
+        pos = start
+    return offset
+
+
+def _tail_chunks(csv_path, offset, end, columns, chunksize):
+    if end <= offset:
+        return
+    # The whole file, as ingested: read the typed Parquet copy instead
+    if end == os.path.getsize(csv_path) and offset == csv_header(csv_path)[1] and has_fresh_parquet(csv_path):
+        parquet = pq.ParquetFile(parquet_path(csv_path), memory_map=True)
+        for batch in parquet.iter_batches(batch_size=chunksize):
+            yield normalize_columns(batch.to_pandas())
+        return
+    with open(csv_path, "rb") as f:
+        f.seek(offset)
+        reader = io.BufferedReader(_ByteRange(f, end), buffer_size=1024 * 1024)
+        with pd.read_csv(reader, header=None, names=columns, chunksize=chunksize) as chunks:
+            for chunk in chunks:
+                yield normalize_columns(_typed(chunk))
+
+
+def read_csv_tail(csv_path, offset, columns, chunksize=CHUNK_ROWS):
+    # Rows from byte offset to the last complete line -> (new offset,
+    # iterator of typed DataFrames with canonical column names, chunksize
+    # rows at a time). A line still being written is left for the next read.
+    with open(csv_path, "rb") as f:
+        end = _complete_end(f, offset, os.fstat(f.fileno()).st_size)
+    return end, _tail_chunks(csv_path, offset, end, columns, chunksize)
+
+
+def _parquet_source(target):
+    source = pq.read_schema(target).metadata or {}
+    return json.loads(source[SOURCE_KEY]) if SOURCE_KEY in source else None
+
+
+def has_fresh_parquet(csv_path):
+    # The copy must be made from this CSV's exact size and mtime: a CSV
+    # replaced by an older file (cp -p, rsync, unzip) is ingested again
+    target = parquet_path(csv_path)
+    if pq is None or not os.path.exists(target):
+        return False
+    stat = os.stat(csv_path)
+    return cached("parquet_source", target, lambda: _parquet_source(target)) == {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+def ensure_parquet(csv_path):
+    # CSVs that were copied into the folder by hand are ingested on first read
+    if pq is not None and not has_fresh_parquet(csv_path):
+        ingest_csv(csv_path)
+    return has_fresh_parquet(csv_path)
+
+
+def table_columns(csv_path):
+    def load():
+        if ensure_parquet(csv_path):
+            return list(pq.read_schema(parquet_path(csv_path)).names)
+        return list(pd.read_csv(csv_path, nrows=0).columns)
+    return cached("columns", csv_path, load)
+
+
+def read_raw(csv_path, columns=None):
+    # Typed table with the original column names; columns are canonical
+    # names to project on (None = all)
+    selected = None
+    if columns is not None:
+        selected = [c for c in table_columns(csv_path) if normalize_column(c) in columns]
+    if ensure_parquet(csv_path):
+        return pd.read_parquet(parquet_path(csv_path), columns=selected, memory_map=True)
+    return _typed(pd.read_csv(csv_path, usecols=selected))
+
+
+def read_table(path, columns=None):
+    return normalize_columns(read_raw(path, columns))
+
+
+def load_tables(paths, columns=None):
+    # -> {kind: DataFrame}; files of the same kind are concatenated.
+    # columns: optional {kind: set of canonical columns} to load
+    frames = {}
+    for path in paths:
+        if not path.endswith(".csv") or not os.path.exists(path):
+            continue
+        kind = detect_kind(table_columns(path))
+        if kind:
+            wanted = frozenset(columns[kind]) if columns and kind in columns else None
+            frames.setdefault(kind, []).append(
+                cached("table", path, lambda: read_table(path, wanted), extra=wanted)
+            )
+    return {kind: pd.concat(dfs, ignore_index=True) for kind, dfs in frames.items()}
+
+
+def read_rows(csv_path, start, count):
+    # Rows [start, start + count) with the original columns; only the Parquet
+    # row groups that overlap the range are decoded
+    if not ensure_parquet(csv_path):
+        return _typed(pd.read_csv(csv_path, skiprows=range(1, start + 1), nrows=count))
+
+    parquet = pq.ParquetFile(parquet_path(csv_path), memory_map=True)
+    groups, first_row, offset = [], None, 0
+    for i in range(parquet.num_row_groups):
+        group_rows = parquet.metadata.row_group(i).num_rows
+        if offset + group_rows > start and offset < start + count:
+            groups.append(i)
+            first_row = offset if first_row is None else first_row
+        offset += group_rows
+    if not groups:
+        return parquet.schema_arrow.empty_table().to_pandas()
+    table = parquet.read_row_groups(groups)
+    return table.slice(start - first_row, count).to_pandas()
+
+
+def file_metadata(path):
+    # A CSV ingested later gets its row count: the Parquet copy is part of the key
+    fresh = path.endswith(".csv") and has_fresh_parquet(path)
+    return cached("metadata", path, lambda: _file_metadata(path), extra=fresh)
+
+
+def _file_metadata(path):
+    # Listing info without loading the file. Row counts come from the Parquet
+    # metadata of ingested CSVs; others are ingested when first opened.
+    stat = os.stat(path)
+    info = {
+        "file": os.path.basename(path),
+        "size_kb": round(stat.st_size / 1024, 1),
+        "rows": None,
+        "columns": None,
+        "modified": time.strftime("%Y-%m-%d %H:%M", time.localtime(stat.st_mtime)),
+    }
+    if path.endswith(".csv") and has_fresh_parquet(path):
+        metadata = pq.read_metadata(parquet_path(path))
+        info["rows"], info["columns"] = metadata.num_rows, metadata.num_columns
+    elif path.endswith(".csv"):
+        info["columns"] = len(csv_header(path)[0])
+    return info
+
+
+def read_bytes(path):
+    with open(path, "rb") as f:
+        return f.read()
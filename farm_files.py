@@ -0,0 +1,16 @@
+# === Bookkeeping files in a farm folder ===
+# The app keeps its own state next to the farm data. The names live here,
+# in a module without imports, so the modules writing these files and
+# upload_cache.py (which must not upload them as farm data) share one list.
+REGISTRY_NAME = "uploaded_files.json"  # upload_cache.py
+CONTEXT_NAME = "assistant_context.json"  # farm_context.py
+JOBS_NAME = "jobs.json"  # job_queue.py
+LAST_RUNS_NAME = "last_runs.json"  # run_fleet.py
+METRICS_NAME = "metrics.jsonl"  # farm_metrics.py
+FORECAST_REPORT_NAME = "milk_forecast_report.json"  # app.py
+
+INTERNAL_FILES = {REGISTRY_NAME, CONTEXT_NAME, JOBS_NAME, LAST_RUNS_NAME, METRICS_NAME, FORECAST_REPORT_NAME}
+
+# Generated by the app from the farm data. The report files are listed in
+# reports.REPORTS.
+PROFILE_NAME = "profile.json"  # farm_profile_view.py
@@ -0,0 +1,334 @@
+import argparse
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pacsv
+except ImportError:  # without pyarrow the CSVs are written by pandas
+    pa = pacsv = None
+
+# === Synthetic herd data for load and scale testing ===
+# Writes a farm folder with the files the analyses in app.py read:
+#   milk_yield.csv          daily yield per lactating cow (Wood lactation curve,
+#                           parity, heat stress from the weather, noise)
+#   treatments.csv          diagnoses, medicines, antibiotic flag, duration, cost
+#   cows.csv                cow master data (birth date, lactation, breed, group),
+#                           culled cows with their exit date
+#   manure.csv              daily manure per cow group
+#   biogas_capacity.csv     biogas plant parameters
+#   biogas_production.csv   daily digester input and output
+#   weather.csv             daily temperature, precipitation, humidity and THI
+# The same seed always gives the same farm. Everything is generated with
+# NumPy over whole columns; milk rows are written in blocks of cows, so
+# memory stays bounded for 100,000 cows over several years.
+#
+#   python farm_generator.py "Load Test 10k" --cows 10000 --years 3
+FOLDER_BASE = "streamlet/farm_data"
+END_DATE = "2024-12-31"
+
+# Milk rows generated and written at a time
+BLOCK_ROWS = 2_000_000
+
+BREEDS = {"Holstein": 0.7, "Czech Fleckvieh": 0.25, "Jersey": 0.05}
+BREED_YIELD = {"Holstein": 1.0, "Czech Fleckvieh": 0.85, "Jersey": 0.7}
+
+# Wood curve y = a * t^b * exp(-c t) peaks at b / c = 50 days in milk
+WOOD_B = 0.2
+WOOD_C = 0.004
+FIRST_LACTATION_FACTOR = 0.85
+CALVING_INTERVAL = (395, 30)  # days, mean and sd
+DRY_DAYS = 60
+FIRST_CALVING_AGE = (760, 45)
+HEAT_STRESS_THI = 72  # each THI point above costs 1 % of the day's yield
+MISSING_RECORDS = 0.01
+
+MILK_PRICE = 10.2  # CZK per litre, +-6 % over the year
+
+# diagnosis -> cases per cow and year, treatment days (min, max) and medicines
+# as (name, antibiotic, CZK per day)
+DISEASES = {
+    "mastitis": (0.30, (3, 6), [("Cobactan", True, 180), ("Synulox", True, 150), ("Ubrolexin", True, 210)]),
+    "lameness": (0.25, (1, 4), [("Metacam", False, 120), ("Ketofen", False, 90)]),
+    "metritis": (0.08, (3, 5), [("Metricure", True, 240), ("Excenel", True, 200)]),
+    "ketosis": (0.06, (3, 5), [("Ketosol", False, 60), ("Propylene glycol", False, 40)]),
+    "pneumonia": (0.04, (3, 7), [("Draxxin", True, 320), ("Resflor", True, 280)]),
+    "retained placenta": (0.04, (2, 4), [("Oxytocin", False, 50)]),
+}
+VET_VISIT_CZK = 450
+
+# Manure: kg per cow and day, plus kg per litre of milk for lactating cows
+MANURE_BASE = {"lactating": 45.0, "dry": 35.0}
+MANURE_PER_LITRE = 0.6
+MANURE_DRY_MATTER = (12.5, 0.8)  # %
+BIOGAS_PER_TONNE = 25.0  # m3 of biogas per tonne of cattle slurry
+KWH_PER_M3 = 2.0
+
+
+def _write(df, path, append=False):
+    if pacsv is not None:
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        # Dates as YYYY-MM-DD, like the farm exports
+        table = table.cast(pa.schema([
+            pa.field(field.name, pa.date32()) if pa.types.is_timestamp(field.type) else field
+            for field in table.schema
+        ]))
+        options = pacsv.WriteOptions(include_header=not append, quoting_style="none")
+        with open(path, "ab" if append else "wb") as f:
+            pacsv.write_csv(table, f, options)
+    else:
+        df.to_csv(path, index=False, header=not append, mode="a" if append else "w", date_format="%Y-%m-%d")
+
+
+def _dates(end, days):
+    return np.arange(np.datetime64(end, "D") - days + 1, np.datetime64(end, "D") + 1)
+
+
+# === Weather ===
+def make_weather(rng, dates):
+    day_of_year = (dates - dates.astype("datetime64[Y]")).astype(int)
+    season = np.sin(2 * np.pi * (day_of_year - 110) / 365)
+    # Day-to-day anomalies persist for a few days (AR(1))
+    noise = rng.normal(0, 2.5, len(dates))
+    anomaly = pd.Series(noise).ewm(alpha=0.35).mean().to_numpy() * 1.8
+    temp_mean = 9 + 10 * season + anomaly
+    temp_max = temp_mean + rng.normal(5, 1.5, len(dates)).clip(1)
+    humidity = (75 - 12 * season + rng.normal(0, 7, len(dates))).clip(35, 100)
+    wet = rng.random(len(dates)) < 0.38
+    precipitation = np.where(wet, rng.gamma(0.8, 5.5 + 2 * season.clip(0)), 0.0)
+    thi = (1.8 * temp_max + 32) - (0.55 - 0.0055 * humidity) * (1.8 * temp_max - 26)
+    return pd.DataFrame({
+        "date": dates,
+        "temp_mean_c": temp_mean.round(1),
+        "temp_max_c": temp_max.round(1),
+        "precipitation_mm": precipitation.round(1),
+        "humidity_pct": humidity.round(0),
+        "thi": thi.round(1),
+    })
+
+
+# === Cows ===
+def _cow_ids(rng, first, count):
+    # Ear tags with gaps, unique across the farm
+    return np.char.add("CZ", (100000000 + (first + np.arange(count)) * 37 + rng.integers(0, 37, count)).astype(str))
+
+
+def make_cows(rng, cows, dates):
+    # The herd keeps one cow per stall. The cow in a stall at the end date has
+    # parity 1 to 7 in the usual proportions; before her first calving the
+    # stall belonged to an older cow that was culled the day before.
+    # -> (cows.csv rows, per-stall arrays)
+    end = dates[-1]
+    interval = rng.normal(*CALVING_INTERVAL, cows).clip(330, 520).round().astype(int)
+    parity = rng.choice(np.arange(1, 8), cows, p=[0.33, 0.26, 0.18, 0.11, 0.07, 0.03, 0.02])
+    # Days since the last calving at the end date
+    dim = rng.integers(0, interval)
+    first_calving = end - dim - (parity - 1) * interval
+    stalls = {
+        "cow_id": _cow_ids(rng, 0, cows),
+        "previous_id": _cow_ids(rng, cows, cows),
+        "breed": rng.choice(list(BREEDS), cows, p=list(BREEDS.values())),
+        "first_calving": first_calving,
+        "interval": interval,
+        "parity": parity,
+    }
+    age_at_first_calving = rng.normal(*FIRST_CALVING_AGE, (2, cows)).clip(640, 900).round().astype(int)
+    herd = pd.DataFrame({
+        "cow_id": stalls["cow_id"],
+        "birth_date": first_calving - age_at_first_calving[0],
+        "first_calving_date": first_calving,
+        "last_calving_date": end - dim,
+        "lactation_number": parity,
+        "breed": stalls["breed"],
+        "group": np.select(
+            [dim >= interval - DRY_DAYS, dim < 21, rng.random(cows) < 0.5],
+            ["Dry", "Fresh", "High yield"], "Low yield"),
+        "exit_date": np.datetime64("NaT", "D"),
+    })
+
+    replaced = first_calving > dates[0]
+    previous_parity = rng.integers(3, 7, cows)[replaced]
+    previous_first = first_calving[replaced] - previous_parity * interval[replaced]
+    culled = pd.DataFrame({
+        "cow_id": stalls["previous_id"][replaced],
+        "birth_date": previous_first - age_at_first_calving[1][replaced],
+        "first_calving_date": previous_first,
+        "last_calving_date": first_calving[replaced] - interval[replaced],
+        "lactation_number": previous_parity,
+        "breed": stalls["breed"][replaced],
+        "group": "Culled",
+        "exit_date": first_calving[replaced] - 1,
+    })
+    return pd.concat([herd, culled], ignore_index=True), stalls
+
+
+# === Milk ===
+def _milk_block(rng, stalls, block, potential, dates, heat):
+    # Stalls x days -> rows of the milked days: (stall, day, from the culled
+    # cow, yield), plus the cows in milk per day
+    interval = stalls["interval"][block][:, None]
+    since_first = (dates[None, :] - stalls["first_calving"][block][:, None]).astype(int)
+    lactation = np.floor_divide(since_first, interval)
+    dim = since_first - lactation * interval + 1
+    milking = dim <= interval - DRY_DAYS
+    in_milk = milking.sum(axis=0)
+    milking &= rng.random(milking.shape) >= MISSING_RECORDS
+
+    stall_index, day_index = np.nonzero(milking)
+    lactation = lactation[stall_index, day_index]
+    dim = dim[stall_index, day_index]
+    parity_factor = np.where(lactation == 0, FIRST_LACTATION_FACTOR, 1.0)
+    yield_l = potential[stall_index] * parity_factor * dim ** WOOD_B * np.exp(-WOOD_C * dim)
+    yield_l *= heat[day_index]
+    yield_l += rng.normal(0, 1.6, len(yield_l))
+    return stall_index, day_index, lactation < 0, yield_l.clip(0.5).round(1), in_milk
+
+
+def write_milk(rng, folder, stalls, dates, weather, block_rows=BLOCK_ROWS):
+    # -> (cows in milk per day, dry cows per day, milk litres per day)
+    n, days = len(stalls["cow_id"]), len(dates)
+    breed_factor = pd.Series(stalls["breed"]).map(BREED_YIELD).to_numpy()
+    # Peak yield ~ 36 l for an average Holstein
+    potential = rng.normal(20, 2.6, n).clip(12, 30) * breed_factor
+    heat = 1 - 0.01 * (weather["thi"].to_numpy() - HEAT_STRESS_THI).clip(0)
+    day_of_year = (dates - dates.astype("datetime64[Y]")).astype(int)
+    price = (MILK_PRICE * (1 + 0.06 * np.cos(2 * np.pi * (day_of_year - 15) / 365))).round(2)
+
+    lactating = np.zeros(days, dtype=np.int64)
+    litres = np.zeros(days)
+    step = max(1, block_rows // days)
+    path = os.path.join(folder, "milk_yield.csv")
+    for start in range(0, n, step):
+        block = slice(start, min(start + step, n))
+        stall_index, day_index, culled, yield_l, in_milk = _milk_block(rng, stalls, block, potential[block], dates, heat)
+        cow_id = np.where(culled, stalls["previous_id"][block][stall_index], stalls["cow_id"][block][stall_index])
+        _write(pd.DataFrame({
+            "cow_id": cow_id,
+            "date": dates[day_index],
+            "milk_yield_l": yield_l,
+            "milk_price_czk": price[day_index],
+        }), path, append=start > 0)
+        lactating += in_milk
+        litres += np.bincount(day_index, weights=yield_l, minlength=days)
+    return lactating, n - lactating, litres
+
+
+# === Treatments ===
+def make_treatments(rng, stalls, dates):
+    n, days = len(stalls["cow_id"]), len(dates)
+    years = days / 365
+    # Older cows fall ill more often
+    risk = 1 + 0.15 * (stalls["parity"] - 1)
+    risk = risk / risk.sum()
+    frames = []
+    for diagnosis, (rate, (low, high), medicines) in DISEASES.items():
+        cases = rng.poisson(rate * years * n)
+        stall_index = rng.choice(n, cases, p=risk)
+        start = dates[rng.integers(0, days, cases)]
+        duration = rng.integers(low, high + 1, cases)
+        choice = rng.integers(0, len(medicines), cases)
+        names, antibiotic, per_day = (np.array(values)[choice] for values in zip(*medicines))
+        culled = start < stalls["first_calving"][stall_index]
+        frames.append(pd.DataFrame({
+            "cow_id": np.where(culled, stalls["previous_id"][stall_index], stalls["cow_id"][stall_index]),
+            "start_date": start,
+            "end_date": start + duration - 1,
+            "duration_days": duration,
+            "diagnosis": diagnosis,
+            "medicine": names,
+            "antibiotic": antibiotic.astype(bool),
+            "cost_czk": (per_day.astype(float) * duration + VET_VISIT_CZK).round(0),
+        }))
+    return pd.concat(frames, ignore_index=True).sort_values(["start_date", "cow_id"], ignore_index=True)
+
+
+# === Manure and biogas ===
+def make_manure(rng, dates, lactating, dry, litres):
+    days = len(dates)
+    lactating_kg = lactating * MANURE_BASE["lactating"] + litres * MANURE_PER_LITRE
+    dry_kg = dry * MANURE_BASE["dry"]
+    manure = pd.DataFrame({
+        "date": np.concatenate([dates, dates]),
+        "group": np.repeat(["lactating", "dry"], days),
+        "cows": np.concatenate([lactating, dry]),
+        "manure_kg": (np.concatenate([lactating_kg, dry_kg]) * rng.normal(1, 0.04, 2 * days)).round(0),
+        "dry_matter_pct": rng.normal(*MANURE_DRY_MATTER, 2 * days).round(1),
+    })
+    return manure.sort_values(["date", "group"], ignore_index=True)
+
+
+def make_biogas(rng, dates, manure):
+    daily_t = manure.groupby("date")["manure_kg"].sum().reindex(dates).to_numpy() / 1000
+    # Plants are sized for the herd, some a little too small
+    input_capacity = max(1.0, round(float(np.median(daily_t)) * rng.uniform(0.85, 1.25), 1))
+    capacity = pd.DataFrame([{
+        "plant": "Digester 1",
+        "digester_volume_m3": round(input_capacity * 30, 0),  # 30 days retention
+        "max_input_t_per_day": input_capacity,
+        "biogas_capacity_m3_per_day": round(input_capacity * BIOGAS_PER_TONNE, 0),
+        "chp_power_kw": round(input_capacity * BIOGAS_PER_TONNE * KWH_PER_M3 / 24, 0),
+        "commissioned": "2016-05-01",
+    }])
+    collected = np.minimum(daily_t * rng.uniform(0.88, 0.97, len(dates)), input_capacity)
+    biogas = collected * BIOGAS_PER_TONNE * rng.normal(1, 0.05, len(dates))
+    production = pd.DataFrame({
+        "date": dates,
+        "manure_input_t": collected.round(2),
+        "biogas_m3": biogas.round(0),
+        "electricity_kwh": (biogas * KWH_PER_M3).round(0),
+    })
+    return capacity, production
+
+
+# === Farm folder ===
+def generate_farm(folder, cows=500, days=730, seed=0, end=END_DATE):
+    # -> {file name: rows}
+    rng = np.random.default_rng(seed)
+    os.makedirs(folder, exist_ok=True)
+    dates = _dates(end, days)
+
+    weather = make_weather(rng, dates)
+    herd, stalls = make_cows(rng, cows, dates)
+    lactating, dry, litres = write_milk(rng, folder, stalls, dates, weather)
+    treatments = make_treatments(rng, stalls, dates)
+    manure = make_manure(rng, dates, lactating, dry, litres)
+    capacity, production = make_biogas(rng, dates, manure)
+
+    tables = {
+        "cows.csv": herd,
+        "treatments.csv": treatments,
+        "manure.csv": manure,
+        "biogas_capacity.csv": capacity,
+        "biogas_production.csv": production,
+        "weather.csv": weather,
+    }
+    for name, df in tables.items():
+        _write(df, os.path.join(folder, name))
+    rows = {name: len(df) for name, df in tables.items()}
+    rows["milk_yield.csv"] = int(lactating.sum())
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic farm folder for load and scale testing.")
+    parser.add_argument("farm", help="farm name; the folder is created under --base")
+    parser.add_argument("--cows", type=int, default=500)
+    parser.add_argument("--years", type=float, default=2)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--end", default=END_DATE, help="last day of data (YYYY-MM-DD)")
+    parser.add_argument("--base", default=FOLDER_BASE)
+    args = parser.parse_args()
+
+    folder = os.path.join(args.base, args.farm.replace(" ", "_"))
+    started = time.monotonic()
+    rows = generate_farm(folder, args.cows, round(args.years * 365), args.seed, args.end)
+    for name, count in rows.items():
+        print(f"{name:<24} {count:>12,} rows")
+    print(f"✅ {folder} in {time.monotonic() - started:.1f} s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import pandas as pd
+
+from farm_cache import cached
+from farm_files import METRICS_NAME
+
+# === Per-stage latency and token usage of assistant calls ===
+# Every analysis appends one JSON line to <farm folder>/metrics.jsonl with
+# its stage timings (seconds), the run's token usage and the estimated cost.
+# Stages: queue (waiting for a job worker), upload, setup (thread and
+# message), run (code interpreter until the run ends), fetch (answer
+# message) and total.
+STAGES = ["queue", "upload", "setup", "run", "fetch", "total"]
+
+# USD per 1M input / output tokens
+MODEL_PRICES = {
+    "gpt-4o": (2.50, 10.00),
+    "gpt-4o-mini": (0.15, 0.60),
+}
+
+_lock = threading.Lock()
+
+
+@contextmanager
+def timed(stages, name):
+    # Adds the time spent in the block to stages[name]; stages may be None
+    started = time.monotonic()
+    try:
+        yield
+    finally:
+        if stages is not None:
+            stages[name] = stages.get(name, 0.0) + time.monotonic() - started
+
+
+def run_cost(model, usage):
+    prices = next((p for name, p in sorted(MODEL_PRICES.items(), reverse=True) if model and model.startswith(name)), None)
+    if prices is None or usage is None:
+        return None
+    return (usage.prompt_tokens * prices[0] + usage.completion_tokens * prices[1]) / 1_000_000
+
+
+def record(folder, kind, stages, run=None, status="done"):
+    # kind: report key or another analysis ("forecast", "profile", ...).
+    # Answers replayed from the response cache are logged as "cached",
+    # without tokens or cost, and kept out of the latency figures.
+    usage = getattr(run, "usage", None)
+    if status == "done" and getattr(run, "cached", False):
+        status, usage = "cached", None
+    model = getattr(run, "model", None)
+    entry = {
+        "at": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "kind": kind,
+        "status": status,
+        **{stage: round(stages[stage], 3) for stage in STAGES if stage in stages},
+        "model": model,
+        "prompt_tokens": usage.prompt_tokens if usage else None,
+        "completion_tokens": usage.completion_tokens if usage else None,
+        "cost_usd": run_cost(model, usage),
+    }
+    with _lock:
+        with open(os.path.join(folder, METRICS_NAME), "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry) + "\n")
+
+
+def load_metrics(folder):
+    path = os.path.join(folder, METRICS_NAME)
+    empty = pd.DataFrame(columns=["at", "kind", "status", *STAGES])
+    if not os.path.exists(path):
+        return empty
+
+    def load():
+        # A line cut off by a crash is skipped
+        rows = []
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    rows.append(json.loads(line))
+                except ValueError:
+                    pass
+        if not rows:
+            return empty
+        df = pd.DataFrame(rows)
+        first = ["at", "kind", "status", *(stage for stage in STAGES if stage in df.columns)]
+        df = df[first + [c for c in df.columns if c not in first]]
+        df["at"] = pd.to_datetime(df["at"])
+        return df
+    return cached("metrics", path, load)
+
+
+def latency_summary(df):
+    # One row per analysis type: runs, p50/p95 of every stage, tokens and cost
+    done = df[df["status"] == "done"]
+    if done.empty:
+        return None
+    stages = [stage for stage in STAGES if stage in done.columns]
+    grouped = done.groupby("kind")
+    summary = grouped.size().to_frame("runs")
+    for stage in stages:
+        summary[f"{stage}_p50_s"] = grouped[stage].quantile(0.5)
+        summary[f"{stage}_p95_s"] = grouped[stage].quantile(0.95)
+    for column in ["prompt_tokens", "completion_tokens", "cost_usd"]:
+        if column in done.columns:
+            summary[f"avg_{column}"] = grouped[column].mean()
+    if "cost_usd" in done.columns:
+        summary["total_cost_usd"] = grouped["cost_usd"].sum()
+
+    def count(rows):
+        return rows.groupby("kind").size().reindex(summary.index).fillna(0).astype(int)
+    summary["cached"] = count(df[df["status"] == "cached"])
+    summary["failed"] = count(df[~df["status"].isin(["done", "cached"])])
+    return summary.rename_axis("analysis").reset_index().round(4)
+
+
+def daily_trend(df, column, quantile=None):
+    # date x analysis type table of the daily quantile (or sum) of a column
+    done = df[df["status"] == "done"]
+    if done.empty or column not in done.columns:
+        return None
+    grouped = done.groupby([done["at"].dt.date.rename("date"), "kind"])[column]
+    values = grouped.quantile(quantile) if quantile is not None else grouped.sum()
+    return values.unstack("kind")
@@ -1,10 +1,19 @@
 import streamlit as st
 import json
 import os
-import openai
-import time
 import re
 
+import openai
+
+from assistant_registry import registered_assistant_id
+from assistant_runs import RunNotCompleted
+from farm_cache import cached_json, cached_listdir, cached_text
+from farm_context import run_prompt
+from farm_files import PROFILE_NAME
+from farm_metrics import record, timed
+from response_cache import CacheMiss
+from ui_components import upload_progress
+
 # === Load current farm context ===
 farm_name = st.session_state.get("farm_name")
 FOLDER_BASE = "streamlet/farm_data"
@@ -14,8 +23,11 @@ if not farm_name:
     st.stop()
 
 FOLDER = os.path.join(FOLDER_BASE, farm_name.replace(" ", "_"))
-profile_path = os.path.join(FOLDER, "profile.json")
+profile_path = os.path.join(FOLDER, PROFILE_NAME)
 weather_path = os.path.join(FOLDER, "weather_summary.txt")
+# A recorded weather answer is reused for a few hours only
+WEATHER_MAX_AGE_S = 3 * 3600
+agent_id = registered_assistant_id() or st.secrets["dairy_sustainability_agent"]["id"]
 
 st.title("🌍 Farm Profile & Weather Info")
 
@@ -23,27 +35,15 @@ st.title("🌍 Farm Profile & Weather Info")
 if not os.path.exists(profile_path):
     st.info("🧠 Generating farm profile using uploaded CSV files...")
     
-    csv_files = [f for f in os.listdir(FOLDER) if f.endswith(".csv")]
+    csv_files = [f for f in cached_listdir(FOLDER) if f.endswith(".csv")]
     if not csv_files:
         st.warning("No CSV files found in the farm folder.")
         st.stop()
 
-    # Upload all CSVs as attachments
-    attachments = []
-    for f in csv_files:
-        file_path = os.path.join(FOLDER, f)
-        file = openai.files.create(file=open(file_path, "rb"), purpose="assistants")
-        attachments.append({
-            "file_id": file.id,
-            "tools": [{"type": "code_interpreter"}]
-        })
-
-    thread = openai.beta.threads.create()
-
-    openai.beta.threads.messages.create(
-        thread_id=thread.id,
-        role="user",
-        content="""
+    # The CSVs go into the farm's assistant thread, which later reports reuse
+    # (unchanged files keep their cached file_id)
+    paths = [os.path.join(FOLDER, f) for f in csv_files]
+    prompt = """
 You are a dairy farm assistant. Based on the uploaded farm CSVs, generate a farm profile with the following JSON structure:
 
 {
@@ -54,41 +54,35 @@ You are a dairy farm assistant. Based on the uploaded farm CSVs, generate a farm
 }
 
 Respond ONLY with valid JSON. Do not include any explanation, text, or markdown.
-""",
-        attachments=attachments
-    )
-
-    run = openai.beta.threads.runs.create(
-        thread_id=thread.id,
-        assistant_id=st.secrets["dairy_sustainability_agent"]["id"]
-    )
+"""
 
+    stages = {}
     with st.spinner("🤖 Processing files and creating profile..."):
-        while run.status not in ["completed", "failed"]:
-            time.sleep(1)
-            run = openai.beta.threads.runs.retrieve(run.id, thread_id=thread.id)
-
-    messages = openai.beta.threads.messages.list(thread_id=thread.id)
-    for msg in messages.data[::-1]:
-        if msg.role == "assistant":
-            match = re.search(r"\{[\s\S]*?\}", msg.content[0].text.value)
-            if match:
-                try:
-                    profile = json.loads(match.group(0))
-                    with open(profile_path, "w") as f:
-                        json.dump(profile, f, indent=2)
-                    st.success("✅ Farm profile generated successfully.")
-                except Exception as e:
-                    st.error(f"Failed to parse JSON from assistant: {e}")
-            break
+        try:
+            with timed(stages, "total"):
+                answer, run = run_prompt(FOLDER, prompt, paths, agent_id, progress=upload_progress(len(paths)), stages=stages)
+        except (RunNotCompleted, CacheMiss, openai.APIError) as e:
+            record(FOLDER, "profile", stages, getattr(e, "run", None), "failed")
+            st.error(f"❌ {e}")
+            st.stop()
+    record(FOLDER, "profile", stages, run)
+
+    match = re.search(r"\{[\s\S]*?\}", answer)
+    if match:
+        try:
+            profile = json.loads(match.group(0))
+            with open(profile_path, "w") as f:
+                json.dump(profile, f, indent=2)
+            st.success("✅ Farm profile generated successfully.")
+        except Exception as e:
+            st.error(f"Failed to parse JSON from assistant: {e}")
 
 # === Display profile ===
 if not os.path.exists(profile_path):
     st.warning("Farm profile could not be generated.")
     st.stop()
 
-with open(profile_path) as f:
-    profile = json.load(f)
+profile = cached_json(profile_path)
 
 st.markdown(f"📍 **Location**: {profile.get('location', 'N/A')}")
 st.markdown(f"🐄 **Number of animals**: {profile.get('num_animals', 'N/A')}")
@@ -101,42 +95,26 @@ if profile.get("location"):
     st.subheader("☁️ Weather Summary")
 
     if os.path.exists(weather_path):
-        with open(weather_path) as f:
-            summary = f.read()
+        summary = cached_text(weather_path)
         st.success(summary)
     else:
-        thread = openai.beta.threads.create()
-
-        file_uploaded = openai.files.create(file=open(profile_path, "rb"), purpose="assistants")
-
-        openai.beta.threads.messages.create(
-            thread_id=thread.id,
-            role="user",
-            content="""
+        prompt = """
 You are a sustainability assistant. Based on the uploaded JSON farm profile, generate a short weather and climate summary relevant for dairy farming.
 Keep it in English and return only a short paragraph. No markdown.
-""",
-            attachments=[{
-                "file_id": file_uploaded.id,
-                "tools": [{"type": "code_interpreter"}]
-            }]
-        )
-
-        run = openai.beta.threads.runs.create(
-            thread_id=thread.id,
-            assistant_id=st.secrets["dairy_sustainability_agent"]["id"]
-        )
+"""
 
+        stages = {}
         with st.spinner("⛅ Generating weather report..."):
-            while run.status not in ["completed", "failed"]:
-                time.sleep(1)
-                run = openai.beta.threads.runs.retrieve(run.id, thread_id=thread.id)
-
-        messages = openai.beta.threads.messages.list(thread_id=thread.id)
-        for msg in messages.data[::-1]:
-            if msg.role == "assistant":
-                summary = msg.content[0].text.value.strip()
-                st.success(summary)
-                with open(weather_path, "w") as f:
-                    f.write(summary)
-                break
+            try:
+                with timed(stages, "total"):
+                    summary, run = run_prompt(FOLDER, prompt, [profile_path], agent_id, stages=stages, max_age_s=WEATHER_MAX_AGE_S)
+            except (RunNotCompleted, CacheMiss, openai.APIError) as e:
+                record(FOLDER, "weather_summary", stages, getattr(e, "run", None), "failed")
+                st.error(f"❌ {e}")
+                st.stop()
+        record(FOLDER, "weather_summary", stages, run)
+        summary = summary.strip()
+
+        st.success(summary)
+        with open(weather_path, "w") as f:
+            f.write(summary)
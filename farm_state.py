@@ -0,0 +1,351 @@
+import hashlib
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+
+from farm_cache import cached, cached_listdir
+from farm_data import csv_header, detect_kind, load_tables, read_csv_tail
+from milk_forecast import WINDOW, daily_matrix, holt_update
+
+# === Incremental per-farm state ===
+# Milk and treatment CSVs are append-only, so each refresh reads only the
+# bytes added after the stored watermark of every file and merges those rows
+# into additive intermediate tables:
+#   cow_month   milk per cow and month (recorded days, litres, income parts)
+#   day         herd milk per day
+#   recent      cow-day totals of the last RECENT_DAYS days
+#   holt        Holt level/trend per cow up to its last day before recent
+#   herd_holt   Holt level/trend of the herd up to holt_until
+#   treat       treatments per cow, month and diagnosis
+#   treat_day   treatments started per day
+# KPIs, report summaries and the forecast are computed from these, so a daily
+# refresh costs in proportion to the new rows. Anything that is not a plain
+# append (a file replaced, shrunk or removed, or rows dated before the recent
+# window) rebuilds the state from all rows.
+STATE_FILE = os.path.join("aggregates", "farm_state.pkl")
+# 3: numeric antibiotic flags with blank cells were not counted
+STATE_VERSION = 3
+
+# Cow-day totals kept exactly: the forecast compares the last two windows
+RECENT_DAYS = 2 * WINDOW
+
+# Bytes at the start of a file and before its watermark that must be
+# unchanged for new rows to count as an append
+CHECK_BYTES = 4096
+
+INCREMENTAL_KINDS = ("milk", "treatments")
+COW_COLUMNS = {"cows": {"cow_id", "birth_date", "lactation_number", "breed"}}
+
+ANTIBIOTIC_PATTERN = r"cillin|mycin|cef|tetracycl|sulfa|floxacin|amoxi|penic|trimethoprim|colistin"
+
+_lock = threading.Lock()
+
+
+class _NotAppended(Exception):
+    pass
+
+
+def antibiotic_mask(treatments):
+    if "antibiotic" in treatments.columns:
+        flags = treatments["antibiotic"]
+        # A 0/1 column with blank cells loads as float (1.0)
+        if pd.api.types.is_numeric_dtype(flags):
+            return (pd.to_numeric(flags, errors="coerce").fillna(0) > 0).to_numpy()
+        flags = flags.astype(str).str.strip().str.lower()
+        return flags.isin(["1", "true", "yes", "y", "ano"]).to_numpy()
+    if "medicine" in treatments.columns:
+        return treatments["medicine"].astype(str).str.contains(ANTIBIOTIC_PATTERN, case=False, regex=True).to_numpy()
+    return np.zeros(len(treatments), dtype=bool)
+
+
+def treatment_days(treatments):
+    if "duration_days" in treatments.columns:
+        return pd.to_numeric(treatments["duration_days"], errors="coerce")
+    if "end_date" in treatments.columns:
+        # Start and end day both count as treatment days
+        return (treatments["end_date"] - treatments["start_date"]).dt.days + 1
+    return pd.Series(np.nan, index=treatments.index)
+
+
+def month_of(dates):
+    # Truncating the datetime64 values is much faster than formatting every row
+    return pd.Series(dates.to_numpy().astype("datetime64[M]"), index=dates.index, name="month")
+
+
+def _empty_state():
+    return {
+        "version": STATE_VERSION,
+        "files": {},
+        "cow_month": pd.DataFrame(columns=["cow_id", "month", "days", "milk_yield", "income_priced", "yield_unpriced"]),
+        "day": pd.DataFrame(columns=["date", "herd_yield", "income_priced", "yield_unpriced", "cows_milked"]),
+        "recent": pd.DataFrame(columns=["cow_id", "date", "milk_yield"]),
+        "holt": pd.DataFrame(columns=["cow_id", "level", "trend", "last"]),
+        "herd_holt": (np.nan, 0.0),
+        "holt_until": None,
+        "treat": pd.DataFrame(columns=[
+            "cow_id", "month", "label", "treatments", "antibiotic_treatments",
+            "days_sum", "days_count", "cost", "last_treatment",
+        ]),
+        "treat_day": pd.DataFrame(columns=["date", "treatments_started", "antibiotic_treatments"]),
+        "label": None,
+    }
+
+
+def _add(table, new, keys, agg="sum"):
+    # Merges partial sums of new rows into a stored table
+    combined = new if table.empty else pd.concat([table, new], ignore_index=True)
+    return combined.groupby(keys, as_index=False, dropna=False).agg(agg)
+
+
+# --- Milk ---
+def _cow_days(milk):
+    # New milk rows -> one row per cow and day. Income is split into priced
+    # litres and litres without a price, which get the default price later.
+    dates = pd.to_datetime(milk["date"], errors="coerce").dt.normalize()
+    milk = milk[dates.notna()]
+    yields = pd.to_numeric(milk["milk_yield"], errors="coerce").fillna(0.0)
+    if "milk_price" in milk.columns:
+        price = pd.to_numeric(milk["milk_price"], errors="coerce")
+    else:
+        price = pd.Series(np.nan, index=milk.index)
+    rows = pd.DataFrame({
+        "cow_id": milk["cow_id"].astype(str),
+        "date": dates[dates.notna()],
+        "milk_yield": yields,
+        "income_priced": (yields * price).fillna(0.0),
+        "yield_unpriced": yields.where(price.isna(), 0.0),
+    })
+    return rows.groupby(["cow_id", "date"], as_index=False).sum()
+
+
+def _fold(holt, old):
+    # Runs Holt's smoothing per cow over its days that leave the recent
+    # window; "last" is the latest day folded for each cow
+    dates = pd.DatetimeIndex(np.sort(old["date"].unique()))
+    stored = holt.set_index("cow_id")
+    cow_ids = stored.index.union(pd.Index(old["cow_id"].unique()))
+    level = stored["level"].reindex(cow_ids).to_numpy(dtype=float, copy=True)
+    trend = stored["trend"].reindex(cow_ids).fillna(0.0).to_numpy(dtype=float, copy=True)
+    holt_update(daily_matrix(old, cow_ids, dates), level, trend)
+    last = old.groupby("cow_id")["date"].max().reindex(cow_ids).fillna(pd.to_datetime(stored["last"]).reindex(cow_ids))
+    return pd.DataFrame({"cow_id": cow_ids, "level": level, "trend": trend, "last": last.to_numpy()})
+
+
+def _merge_milk(state, milk, fold=True):
+    # fold=False keeps all days in recent; _fold_cows() then folds them at once
+    new = _cow_days(milk)
+    if new.empty:
+        return state
+    if state["holt_until"] is not None and new["date"].min() <= state["holt_until"]:
+        raise _NotAppended
+    # Rows only need to be in date order per cow, e.g. exports written cow by cow
+    last = pd.to_datetime(state["holt"].set_index("cow_id")["last"]).reindex(new["cow_id"]).to_numpy()
+    if (new["date"].to_numpy() <= last).any():
+        raise _NotAppended
+
+    # A cow-day already in the recent window is not a newly recorded day
+    seen = new.merge(state["recent"][["cow_id", "date"]], on=["cow_id", "date"], how="left", indicator=True)
+    new["days"] = (seen["_merge"] == "left_only").astype(int).to_numpy()
+    new["month"] = month_of(new["date"])
+
+    sums = ["milk_yield", "income_priced", "yield_unpriced"]
+    cow_month = _add(state["cow_month"], new.groupby(["cow_id", "month"], as_index=False)[["days"] + sums].sum(), ["cow_id", "month"])
+    per_day = new.groupby("date", as_index=False).agg(
+        herd_yield=("milk_yield", "sum"),
+        income_priced=("income_priced", "sum"),
+        yield_unpriced=("yield_unpriced", "sum"),
+        cows_milked=("days", "sum"),
+    )
+    day = _add(state["day"], per_day, ["date"])
+    recent = _add(state["recent"], new[["cow_id", "date", "milk_yield"]], ["cow_id", "date"])
+    state = dict(state, cow_month=cow_month, day=day, recent=recent)
+    return _fold_cows(state) if fold else state
+
+
+def _fold_cows(state):
+    # Moves the cow-days before the recent window into the Holt state
+    recent = state["recent"]
+    if recent.empty:
+        return state
+    cutoff = recent["date"].max() - pd.Timedelta(days=RECENT_DAYS - 1)
+    old = recent[recent["date"] < cutoff]
+    if old.empty:
+        return state
+    recent = recent[recent["date"] >= cutoff].reset_index(drop=True)
+    return dict(state, recent=recent, holt=_fold(state["holt"], old))
+
+
+def _fold_herd(state):
+    # Herd totals of a day are complete once a refresh has read all rows, so
+    # the herd's smoothing is continued at the end of each refresh
+    day = state["day"]
+    if day.empty:
+        return state
+    cutoff = day["date"].max() - pd.Timedelta(days=RECENT_DAYS - 1)
+    dates = day["date"][day["date"] < cutoff]
+    if state["holt_until"] is not None:
+        dates = dates[dates > state["holt_until"]]
+    herd_level, herd_trend = np.array([state["herd_holt"][0]]), np.array([state["herd_holt"][1]])
+    herd_row = day.set_index("date")["herd_yield"].reindex(np.sort(dates.unique())).to_numpy(dtype=float)[None, :]
+    holt_update(herd_row, herd_level, herd_trend)
+    return dict(state, herd_holt=(float(herd_level[0]), float(herd_trend[0])), holt_until=cutoff - pd.Timedelta(days=1))
+
+
+# --- Treatments ---
+def _merge_treatments(state, treatments):
+    treatments = treatments.copy()
+    treatments["start_date"] = pd.to_datetime(treatments["start_date"], errors="coerce")
+    if "end_date" in treatments.columns:
+        treatments["end_date"] = pd.to_datetime(treatments["end_date"], errors="coerce")
+    days = treatment_days(treatments)
+    label = state["label"] or next((c for c in ("diagnosis", "medicine") if c in treatments.columns), None)
+    cost = pd.to_numeric(treatments["cost"], errors="coerce") if "cost" in treatments.columns else pd.Series(0.0, index=treatments.index)
+
+    rows = pd.DataFrame({
+        "cow_id": treatments["cow_id"].astype(str),
+        "month": month_of(treatments["start_date"]),
+        "label": treatments[label].fillna("unknown").astype(str) if label in treatments.columns else "unknown",
+        "treatments": 1,
+        "antibiotic_treatments": antibiotic_mask(treatments).astype(int),
+        "days_sum": days.fillna(0.0),
+        "days_count": days.notna().astype(int),
+        "cost": cost.fillna(0.0),
+        "last_treatment": treatments["start_date"],
+    })
+    agg = {c: "sum" for c in ["treatments", "antibiotic_treatments", "days_sum", "days_count", "cost"]}
+    treat = _add(state["treat"], rows, ["cow_id", "month", "label"], dict(agg, last_treatment="max"))
+
+    started = rows.dropna(subset=["last_treatment"])
+    per_day = started.groupby(started["last_treatment"].dt.normalize().rename("date")).agg(
+        treatments_started=("treatments", "sum"),
+        antibiotic_treatments=("antibiotic_treatments", "sum"),
+    ).reset_index()
+    treat_day = _add(state["treat_day"], per_day, ["date"])
+    return dict(state, treat=treat, treat_day=treat_day, label=label)
+
+
+# --- Files and watermarks ---
+def table_kind(path):
+    # Kind of a farm CSV from its header line only
+    columns, _ = cached("header", path, lambda: csv_header(path))
+    return detect_kind(columns)
+
+
+def _table_files(folder):
+    # name -> (kind, columns, offset of the first data row) for the farm tables
+    found = {}
+    for name in cached_listdir(folder):
+        if name.endswith(".csv"):
+            path = os.path.join(folder, name)
+            columns, header_end = cached("header", path, lambda: csv_header(path))
+            kind = detect_kind(columns)
+            if kind:
+                found[name] = (kind, columns, header_end)
+    return found
+
+
+def _check(path, offset):
+    with open(path, "rb") as f:
+        head = f.read(min(CHECK_BYTES, offset))
+        start = max(offset - CHECK_BYTES, 0)
+        f.seek(start)
+        tail = f.read(offset - start)
+    return hashlib.sha256(head + tail).hexdigest()
+
+
+def _append(folder, state, tables, fold=True):
+    # -> (state, changed); raises _NotAppended when a rebuild is needed
+    if state is None or state.get("version") != STATE_VERSION:
+        raise _NotAppended
+    for name, mark in state["files"].items():
+        if name not in tables or tables[name][0] != mark["kind"]:
+            raise _NotAppended
+
+    files = dict(state["files"])
+    for name, (kind, columns, header_end) in tables.items():
+        if kind not in INCREMENTAL_KINDS:
+            continue
+        path = os.path.join(folder, name)
+        stat = os.stat(path)
+        mark = files.get(name)
+        if mark and (mark["size"], mark["mtime_ns"]) == (stat.st_size, stat.st_mtime_ns):
+            continue
+        offset = header_end
+        if mark:
+            if stat.st_size < mark["offset"] or _check(path, mark["offset"]) != mark["check"]:
+                raise _NotAppended
+            offset = mark["offset"]
+
+        # New rows are merged chunk by chunk, so memory does not grow with
+        # the file; the watermark stops before a partly written last line
+        offset, chunks = read_csv_tail(path, offset, columns)
+        if kind == "milk":
+            carry = None
+            for rows in chunks:
+                # The last cow's rows wait for the next chunk, which may hold
+                # more milkings of its last day
+                rows = rows if carry is None else pd.concat([carry, rows], ignore_index=True)
+                last_cow = rows["cow_id"].astype(str).eq(str(rows["cow_id"].iloc[-1])).to_numpy()
+                carry = rows[last_cow]
+                state = _merge_milk(state, rows[~last_cow], fold)
+            if carry is not None:
+                state = _merge_milk(state, carry, fold)
+        else:
+            for rows in chunks:
+                state = _merge_treatments(state, rows)
+        files[name] = {
+            "kind": kind,
+            "offset": offset,
+            "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+            "check": _check(path, offset),
+        }
+
+    if files == state["files"]:
+        return state, False
+    if not fold:
+        state = _fold_cows(state)
+    return dict(_fold_herd(state), files=files), True
+
+
+def _load_state(path):
+    if not os.path.exists(path):
+        return None
+    try:
+        return cached("state", path, lambda: pd.read_pickle(path))
+    except Exception:
+        # Unreadable state (e.g. written by another pandas version): rebuild
+        return None
+
+
+def _save_state(path, state):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + ".tmp"
+    pd.to_pickle(state, tmp_path)
+    os.replace(tmp_path, path)
+
+
+def refresh_state(folder):
+    # Brings the farm state up to date with its CSVs and returns it, with the
+    # cow master data (small, read whole) under "cows". The returned tables
+    # are shared: callers must not modify them in place.
+    path = os.path.join(folder, STATE_FILE)
+    with _lock:
+        tables = _table_files(folder)
+        try:
+            state, changed = _append(folder, _load_state(path), tables)
+        except _NotAppended:
+            try:
+                state = _append(folder, _empty_state(), tables)[0]
+            except _NotAppended:
+                # A cow's milk rows out of date order (e.g. split over two
+                # robots' files): keep every day in recent and fold at the end
+                state = _append(folder, _empty_state(), tables, fold=False)[0]
+            changed = True
+        if changed:
+            _save_state(path, state)
+
+    cow_files = [os.path.join(folder, name) for name, (kind, _, _) in tables.items() if kind == "cows"]
+    return dict(state, cows=load_tables(cow_files, COW_COLUMNS).get("cows"))
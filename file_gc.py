@@ -0,0 +1,246 @@
+import argparse
+import json
+import os
+import time
+
+import openai
+from dotenv import load_dotenv
+
+from assistant_runs import DEFAULT_TIMEOUT
+from farm_context import load_context, save_context
+from farm_files import REGISTRY_NAME
+from openai_client import delete_file, list_files
+from run_all_reports import FOLDER_BASE
+from run_fleet import list_farms
+from upload_cache import REMOTE_LOG_NAME, load_registry, save_registry
+
+# === Garbage collector for the files uploaded to OpenAI ===
+# Every upload is kept on the OpenAI side until it is deleted. The log
+# written by upload_cache.py (<farm base>/remote_files.jsonl) holds each
+# remote file with its farm, sha256, size and last use. A collection
+#   1. deletes files no farm refers to any more (older versions of a farm
+#      file), then
+#   2. while the rest exceeds the storage budget, the least recently used
+#      ones; their farms upload them again when next needed.
+# Files used in the last IN_USE_S may belong to a running analysis and are
+# never deleted, nor are the thread files of their farm; the log is checked
+# again right before each delete. Deleted files are dropped from the farm's
+# uploaded_files.json and assistant_context.json. A run that still picked up
+# a deleted file uploads it again (farm_context.ask_with_files).
+#
+#   python file_gc.py --budget-mb 2048 --dry-run
+STORAGE_BUDGET_BYTES = 10 * 1024 ** 3
+
+# Longer than any run may take, including its upload
+IN_USE_S = 2 * DEFAULT_TIMEOUT
+
+
+def load_remote_files(base=FOLDER_BASE):
+    # -> ({file_id: {"farm", "sha256", "bytes", "uploaded_at", "last_used_at"}},
+    #     bytes of the log read)
+    path = os.path.join(base, REMOTE_LOG_NAME)
+    files = {}
+    if not os.path.exists(path):
+        return files, 0
+    with open(path, "rb") as f:
+        data = f.read()
+    for line in data.splitlines():
+        # A line cut off by a crash is skipped
+        try:
+            event = json.loads(line)
+        except ValueError:
+            continue
+        if event["event"] == "delete":
+            files.pop(event["file_id"], None)
+            continue
+        entry = files.setdefault(event["file_id"], {
+            "farm": event["farm"],
+            "sha256": event.get("sha256"),
+            "bytes": event.get("bytes", 0),
+            "uploaded_at": None,
+            "last_used_at": event["at"],
+        })
+        if event["event"] == "upload":
+            entry["uploaded_at"] = event["at"]
+        entry["last_used_at"] = max(entry["last_used_at"], event["at"])
+    return files, len(data)
+
+
+def _log_lines(file_id, entry):
+    lines = []
+    if entry["uploaded_at"] is not None:
+        lines.append({"event": "upload", "file_id": file_id, "sha256": entry["sha256"], "bytes": entry["bytes"],
+                      "farm": entry["farm"], "at": entry["uploaded_at"]})
+    if entry["uploaded_at"] is None or entry["last_used_at"] > entry["uploaded_at"]:
+        lines.append({"event": "use", "file_id": file_id, "sha256": entry["sha256"], "bytes": entry["bytes"],
+                      "farm": entry["farm"], "at": entry["last_used_at"]})
+    return lines
+
+
+def used_since(base, offset):
+    # file_ids logged after the first `offset` bytes of the log
+    try:
+        with open(os.path.join(base, REMOTE_LOG_NAME), "rb") as f:
+            f.seek(offset)
+            data = f.read()
+    except OSError:
+        return set()
+    used = set()
+    for line in data.splitlines():
+        try:
+            used.add(json.loads(line)["file_id"])
+        except (ValueError, KeyError):
+            continue
+    return used
+
+
+def save_remote_files(base, files, offset):
+    # Rewrites the log with the live files only; lines the app appended after
+    # the first `offset` bytes were read are carried over
+    path = os.path.join(base, REMOTE_LOG_NAME)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as out:
+        for file_id, entry in files.items():
+            out.write("".join(json.dumps(line) + "\n" for line in _log_lines(file_id, entry)).encode())
+        if os.path.exists(path):
+            with open(path, "rb") as f:
+                f.seek(offset)
+                out.write(f.read())
+    os.replace(tmp_path, path)
+
+
+def _farm_references(base, farms, files):
+    # -> {farm: ids in its upload registry}, {farm: ids of its thread}.
+    # Registry entries from before the log existed are added to files, with
+    # the registry's mtime as their last use.
+    uploaded, threads = {}, {}
+    for farm in farms:
+        folder = os.path.join(base, farm)
+        registry = load_registry(folder)
+        if registry:
+            last_used = os.path.getmtime(os.path.join(folder, REGISTRY_NAME))
+        for entry in registry.values():
+            files.setdefault(entry["file_id"], {
+                "farm": farm, "sha256": entry["sha256"], "bytes": entry["size"],
+                "uploaded_at": None, "last_used_at": last_used,
+            })
+        uploaded[farm] = {entry["file_id"] for entry in registry.values()}
+        threads[farm] = set(load_context(folder).get("files", {}).values())
+    return uploaded, threads
+
+
+def plan_collection(files, uploaded, threads, budget_bytes=STORAGE_BUDGET_BYTES, now=None):
+    # -> (file ids to delete, file ids kept as in use)
+    now = time.time() if now is None else now
+    in_use = {file_id for file_id, entry in files.items() if now - entry["last_used_at"] < IN_USE_S}
+    for farm in {files[file_id]["farm"] for file_id in in_use}:
+        in_use |= threads.get(farm, set())
+    referenced = set().union(*uploaded.values(), *threads.values())
+
+    idle = sorted((file_id for file_id in files if file_id not in in_use), key=lambda file_id: files[file_id]["last_used_at"])
+    doomed = [file_id for file_id in idle if file_id not in referenced]
+    total = sum(entry["bytes"] for file_id, entry in files.items() if file_id not in doomed)
+    for file_id in idle:
+        if total <= budget_bytes:
+            break
+        if file_id in referenced:
+            doomed.append(file_id)
+            total -= files[file_id]["bytes"]
+    return doomed, in_use
+
+
+def _forget(folder, deleted):
+    # Drops deleted files from a farm's upload registry and thread context,
+    # read again now: an upload that overlapped the collection may have
+    # written a deleted file_id back
+    registry = load_registry(folder)
+    kept = {name: entry for name, entry in registry.items() if entry["file_id"] not in deleted}
+    if len(kept) < len(registry):
+        save_registry(folder, kept)
+    context = load_context(folder)
+    names = context.get("files", {})
+    if any(file_id in deleted for file_id in names.values()):
+        context["files"] = {name: file_id for name, file_id in names.items() if file_id not in deleted}
+        save_context(folder, context)
+
+
+def collect(base=FOLDER_BASE, budget_bytes=STORAGE_BUDGET_BYTES, dry_run=False, orphans=False):
+    # -> {"files", "bytes", "in_use", "reused", "deleted", "deleted_bytes", "orphans", "failed"}
+    files, offset = load_remote_files(base)
+    farms = list_farms(base) if os.path.isdir(base) else []
+    uploaded, threads = _farm_references(base, farms, files)
+
+    if orphans:
+        # The account's file list: forget files that are gone (expired or
+        # deleted elsewhere), collect old ones the log does not know
+        remote = {file.id: file for file in list_files()}
+        gone = {file_id for file_id in files if file_id not in remote}
+        files = {file_id: entry for file_id, entry in files.items() if file_id in remote}
+        unknown = [file_id for file_id, file in remote.items()
+                   if file_id not in files and time.time() - file.created_at >= IN_USE_S]
+    else:
+        gone, unknown = set(), []
+
+    doomed, in_use = plan_collection(files, uploaded, threads, budget_bytes)
+    summary = {
+        "files": len(files),
+        "bytes": sum(entry["bytes"] for entry in files.values()),
+        "in_use": len(in_use & set(files)),
+        "reused": 0,
+        "deleted": 0,
+        "deleted_bytes": 0,
+        "orphans": len(unknown),
+        "failed": {},
+    }
+    deleted = set(gone)
+    for file_id in doomed + unknown:
+        # Used since the log was read, e.g. by an analysis that just started
+        if file_id in used_since(base, offset):
+            summary["reused"] += 1
+            continue
+        if not dry_run:
+            try:
+                delete_file(file_id)
+            except openai.NotFoundError:
+                pass
+            except openai.APIError as e:
+                summary["failed"][file_id] = str(e)
+                continue
+        deleted.add(file_id)
+        summary["deleted"] += 1
+        summary["deleted_bytes"] += files[file_id]["bytes"] if file_id in files else remote[file_id].bytes
+    if dry_run:
+        return summary
+
+    for farm in farms:
+        if deleted & (uploaded[farm] | threads[farm]):
+            _forget(os.path.join(base, farm), deleted)
+    if os.path.isdir(base):
+        save_remote_files(base, {file_id: entry for file_id, entry in files.items() if file_id not in deleted}, offset)
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Delete unused files uploaded to OpenAI.")
+    parser.add_argument("--base", default=FOLDER_BASE, help="folder holding the farm folders")
+    parser.add_argument("--budget-mb", type=float, default=STORAGE_BUDGET_BYTES / 1024 / 1024,
+                        help="remote storage kept for the farms; least recently used files beyond it are deleted")
+    parser.add_argument("--orphans", action="store_true",
+                        help="also delete account files the app has no record of (e.g. from before the log)")
+    parser.add_argument("--dry-run", action="store_true", help="only report what would be deleted")
+    args = parser.parse_args()
+
+    # OPENAI_API_KEY comes from the environment or a .env file
+    load_dotenv()
+    summary = collect(args.base, int(args.budget_mb * 1024 * 1024), args.dry_run, args.orphans)
+
+    mb = 1024 * 1024
+    verb = "Would delete" if args.dry_run else "Deleted"
+    print(f"Remote files: {summary['files']} ({summary['bytes'] / mb:.1f} MB), {summary['in_use']} in use, {summary['reused']} used during the collection")
+    print(f"{verb} {summary['deleted']} files ({summary['deleted_bytes'] / mb:.1f} MB), {summary['orphans']} without a record")
+    for file_id, error in summary["failed"].items():
+        print(f"  ❌ {file_id}: {error}")
+
+
+if __name__ == "__main__":
+    main()
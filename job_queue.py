@@ -0,0 +1,210 @@
+import asyncio
+import json
+import os
+import threading
+import time
+import uuid
+
+from farm_aggregates import aggregate_note, report_inputs
+from farm_context import run_prompt_async
+from farm_files import JOBS_NAME
+from farm_metrics import record
+from openai_async import submit
+from reports import REPORTS, build_prompt, save_report
+from run_all_reports import ALL_REPORTS, run_all_reports_async
+from upload_cache import input_hashes, list_data_files
+
+# === Background analysis jobs ===
+# Report jobs run as coroutines on the process-wide event loop
+# (openai_async.py), outside the Streamlit script run; waiting on a run holds
+# no thread. Each farm keeps its job table in <farm folder>/jobs.json so every
+# session (and a restarted app) sees queued/running/done status.
+MAX_RUNNING_JOBS = 8  # jobs or batches running at once, across all farms
+MAX_JOBS_KEPT = 50
+
+ACTIVE_STATUSES = {"queued", "running"}
+
+_job_slots = asyncio.Semaphore(MAX_RUNNING_JOBS)
+_lock = threading.Lock()
+_cancel_events = {}  # job id -> threading.Event, only for jobs of this process
+
+
+def _now():
+    return time.strftime("%Y-%m-%d %H:%M:%S")
+
+
+def _load_jobs(folder):
+    path = os.path.join(folder, JOBS_NAME)
+    if not os.path.exists(path):
+        return []
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            jobs = json.load(f)
+    except (OSError, ValueError):
+        return []
+
+    # Jobs left active by a previous process will never finish
+    for job in jobs:
+        if job["status"] in ACTIVE_STATUSES and job["id"] not in _cancel_events:
+            job["status"] = "failed"
+            job["error"] = "Interrupted by an app restart."
+            job["finished_at"] = job.get("finished_at") or _now()
+    return jobs
+
+
+def _save_jobs(folder, jobs):
+    path = os.path.join(folder, JOBS_NAME)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(jobs[-MAX_JOBS_KEPT:], f, indent=2, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def _update_job(folder, job_id, **changes):
+    with _lock:
+        jobs = _load_jobs(folder)
+        for job in jobs:
+            if job["id"] == job_id:
+                job.update(changes)
+        _save_jobs(folder, jobs)
+
+
+def list_jobs(folder):
+    with _lock:
+        return _load_jobs(folder)
+
+
+def get_job(folder, job_id):
+    return next((job for job in list_jobs(folder) if job["id"] == job_id), None)
+
+
+def latest_job(folder, report_key):
+    jobs = [job for job in list_jobs(folder) if job["report"] == report_key]
+    return jobs[-1] if jobs else None
+
+
+def _new_job(report_key, files, batch_id=None):
+    return {
+        "id": uuid.uuid4().hex[:12],
+        "report": report_key,
+        "batch": batch_id,
+        "status": "queued",
+        "files": [os.path.basename(path) for path in files],
+        "created_at": _now(),
+        "started_at": None,
+        "finished_at": None,
+        "duration_s": None,
+        "error": None,
+    }
+
+
+def _prepare_job(folder, report_key, files):
+    # -> (input hashes, files to attach, prompt); summaries can take a while
+    inputs = input_hashes(folder, files)
+    if REPORTS[report_key].get("attach_files", True):
+        files = report_inputs(folder, report_key, files)
+    else:
+        files = []
+    return inputs, files, build_prompt(folder, report_key) + aggregate_note(files)
+
+
+async def _run_job(folder, job_id, report_key, assistant_id, files, submitted):
+    async with _job_slots:
+        await _run_job_now(folder, job_id, report_key, assistant_id, files, submitted)
+
+
+async def _run_job_now(folder, job_id, report_key, assistant_id, files, submitted):
+    cancel_event = _cancel_events[job_id]
+    stages = {"queue": time.monotonic() - submitted}
+    run = None
+    try:
+        if cancel_event.is_set():
+            _update_job(folder, job_id, status="cancelled", finished_at=_now())
+            return
+        _update_job(folder, job_id, status="running", started_at=_now())
+        started = time.monotonic()
+        inputs, files, prompt = await asyncio.to_thread(_prepare_job, folder, report_key, files)
+        text, run = await run_prompt_async(folder, prompt, files, assistant_id, cancel_event=cancel_event, stages=stages)
+        save_report(folder, report_key, text, inputs, run, time.monotonic() - started)
+        stages["total"] = time.monotonic() - started
+        _update_job(folder, job_id, status="done", finished_at=_now(), duration_s=round(stages["total"], 1))
+        record(folder, report_key, stages, run)
+    except Exception as e:
+        status = "cancelled" if cancel_event.is_set() else "failed"
+        _update_job(folder, job_id, status=status, error=str(e), finished_at=_now())
+        record(folder, report_key, stages, getattr(e, "run", run), status)
+    finally:
+        with _lock:
+            _cancel_events.pop(job_id, None)
+
+
+async def _run_batch(folder, job_ids, assistant_id, cancel_event, submitted):
+    def on_status(report_key, status, **info):
+        stamp = {"started_at": _now()} if status == "running" else {"finished_at": _now()}
+        if status == "failed" and cancel_event.is_set():
+            status = "cancelled"
+        _update_job(folder, job_ids[report_key], status=status, **stamp, **info)
+
+    try:
+        async with _job_slots:
+            await run_all_reports_async(folder, assistant_id, list(job_ids), on_status=on_status, cancel_event=cancel_event, queued_s=time.monotonic() - submitted)
+    except Exception as e:
+        # Shared upload failed: none of the reports could start
+        for job_id in job_ids.values():
+            _update_job(folder, job_id, status="failed", error=str(e), finished_at=_now())
+    finally:
+        with _lock:
+            for job_id in job_ids.values():
+                _cancel_events.pop(job_id, None)
+
+
+def submit_job(folder, report_key, assistant_id, files=None):
+    # Queues a report job; an already queued/running job of the same type is
+    # returned instead of starting a duplicate.
+    if files is None:
+        files = list_data_files(folder)
+
+    with _lock:
+        jobs = _load_jobs(folder)
+        for job in jobs:
+            if job["report"] == report_key and job["status"] in ACTIVE_STATUSES:
+                return job
+
+        job = _new_job(report_key, files)
+        jobs.append(job)
+        _cancel_events[job["id"]] = threading.Event()
+        _save_jobs(folder, jobs)
+
+    submit(_run_job(folder, job["id"], report_key, assistant_id, files, time.monotonic()))
+    return job
+
+
+def submit_all_jobs(folder, assistant_id, report_keys=ALL_REPORTS):
+    # One batch: a shared upload and concurrent runs for every report that is
+    # not already queued or running. Cancelling one job cancels the batch.
+    files = list_data_files(folder)
+    batch_id = uuid.uuid4().hex[:12]
+    cancel_event = threading.Event()
+
+    with _lock:
+        jobs = _load_jobs(folder)
+        active = {job["report"] for job in jobs if job["status"] in ACTIVE_STATUSES}
+        job_ids = {}
+        for report_key in report_keys:
+            if report_key not in active:
+                job = _new_job(report_key, files, batch_id)
+                jobs.append(job)
+                job_ids[report_key] = job["id"]
+                _cancel_events[job["id"]] = cancel_event
+        _save_jobs(folder, jobs)
+
+    if job_ids:
+        submit(_run_batch(folder, job_ids, assistant_id, cancel_event, time.monotonic()))
+    return batch_id
+
+
+def cancel_job(folder, job_id):
+    with _lock:
+        event = _cancel_events.get(job_id)
+    if event is not None:
+        event.set()
@@ -0,0 +1,138 @@
+import numpy as np
+import pandas as pd
+
+# === Milk yield forecast for the herd and every cow ===
+# Daily yields are laid out as a cows x days matrix so rolling windows,
+# trends and Holt's linear exponential smoothing run for all cows at once.
+# Only the last two windows are kept as cow-day totals (farm_state.py); older
+# days are already folded into the stored smoothing state.
+WINDOW = 7  # days in the "recent" window
+HORIZON = 3  # days forecast ahead
+ALPHA = 0.3  # level smoothing
+BETA = 0.1  # trend smoothing
+DROP_THRESHOLD = 0.15  # recent week this much below the week before -> flagged
+
+
+def daily_matrix(cow_days, cow_ids, dates):
+    # cows x days matrix of litres from cow-day totals (cow_id, date,
+    # milk_yield), NaN where a cow has no record that day
+    rows = pd.Index(cow_ids).get_indexer(cow_days["cow_id"])
+    cols = pd.Index(dates).get_indexer(cow_days["date"])
+    keep = (rows >= 0) & (cols >= 0)
+    matrix = np.full((len(cow_ids), len(dates)), np.nan)
+    matrix[rows[keep], cols[keep]] = cow_days["milk_yield"].to_numpy()[keep]
+    return matrix
+
+
+def window_mean(matrix, end, window=WINDOW):
+    # Mean of the window days ending before column `end`, ignoring gaps
+    block = matrix[:, max(end - window, 0):end]
+    counts = np.sum(~np.isnan(block), axis=1)
+    sums = np.nansum(block, axis=1)
+    return np.divide(sums, counts, out=np.full(len(block), np.nan), where=counts > 0)
+
+
+def window_slope(matrix, window=WINDOW):
+    # Least-squares slope (litres per day) over the last window days, per row
+    block = matrix[:, -window:]
+    x = np.arange(block.shape[1], dtype=float)
+    mask = ~np.isnan(block)
+    n = mask.sum(axis=1)
+    x_mean = np.divide((mask * x).sum(axis=1), n, out=np.zeros(len(block)), where=n > 0)
+    y_mean = np.divide(np.nansum(block, axis=1), n, out=np.zeros(len(block)), where=n > 0)
+    dx = np.where(mask, x - x_mean[:, None], 0.0)
+    dy = np.where(mask, block - y_mean[:, None], 0.0)
+    denom = (dx * dx).sum(axis=1)
+    return np.divide((dx * dy).sum(axis=1), denom, out=np.full(len(block), np.nan), where=(n >= 2) & (denom > 0))
+
+
+def holt_update(matrix, level, trend, alpha=ALPHA, beta=BETA):
+    # Holt's linear method, one smoothing state per row, folded over the days
+    # (columns) of matrix in place; days without a record keep the previous
+    # level and trend
+    for t in range(matrix.shape[1]):
+        y = matrix[:, t]
+        has_y = ~np.isnan(y)
+        start = has_y & np.isnan(level)
+        level[start] = y[start]
+
+        update = has_y & ~start
+        previous = level[update]
+        level[update] = alpha * y[update] + (1 - alpha) * (previous + trend[update])
+        trend[update] = beta * (level[update] - previous) + (1 - beta) * trend[update]
+    return level, trend
+
+
+def holt_forecast(matrix, horizon=HORIZON, level=None, trend=None):
+    # Continues from a stored level/trend when given
+    level = np.full(len(matrix), np.nan) if level is None else level.copy()
+    trend = np.zeros(len(matrix)) if trend is None else trend.copy()
+    holt_update(matrix, level, trend)
+    steps = np.arange(1, horizon + 1)
+    return np.clip(level[:, None] + trend[:, None] * steps, 0.0, None)
+
+
+def forecast_milk(state, horizon=HORIZON, window=WINDOW):
+    # state: the farm state from farm_state.refresh_state
+    day = state["day"]
+    if day.empty:
+        return None
+    last_date = day["date"].max()
+    all_dates = pd.date_range(day["date"].min(), last_date, freq="D")
+    days = len(all_dates)
+
+    # --- Per cow, from the cow-day totals of the last two windows ---
+    totals = state["cow_month"].groupby("cow_id")[["days", "milk_yield"]].sum()
+    cow_ids = totals.index.to_numpy()
+    dates = pd.date_range(end=last_date, periods=2 * window, freq="D")
+    matrix = daily_matrix(state["recent"], cow_ids, dates)
+    recent = window_mean(matrix, len(dates), window)
+    previous = window_mean(matrix, window, window)
+    change = np.divide(recent - previous, previous, out=np.full(len(recent), np.nan), where=previous > 0)
+    # The smoothing state stored per cow is continued over the recent days
+    holt = state["holt"].set_index("cow_id").reindex(cow_ids)
+    cow_forecast = holt_forecast(
+        matrix, horizon, holt["level"].to_numpy(dtype=float), holt["trend"].fillna(0.0).to_numpy(dtype=float)
+    )
+
+    cows = pd.DataFrame({
+        "cow_id": cow_ids,
+        "avg_daily_yield": (totals["milk_yield"] / totals["days"]).to_numpy(dtype=float),
+        f"last_{window}d_avg": recent,
+        f"prev_{window}d_avg": previous,
+        "trend_l_per_day": window_slope(matrix, window),
+        "change_pct": 100.0 * change,
+    })
+    for step in range(horizon):
+        cows[f"forecast_day_{step + 1}"] = cow_forecast[:, step]
+    cows["production_drop"] = change <= -DROP_THRESHOLD
+    cows = cows.round(2)
+
+    # --- Herd ---
+    herd_daily = day.set_index("date")["herd_yield"].reindex(all_dates).to_numpy(dtype=float)
+    herd_row = herd_daily[None, :]
+    unfolded = all_dates > state["holt_until"] if state["holt_until"] is not None else np.ones(days, dtype=bool)
+    herd_level, herd_trend = state["herd_holt"]
+    herd_forecast = holt_forecast(herd_row[:, unfolded], horizon, np.array([herd_level]), np.array([herd_trend]))[0]
+    herd_recent = window_mean(herd_row, days, window)[0]
+    herd_previous = window_mean(herd_row, days - window, window)[0]
+
+    history = pd.DataFrame({"date": all_dates, "herd_yield": herd_daily})
+    history["rolling_avg"] = history["herd_yield"].rolling(window, min_periods=1).mean()
+    future = pd.DataFrame({
+        "date": pd.date_range(last_date + pd.Timedelta(days=1), periods=horizon, freq="D"),
+        "forecast": herd_forecast.round(1),
+    })
+
+    herd = {
+        "last_date": last_date.strftime("%Y-%m-%d"),
+        "cows": int(len(cow_ids)),
+        "avg_daily_yield": round(float(np.nanmean(herd_daily)), 1),
+        "avg_daily_yield_per_cow": round(float(totals["milk_yield"].sum() / totals["days"].sum()), 2),
+        f"last_{window}d_avg": round(float(herd_recent), 1),
+        f"prev_{window}d_avg": round(float(herd_previous), 1) if not np.isnan(herd_previous) else None,
+        "trend_l_per_day": round(float(window_slope(herd_row, window)[0]), 1),
+        "forecast": [round(float(v), 1) for v in herd_forecast],
+        "cows_with_drop": int(cows["production_drop"].sum()),
+    }
+    return {"herd": herd, "history": history, "future": future, "cows": cows}
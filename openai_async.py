@@ -0,0 +1,185 @@
+import asyncio
+import concurrent.futures
+import pathlib
+import queue
+import sys
+import threading
+
+import openai
+
+from openai_client import MAX_CONCURRENT, MAX_RETRIES, _count, _next_token, _retry_delay
+
+# === Async OpenAI access on one shared event loop ===
+# The analyses (upload -> thread -> run -> messages) run as coroutines on an
+# event loop in a daemon thread, shared by every Streamlit session and
+# background job of the process. Waiting on a run then costs no thread, so
+# many farms' analyses run at once. Script threads block on a result with
+# run_sync(), the bridge the sync functions of the app are built on.
+#
+# acall() applies the limits of openai_client.call(): the token bucket, the
+# retry policy and the statistics are shared with the sync calls; the
+# per-kind concurrency caps apply to the async calls.
+_lock = threading.Lock()
+_loop = None
+_loop_thread = None
+_clients = {}  # (api_key, base_url) -> AsyncOpenAI
+_semaphores = {kind: asyncio.Semaphore(n) for kind, n in MAX_CONCURRENT.items()}
+
+
+def event_loop():
+    # Started on first use
+    global _loop, _loop_thread
+    with _lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            _loop_thread = threading.Thread(target=_loop.run_forever, name="dairy-openai-loop", daemon=True)
+            _loop_thread.start()
+        return _loop
+
+
+def submit(coro):
+    # Schedules coro on the shared loop -> concurrent.futures.Future
+    return asyncio.run_coroutine_threadsafe(coro, event_loop())
+
+
+def _check_script_stop():
+    # Streamlit stops or reruns a script only at its next st.* call; a script
+    # waiting here makes none, so a pending request is raised the same way.
+    # This uses Streamlit internals (tested with the range pinned in
+    # requirements.txt); if they move, stop detection is off, runs are not.
+    if "streamlit" not in sys.modules:
+        return
+    try:
+        from streamlit.runtime.scriptrunner import RerunException, StopException, get_script_run_ctx
+        from streamlit.runtime.scriptrunner_utils.script_requests import ScriptRequestType
+        ctx = get_script_run_ctx(suppress_warning=True)
+        if ctx is None or ctx.script_requests is None or ctx._main_thread_ident != threading.get_ident():
+            return
+        request = ctx.script_requests.on_scriptrunner_yield()
+        if request is None:
+            return
+        if request.type != ScriptRequestType.RERUN:
+            raise StopException()
+        rerun_data = request.rerun_data
+    except (ImportError, AttributeError):
+        return
+    raise RerunException(rerun_data)
+
+
+def run_sync(coro, updates=None, on_update=None):
+    # Blocks the calling thread until coro is done and returns its result.
+    # Items put on updates (a queue.SimpleQueue) are passed to
+    # on_update(*item) in this thread, e.g. progress bars of a Streamlit
+    # script. If the caller is stopped while waiting (an exception in this
+    # thread, or a stop/rerun of the Streamlit script), the coroutine is
+    # cancelled (and cancels its remote run).
+    if threading.current_thread() is _loop_thread:
+        coro.close()
+        raise RuntimeError("run_sync() called on the event loop thread; await the coroutine instead")
+    future = submit(coro)
+    try:
+        while True:
+            # Short waits keep the thread interruptible
+            done = concurrent.futures.wait([future], timeout=0.05).done
+            while updates is not None and not updates.empty():
+                on_update(*updates.get())
+            if done:
+                return future.result()
+            _check_script_stop()
+    except BaseException:
+        future.cancel()
+        raise
+
+
+def relay(progress):
+    # -> (queue, callback) pair for run_sync: the callback can be called on
+    # the loop, progress(*args) runs in the waiting thread
+    if progress is None:
+        return None, None
+    updates = queue.SimpleQueue()
+    return updates, lambda *args: updates.put(args)
+
+
+def _client():
+    # Follows openai.api_key / openai.base_url, like the module-level sync client
+    key = (openai.api_key, str(openai.base_url) if openai.base_url else None)
+    client = _clients.get(key)
+    if client is None:
+        client = _clients[key] = openai.AsyncOpenAI(api_key=key[0], base_url=key[1], max_retries=0)
+    return client
+
+
+async def acall(kind, fn, *args, idempotent=True, **kwargs):
+    # await fn(*args, **kwargs) under the shared limits
+    semaphore = _semaphores.get(kind, _semaphores["default"])
+    _count("calls")
+
+    for attempt in range(MAX_RETRIES + 1):
+        waited = False
+        while wait := _next_token():
+            waited = True
+            await asyncio.sleep(wait)
+        if waited:
+            _count("throttled")
+        try:
+            async with semaphore:
+                return await fn(*args, **kwargs)
+        except openai.APIError as e:
+            await asyncio.sleep(_retry_delay(e, attempt, idempotent))
+
+
+# --- The OpenAI calls of the analyses ---
+async def create_file(path):
+    # The SDK reads the file asynchronously, again on a retry. A repeated
+    # upload or thread create at worst leaves a spare remote object (deleted
+    # by file_gc.py); message and run creates are not repeated.
+    return await acall("files", _client().files.create, file=pathlib.Path(path), purpose="assistants")
+
+
+async def retrieve_file(file_id):
+    return await acall("files", _client().files.retrieve, file_id)
+
+
+async def create_thread(**params):
+    return await acall("threads", _client().beta.threads.create, **params)
+
+
+async def update_thread(thread_id, **params):
+    return await acall("threads", _client().beta.threads.update, thread_id, **params)
+
+
+async def delete_thread(thread_id):
+    return await acall("threads", _client().beta.threads.delete, thread_id)
+
+
+async def create_message(thread_id, content, attachments=None):
+    return await acall(
+        "threads",
+        _client().beta.threads.messages.create,
+        thread_id=thread_id,
+        role="user",
+        content=content,
+        attachments=attachments or openai.NOT_GIVEN,
+        idempotent=False,
+    )
+
+
+async def list_messages(thread_id, **params):
+    return await acall("threads", _client().beta.threads.messages.list, thread_id=thread_id, **params)
+
+
+async def create_run(thread_id, assistant_id, **params):
+    # With stream=True the returned stream is consumed outside the limits
+    return await acall("runs", _client().beta.threads.runs.create, thread_id=thread_id, assistant_id=assistant_id, idempotent=False, **params)
+
+
+async def list_runs(thread_id, **params):
+    return await acall("runs", _client().beta.threads.runs.list, thread_id, **params)
+
+
+async def retrieve_run(thread_id, run_id):
+    return await acall("runs", _client().beta.threads.runs.retrieve, run_id, thread_id=thread_id)
+
+
+async def cancel_run(thread_id, run_id):
+    return await acall("runs", _client().beta.threads.runs.cancel, run_id, thread_id=thread_id)
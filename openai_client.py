@@ -0,0 +1,153 @@
+import random
+import threading
+import time
+
+import openai
+
+# === Shared OpenAI access: rate limit, concurrency caps and retries ===
+# Every OpenAI call of the app goes through call() (or acall() in
+# openai_async.py), which is shared by all Streamlit sessions, background
+# jobs and batch runs in the process:
+# - a token bucket spaces requests to REQUESTS_PER_SECOND (bursts up to BURST)
+# - per-kind semaphores cap concurrent requests (e.g. uploads)
+# - 429 and 5xx responses are retried with jittered exponential backoff; a
+#   429 also pauses the bucket for everyone until its Retry-After has passed
+REQUESTS_PER_SECOND = 5.0
+BURST = 10
+MAX_CONCURRENT = {"files": 4, "runs": 8, "default": 16}
+
+MAX_RETRIES = 5
+BACKOFF_BASE = 0.5  # seconds, doubled per attempt
+BACKOFF_MAX = 30.0
+
+# The SDK's own retries would multiply with ours
+openai.max_retries = 0
+
+_lock = threading.Lock()
+_tokens = float(BURST)
+_refilled_at = time.monotonic()
+_paused_until = 0.0
+_semaphores = {kind: threading.BoundedSemaphore(n) for kind, n in MAX_CONCURRENT.items()}
+_stats = {"calls": 0, "throttled": 0, "rate_limited": 0, "retried": 0, "failed": 0}
+
+
+def _next_token():
+    # Takes a token if the bucket has one (-> 0.0), else returns the seconds
+    # to wait before trying again
+    global _tokens, _refilled_at
+    with _lock:
+        now = time.monotonic()
+        _tokens = min(BURST, _tokens + (now - _refilled_at) * REQUESTS_PER_SECOND)
+        _refilled_at = now
+        if now >= _paused_until and _tokens >= 1.0:
+            _tokens -= 1.0
+            return 0.0
+        return max(_paused_until - now, (1.0 - _tokens) / REQUESTS_PER_SECOND, 1e-3)
+
+
+def _take_token():
+    # Blocks until the bucket has a token; returns True when it had to wait
+    waited = False
+    while True:
+        wait = _next_token()
+        if not wait:
+            return waited
+        waited = True
+        time.sleep(wait)
+
+
+def _count(stat):
+    with _lock:
+        _stats[stat] += 1
+
+
+def _pause(seconds):
+    # A 429 means the account limit is reached: hold back every caller
+    global _paused_until, _tokens
+    with _lock:
+        _paused_until = max(_paused_until, time.monotonic() + seconds)
+        _tokens = 0.0
+
+
+def _retry_after(error):
+    response = getattr(error, "response", None)
+    try:
+        return float(response.headers.get("retry-after"))
+    except (AttributeError, TypeError, ValueError):
+        return None
+
+
+def _retryable(error, idempotent):
+    if isinstance(error, openai.RateLimitError):
+        return True
+    # A failed create may still have been applied; only repeat safe calls
+    if isinstance(error, (openai.InternalServerError, openai.APIConnectionError)):
+        return idempotent
+    return False
+
+
+def _retry_delay(error, attempt, idempotent):
+    # Seconds to wait before the next attempt; re-raises a final error
+    if attempt == MAX_RETRIES or not _retryable(error, idempotent):
+        _count("failed")
+        raise error
+    delay = random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+    if isinstance(error, openai.RateLimitError):
+        delay = max(delay, _retry_after(error) or 0.0)
+        _pause(delay)
+        _count("rate_limited")
+    _count("retried")
+    return delay
+
+
+def call(kind, fn, *args, idempotent=True, **kwargs):
+    # fn(*args, **kwargs) under the shared limits; re-raises the last error
+    # once MAX_RETRIES is exhausted
+    semaphore = _semaphores.get(kind, _semaphores["default"])
+    _count("calls")
+
+    for attempt in range(MAX_RETRIES + 1):
+        if _take_token():
+            _count("throttled")
+        try:
+            with semaphore:
+                return fn(*args, **kwargs)
+        except openai.APIError as e:
+            time.sleep(_retry_delay(e, attempt, idempotent))
+
+
+def client_stats():
+    with _lock:
+        return dict(_stats)
+
+
+# --- Assistant management (create-agent.py); the analyses use openai_async.py ---
+def list_assistants():
+    # All pages in one go; an account has few assistants
+    return call("default", lambda: list(openai.beta.assistants.list(limit=100)))
+
+
+def retrieve_assistant(assistant_id):
+    return call("default", openai.beta.assistants.retrieve, assistant_id)
+
+
+def create_assistant(**params):
+    return call("default", openai.beta.assistants.create, idempotent=False, **params)
+
+
+def update_assistant(assistant_id, **params):
+    return call("default", openai.beta.assistants.update, assistant_id, **params)
+
+
+def delete_assistant(assistant_id):
+    return call("default", openai.beta.assistants.delete, assistant_id)
+
+
+# --- Remote file cleanup (file_gc.py) ---
+def list_files():
+    # All pages; the SDK follows the cursor
+    return call("files", lambda: list(openai.files.list(purpose="assistants")))
+
+
+def delete_file(file_id):
+    return call("files", openai.files.delete, file_id)
@@ -0,0 +1,303 @@
+import json
+import os
+import re
+import time
+
+from farm_cache import cached_json, cached_text
+
+# === Prompts sent to the dairy assistant ===
+
+# The KPIs are computed locally (sustainability_kpis.py); the assistant
+# only writes the summary and recommendations for them
+SUSTAINABILITY_TEXT_PROMPT = """
+You are an AI agent analyzing dairy farm sustainability.
+
+These sustainability indicators were calculated from the farm data:
+
+{kpis}
+
+Strictly return your output as valid JSON in this format:
+
+{{
+  "summary": "...",
+  "recommendations": [
+    "Recommendation 1",
+    "Recommendation 2",
+    "Recommendation 3"
+  ]
+}}
+
+Do NOT include explanations. Only return valid JSON.
+"""
+
+# The forecast itself is computed locally (milk_forecast.py); the assistant
+# only comments on the figures
+FORECAST_PROMPT = """
+You are a dairy farm assistant. These milk production figures were calculated from the farm's milk yield records:
+
+{forecast}
+
+Comment on the milk production trends. Return:
+- Average daily yield
+- Recent 7-day trend
+- Forecast for the next 3 days
+- Any risks or drops in production
+Respond in English. Do not use markdown.
+"""
+
+FEED_PROMPT = """
+You are a feed advisor for dairy cows.
+
+Use the following data files (milk yield, cow info, treatments, cost) to generate a clear, structured report.
+
+Return in plain Markdown (NO code blocks) and include only the following sections:
+
+## 🥛 Underperforming Cows
+- List cows with low milk yield and high lactation number.
+- Add concrete suggestions (e.g. energy supplements).
+
+## 🐘 Over-conditioned Cows
+- List cows with low output but high age/lactation and good health.
+- Suggest reducing feeding or changing rations.
+
+## 🧪 Feed Strategy Recommendations
+- Summary of changes (reduce/increase).
+- Suggestions on nutrient balancing.
+
+No introductions, no explanations. Respond only with the report in plain Markdown (no ```markdown).
+"""
+
+BIOGAS_PROMPT = """
+You are an expert in farm waste management and renewable energy.
+
+Using the provided files (manure data, biogas capacity, cow excretion records), generate a structured Markdown report with the following:
+
+## 💩 Manure Production Overview
+- Estimate total manure output per day/month.
+- Identify which cow groups produce the most manure.
+
+## ⚡️ Biogas Capacity & Usage
+- Compare manure production with biogas plant capacity.
+- Identify if there's excess/insufficient manure for optimal biogas production.
+
+## 🔧 Recommendations
+- Suggest optimization of manure collection.
+- Recommend strategies for improving biogas conversion efficiency.
+- If applicable, suggest how to use excess manure (e.g., fertilizer, compost).
+
+Do NOT include any explanations. Respond only with the report. Do NOT use code blocks.
+"""
+
+WEATHER_PROMPT = """
+You are a weather and climate impact analyst for dairy farms.
+
+Based on the uploaded weather and farm data (precipitation, temperature, treatments, yield), generate a professional Markdown report with the following structure:
+
+## 🌫️ Climate Trends
+- Describe relevant patterns in temperature, precipitation or extreme events.
+- Note any seasonal or long-term trends.
+
+## 💧 Impact on Production
+- Highlight effects on milk yield or feed needs due to weather.
+- Mention possible droughts, heat stress, or wet conditions.
+
+## 🧠 Recommendations
+- Suggest actions like weather protection, irrigation, or ventilation.
+- Mention adaptation strategies for upcoming climate variability.
+
+Respond only in plain Markdown (NO code blocks).
+"""
+
+HEALTH_PROMPT = """
+You are a veterinary health advisor for dairy farms.
+
+Using the provided data files (diagnoses, treatments, cow health, productivity), return a structured health status report.
+
+Return in plain Markdown (NO code blocks). Include exactly these sections:
+
+## 🧾 Key Health Metrics
+- Total number of treated cows
+- Average treatment duration
+- Most common diagnoses
+
+## 🚨 High-Risk Animals
+- List of animal IDs (or summaries) with repeated or severe diseases
+- Suggested monitoring or preventive measures
+
+## 💊 Recommendations
+- Preventive strategies to reduce illness rate
+- Suggestions for improving herd health management
+
+Do not add introductions or explanations. Return ONLY the report.
+"""
+
+DASHBOARD_PROMPT = """
+You are a sustainability advisor for dairy farms.
+
+Using the provided farm data (economy, health, environment), return a structured sustainability dashboard.
+
+Return in plain Markdown (NO code blocks). Include exactly the following sections:
+
+## 💰 Economic Overview
+- Monthly milk income
+- Total treatment and feed costs
+- Profit or loss summary
+
+## 🐄 Animal Health Status
+- % of treated cows
+- Average duration of treatments
+- Risk profile of the herd
+
+## 🌱 Environmental Metrics
+- Antibiotic usage (if data available)
+- Manure production (estimates if needed)
+- Any sustainability concerns
+
+## ✅ Recommendations
+- Actionable suggestions to improve sustainability in each area
+
+Do NOT explain what you're doing. Return ONLY the formatted report.
+"""
+
+# === Report types ===
+# key -> title, prompt, file the result is saved to, how it is parsed,
+# whether the farm files are attached (default: yes) and which local
+# summaries (farm_aggregates.py) replace the raw milk/treatment/cow tables
+REPORTS = {
+    "feed": {
+        "title": "Feed Optimization",
+        "prompt": FEED_PROMPT,
+        "report_file": "feed_optimization_report.json",
+        "format": "markdown",
+        "aggregates": ["cows", "monthly"],
+    },
+    "biogas": {
+        "title": "Biogas & Manure",
+        "prompt": BIOGAS_PROMPT,
+        "report_file": "biogas_manure_report.json",
+        "format": "markdown",
+        "aggregates": ["cows", "daily", "monthly"],
+    },
+    "weather": {
+        "title": "Weather & Climate",
+        "prompt": WEATHER_PROMPT,
+        "report_file": "weather_climate_report.json",
+        "format": "markdown",
+        "aggregates": ["daily", "monthly"],
+    },
+    "health": {
+        "title": "Health Monitoring",
+        "prompt": HEALTH_PROMPT,
+        "report_file": "health_monitoring_report.json",
+        "format": "markdown",
+        "aggregates": ["cows", "diagnoses", "monthly"],
+    },
+    "dashboard": {
+        "title": "Sustainability Dashboard",
+        "prompt": DASHBOARD_PROMPT,
+        "report_file": "sustainability_dashboard_report.json",
+        "format": "markdown",
+        "aggregates": ["cows", "diagnoses", "monthly"],
+    },
+    "sustainability": {
+        "title": "Sustainability Analysis",
+        "prompt": SUSTAINABILITY_TEXT_PROMPT,
+        "report_file": "sustainability_report.json",
+        "format": "json",
+        "attach_files": False,
+    },
+}
+
+
+# Layout of the saved markdown report artifacts
+ARTIFACT_VERSION = 1
+
+
+def clean_report_text(text):
+    return text.replace("```markdown", "").replace("```", "").replace("undefined", "").strip()
+
+
+def build_prompt(folder, report_key):
+    spec = REPORTS[report_key]
+    if report_key == "sustainability":
+        with open(os.path.join(folder, spec["report_file"])) as f:
+            kpis = json.load(f)["sustainability"]
+        return spec["prompt"].format(kpis=json.dumps(kpis, indent=2))
+    return spec["prompt"]
+
+
+def parse_report_sections(report):
+    # "## Title" sections -> [(title, content)]
+    sections = []
+    for section in clean_report_text(report).split("## "):
+        if section.strip():
+            lines = section.strip().split("\n")
+            sections.append((lines[0].strip(), "\n".join(lines[1:])))
+    return sections
+
+
+def _usage(run):
+    usage = getattr(run, "usage", None)
+    if usage is None:
+        return None
+    return {"prompt_tokens": usage.prompt_tokens, "completion_tokens": usage.completion_tokens, "total_tokens": usage.total_tokens}
+
+
+def save_report(folder, report_key, text, inputs=None, run=None, duration_s=None):
+    # Writes the assistant's answer to the report file; raises ValueError
+    # when a JSON report does not contain valid JSON. JSON answers are merged
+    # into the existing report so locally computed fields are kept.
+    # Markdown reports are saved as an artifact with the parsed sections, the
+    # run's model, duration and token usage, and inputs ({file: sha256} of
+    # the farm files it was built from).
+    spec = REPORTS[report_key]
+    path = os.path.join(folder, spec["report_file"])
+
+    if spec["format"] == "json":
+        match = re.search(r"\{[\s\S]*\}", text)
+        if not match:
+            raise ValueError("AI did not return valid JSON.")
+        result = {}
+        if os.path.exists(path):
+            with open(path) as f:
+                result = json.load(f)
+        result.update(json.loads(match.group(0)))
+        with open(path, "w") as f:
+            json.dump(result, f, indent=2)
+        return result
+
+    report_clean = clean_report_text(text)
+    artifact = {
+        "version": ARTIFACT_VERSION,
+        "report": report_key,
+        "generated_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "model": getattr(run, "model", None),
+        "duration_s": round(duration_s, 1) if duration_s is not None else None,
+        "usage": _usage(run),
+        "inputs": inputs or {},
+        "sections": parse_report_sections(report_clean),
+        "text": report_clean,
+    }
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(artifact, f, indent=2, ensure_ascii=False)
+    os.replace(tmp_path, path)
+    return report_clean
+
+
+def load_report(folder, report_key):
+    # Saved markdown report artifact, or None. Reports saved as plain .txt
+    # by older versions are parsed once and have no recorded inputs.
+    path = os.path.join(folder, REPORTS[report_key]["report_file"])
+    if os.path.exists(path):
+        return cached_json(path)
+    legacy_path = os.path.splitext(path)[0] + ".txt"
+    if os.path.exists(legacy_path):
+        text = cached_text(legacy_path)
+        return {"version": 0, "report": report_key, "inputs": {}, "sections": parse_report_sections(text), "text": text}
+    return None
+
+
+def changed_inputs(saved, current):
+    # Input files added, changed or removed since the report was generated
+    return sorted(name for name in set(saved) | set(current) if saved.get(name) != current.get(name))
@@ -0,0 +1,192 @@
+import asyncio
+import hashlib
+import json
+import os
+import threading
+import time
+from types import SimpleNamespace
+
+from upload_cache import input_hashes
+
+# === Recorded assistant answers, replayed for identical requests ===
+# An answer is stored under <farm folder>/response_cache/<key>.json, where
+# the key hashes the assistant id, the exact prompt and the sha256 of every
+# attached file. The same prompt with the same files (after a restart, or a
+# second user's click) returns the stored answer without any API call.
+# Entries older than MAX_AGE_S are dropped, and the least recently used
+# ones once a farm's cache exceeds MAX_CACHE_BYTES.
+#
+# RESPONSE_CACHE selects the mode:
+#   on      replay hits, record misses (default)
+#   off     always ask the assistant, record nothing
+#   replay  replay hits, fail on misses; no API calls at all (offline demos,
+#           deterministic tests)
+CACHE_FOLDER = "response_cache"
+MAX_CACHE_BYTES = 50 * 1024 * 1024
+MAX_AGE_S = 30 * 86400
+MODES = ("on", "off", "replay")
+
+_lock = threading.Lock()
+
+
+class CacheMiss(Exception):
+    def __init__(self, key):
+        super().__init__(f"No recorded answer for this request (cache key {key[:12]}) and RESPONSE_CACHE=replay.")
+        self.key = key
+
+
+def cache_mode():
+    mode = os.environ.get("RESPONSE_CACHE", "on").strip().lower()
+    return mode if mode in MODES else "on"
+
+
+def cache_key(assistant_id, prompt, inputs):
+    # inputs: {file name relative to the farm folder: sha256}
+    payload = json.dumps({"assistant_id": assistant_id, "prompt": prompt, "inputs": inputs}, sort_keys=True)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def _entry_path(folder, key):
+    return os.path.join(folder, CACHE_FOLDER, key + ".json")
+
+
+def _expired(entry, max_age_s):
+    return time.time() - entry.get("created_at", 0) > max_age_s
+
+
+def lookup(folder, assistant_id, prompt, paths, max_age_s=None):
+    # -> (key, inputs, stored entry or None). max_age_s shortens the lifetime
+    # of answers that go stale on their own (e.g. current weather); replay
+    # mode returns entries of any age.
+    inputs = input_hashes(folder, paths)
+    key = cache_key(assistant_id, prompt, inputs)
+    mode = cache_mode()
+    if mode == "off":
+        return key, inputs, None
+    path = _entry_path(folder, key)
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            entry = json.load(f)
+    except (OSError, ValueError):
+        return key, inputs, None
+    if mode != "replay" and _expired(entry, min(max_age_s or MAX_AGE_S, MAX_AGE_S)):
+        return key, inputs, None
+    # The file's mtime is its last use, for LRU eviction
+    try:
+        os.utime(path)
+    except OSError:
+        pass
+    return key, inputs, entry
+
+
+def replay(entry):
+    # -> (text, run-like object) shaped like ask_assistant_run's result;
+    # run.cached marks it for the metrics log
+    usage = entry.get("usage")
+    run = SimpleNamespace(
+        id=entry.get("run_id"),
+        status="completed",
+        model=entry.get("model"),
+        usage=SimpleNamespace(**usage) if usage else None,
+        cached=True,
+    )
+    return entry["text"], run
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def _evict(cache_folder):
+    entries = []
+    for name in os.listdir(cache_folder):
+        path = os.path.join(cache_folder, name)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue
+        age = time.time() - stat.st_mtime
+        if name.endswith(".tmp"):
+            # Leftover of a crashed write
+            if age > 60:
+                _remove(path)
+            continue
+        if age > MAX_AGE_S:
+            _remove(path)
+            continue
+        entries.append((stat.st_mtime, stat.st_size, path))
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= MAX_CACHE_BYTES:
+            break
+        _remove(path)
+        total -= size
+
+
+def store(folder, key, assistant_id, prompt, inputs, text, run=None):
+    usage = getattr(run, "usage", None)
+    entry = {
+        "key": key,
+        "assistant_id": assistant_id,
+        "prompt": prompt,
+        "inputs": inputs,
+        "text": text,
+        "model": getattr(run, "model", None),
+        "run_id": getattr(run, "id", None),
+        "usage": {
+            "prompt_tokens": usage.prompt_tokens,
+            "completion_tokens": usage.completion_tokens,
+            "total_tokens": usage.total_tokens,
+        } if usage else None,
+        "created_at": time.time(),
+    }
+    cache_folder = os.path.join(folder, CACHE_FOLDER)
+    os.makedirs(cache_folder, exist_ok=True)
+    path = _entry_path(folder, key)
+    tmp_path = f"{path}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(entry, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+    with _lock:
+        _evict(cache_folder)
+
+
+def ask_cached(folder, prompt, paths, assistant_id, ask, max_age_s=None):
+    # ask() -> (text, run) is only called on a miss; its answer is recorded
+    key, inputs, entry = lookup(folder, assistant_id, prompt, paths, max_age_s)
+    if entry is not None:
+        return replay(entry)
+    mode = cache_mode()
+    if mode == "replay":
+        raise CacheMiss(key)
+    text, run = ask()
+    if mode == "on":
+        store(folder, key, assistant_id, prompt, inputs, text, run)
+    return text, run
+
+
+async def ask_cached_async(folder, prompt, paths, assistant_id, ask, max_age_s=None):
+    # ask_cached() on the event loop: ask() -> awaitable (text, run); hashing
+    # and file access run in worker threads
+    key, inputs, entry = await asyncio.to_thread(lookup, folder, assistant_id, prompt, paths, max_age_s)
+    if entry is not None:
+        return replay(entry)
+    mode = cache_mode()
+    if mode == "replay":
+        raise CacheMiss(key)
+    text, run = await ask()
+    if mode == "on":
+        await asyncio.to_thread(store, folder, key, assistant_id, prompt, inputs, text, run)
+    return text, run
+
+
+def cache_summary(folder):
+    # -> {"entries": n, "bytes": size} of a farm's recorded answers
+    cache_folder = os.path.join(folder, CACHE_FOLDER)
+    if not os.path.isdir(cache_folder):
+        return {"entries": 0, "bytes": 0}
+    sizes = [entry.stat().st_size for entry in os.scandir(cache_folder) if entry.name.endswith(".json")]
+    return {"entries": len(sizes), "bytes": sum(sizes)}
@@ -0,0 +1,133 @@
+import argparse
+import asyncio
+import os
+import time
+
+from dotenv import load_dotenv
+
+from assistant_registry import AGENT_FILE, registered_assistant_id
+from farm_aggregates import aggregate_note, report_inputs
+from farm_context import ask_farm_async, ask_with_files
+from farm_metrics import record
+from openai_async import run_sync
+from reports import REPORTS, build_prompt, save_report
+from response_cache import ask_cached_async, cache_mode, lookup, replay
+from upload_cache import input_hashes, list_data_files, upload_files_async
+
+# === Refresh every report of a farm in one go ===
+# The farm files and summaries are uploaded once and shared by all report
+# runs, which then run concurrently as coroutines on the shared event loop
+# (openai_async.py) against the assistant created by create-agent.py. One of
+# them uses the farm's persistent thread (farm_context.py), the others run in
+# one-off threads.
+FOLDER_BASE = "streamlet/farm_data"
+
+# The sustainability report's KPIs are computed locally from all farm tables
+# (sustainability_kpis.py) and its AI text is optional, so it is not part of
+# "run all"
+ALL_REPORTS = ["feed", "biogas", "weather", "health", "dashboard"]
+
+
+async def run_all_reports_async(folder, assistant_id, report_keys=ALL_REPORTS, on_status=None, cancel_event=None, queued_s=None):
+    # Returns {"upload": s, "reports": {key: s}, "failed": {key: error}, "total": s}.
+    # on_status(report_key, status, **info) is called on the event loop.
+    # Every report is also recorded in the farm's metrics log, with the shared
+    # upload (and queued_s, the time the batch waited to start) counted for
+    # each of them.
+    started = time.monotonic()
+    timings = {"upload": None, "reports": {}, "failed": {}, "total": None}
+
+    # Each report gets its own summaries; every distinct file is uploaded once,
+    # and only for reports without a recorded answer (response_cache.py).
+    # Summaries and hashes are computed in a worker thread.
+    def prepare():
+        paths = list_data_files(folder)
+        inputs = {key: report_inputs(folder, key, paths) for key in report_keys}
+        prompts = {key: build_prompt(folder, key) + aggregate_note(inputs[key]) for key in report_keys}
+        recorded = {key: lookup(folder, assistant_id, prompts[key], inputs[key])[2] for key in report_keys}
+        return inputs, prompts, recorded, input_hashes(folder, paths)
+    inputs, prompts, recorded, hashes = await asyncio.to_thread(prepare)
+    misses = [key for key in report_keys if recorded[key] is None] if cache_mode() != "replay" else []
+    union = list(dict.fromkeys(path for key in misses for path in inputs[key]))
+    file_ids = dict(zip(union, await upload_files_async(folder, union)))
+    timings["upload"] = time.monotonic() - started
+
+    async def run_report(report_key):
+        if on_status:
+            on_status(report_key, "running")
+        report_started = time.monotonic()
+        stages = {"upload": timings["upload"]}
+        if queued_s is not None:
+            stages["queue"] = queued_s
+        prompt = prompts[report_key]
+
+        async def ask():
+            async def ask_farm(files):
+                return await ask_farm_async(folder, prompt, files, assistant_id, cancel_event=cancel_event, stages=stages)
+            files = {path: file_ids[path] for path in inputs[report_key]}
+            return await ask_with_files(folder, inputs[report_key], ask_farm, files, stages=stages)
+        try:
+            if recorded[report_key] is not None:
+                text, run = replay(recorded[report_key])
+            else:
+                text, run = await ask_cached_async(folder, prompt, inputs[report_key], assistant_id, ask)
+        except Exception as e:
+            record(folder, report_key, stages, getattr(e, "run", None), "cancelled" if cancel_event and cancel_event.is_set() else "failed")
+            timings["failed"][report_key] = str(e)
+            if on_status:
+                on_status(report_key, "failed", error=str(e))
+            return
+        duration = time.monotonic() - report_started
+        save_report(folder, report_key, text, hashes, run, duration)
+        stages["total"] = timings["upload"] + duration
+        record(folder, report_key, stages, run)
+        timings["reports"][report_key] = duration
+        if on_status:
+            on_status(report_key, "done", duration_s=round(duration, 1))
+
+    await asyncio.gather(*(run_report(key) for key in report_keys))
+    timings["total"] = time.monotonic() - started
+    return timings
+
+
+def run_all_reports(folder, assistant_id, report_keys=ALL_REPORTS, on_status=None, cancel_event=None, queued_s=None):
+    # Sync bridge for the CLIs; on_status is called on the event loop thread
+    return run_sync(run_all_reports_async(folder, assistant_id, report_keys, on_status, cancel_event, queued_s))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Refresh all reports of one farm.")
+    parser.add_argument("farm", help="farm name as shown in the app")
+    parser.add_argument("--reports", nargs="+", choices=ALL_REPORTS, default=ALL_REPORTS)
+    parser.add_argument("--assistant-id", help=f"defaults to the id stored in {AGENT_FILE}")
+    args = parser.parse_args()
+
+    # OPENAI_API_KEY comes from the environment or a .env file
+    load_dotenv()
+    assistant_id = args.assistant_id
+    if not assistant_id:
+        assistant_id = registered_assistant_id()
+        if not assistant_id:
+            parser.error(f"No assistant registered in {AGENT_FILE}; run create-agent.py first")
+
+    folder = os.path.join(FOLDER_BASE, args.farm.replace(" ", "_"))
+    if not os.path.isdir(folder):
+        parser.error(f"Farm folder not found: {folder}")
+
+    timings = run_all_reports(
+        folder,
+        assistant_id,
+        args.reports,
+        on_status=lambda key, status, **info: print(f"  {REPORTS[key]['title']}: {status}", flush=True),
+    )
+
+    print(f"\nUpload: {timings['upload']:.1f} s")
+    for key, duration in sorted(timings["reports"].items(), key=lambda item: item[1]):
+        print(f"  ✅ {REPORTS[key]['title']}: {duration:.1f} s")
+    for key, error in timings["failed"].items():
+        print(f"  ❌ {REPORTS[key]['title']}: {error}")
+    print(f"Total wall-clock: {timings['total']:.1f} s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,182 @@
+import argparse
+import hashlib
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from dotenv import load_dotenv
+
+from assistant_registry import AGENT_FILE, registered_assistant_id
+from farm_files import LAST_RUNS_NAME
+from reports import REPORTS, build_prompt
+from run_all_reports import ALL_REPORTS, FOLDER_BASE, run_all_reports
+from sustainability_kpis import write_sustainability_report
+from upload_cache import files_fingerprint, list_data_files
+
+# === Nightly refresh of every farm ===
+# Finds all farm folders under FOLDER_BASE and runs the chosen reports for
+# several farms at once. A report is skipped when its inputs (farm files and
+# prompt) are unchanged since its last successful run, as recorded in
+# <farm folder>/last_runs.json.
+FARM_WORKERS = 4
+
+STAGE_TITLES = {"kpis": "Local KPIs", "check": "Input check", "upload": "Upload", "total": "Farm total"}
+
+
+def list_farms(base=FOLDER_BASE):
+    return sorted(d for d in os.listdir(base) if os.path.isdir(os.path.join(base, d)))
+
+
+def load_last_runs(folder):
+    path = os.path.join(folder, LAST_RUNS_NAME)
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_last_runs(folder, last_runs):
+    path = os.path.join(folder, LAST_RUNS_NAME)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(last_runs, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def inputs_fingerprint(folder, report_key, files_hash):
+    return hashlib.sha256(f"{files_hash}\n{build_prompt(folder, report_key)}".encode()).hexdigest()
+
+
+def stale_reports(folder, report_keys, force=False):
+    # -> {report_key: inputs fingerprint} of the reports that need a run
+    files_hash = files_fingerprint(folder, list_data_files(folder))
+    last_runs = load_last_runs(folder)
+    stale = {}
+    for report_key in report_keys:
+        fingerprint = inputs_fingerprint(folder, report_key, files_hash)
+        report_path = os.path.join(folder, REPORTS[report_key]["report_file"])
+        last = last_runs.get(report_key, {})
+        if force or last.get("fingerprint") != fingerprint or not os.path.exists(report_path):
+            stale[report_key] = fingerprint
+    return stale
+
+
+def refresh_farm(folder, assistant_id, report_keys, force=False, kpis=False):
+    # Returns {"farm", "status": "done"|"skipped"|"failed", "timings", "error"}
+    farm = os.path.basename(folder)
+    started = time.monotonic()
+    result = {"farm": farm, "status": "skipped", "timings": {}, "error": None}
+
+    if kpis:
+        stage_started = time.monotonic()
+        write_sustainability_report(folder)
+        result["timings"]["kpis"] = time.monotonic() - stage_started
+
+    stage_started = time.monotonic()
+    stale = stale_reports(folder, report_keys, force)
+    result["timings"]["check"] = time.monotonic() - stage_started
+    if not stale:
+        result["timings"]["total"] = time.monotonic() - started
+        return result
+
+    timings = run_all_reports(folder, assistant_id, list(stale))
+    result["timings"]["upload"] = timings["upload"]
+    result["timings"].update(timings["reports"])
+
+    # Only reports that finished are recorded; failed ones run again next time
+    last_runs = load_last_runs(folder)
+    for report_key in timings["reports"]:
+        last_runs[report_key] = {
+            "fingerprint": stale[report_key],
+            "finished_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+        }
+    save_last_runs(folder, last_runs)
+
+    result["status"] = "failed" if timings["failed"] else "done"
+    if timings["failed"]:
+        result["error"] = "; ".join(f"{REPORTS[k]['title']}: {e}" for k, e in timings["failed"].items())
+    result["timings"]["total"] = time.monotonic() - started
+    return result
+
+
+def run_fleet(farms, assistant_id, report_keys=ALL_REPORTS, workers=FARM_WORKERS, force=False, kpis=False, on_result=None):
+    # Refreshes the farms with at most `workers` farms at a time; on_result(result)
+    # is called as each farm finishes
+    results = []
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {
+            pool.submit(refresh_farm, os.path.join(FOLDER_BASE, farm), assistant_id, report_keys, force, kpis): farm
+            for farm in farms
+        }
+        for future in as_completed(futures):
+            try:
+                result = future.result()
+            except Exception as e:
+                result = {"farm": futures[future], "status": "failed", "timings": {}, "error": str(e)}
+            results.append(result)
+            if on_result:
+                on_result(result)
+    return results
+
+
+def print_summary(results, wall_s):
+    done = [r for r in results if r["status"] == "done"]
+    skipped = [r for r in results if r["status"] == "skipped"]
+    failed = [r for r in results if r["status"] == "failed"]
+
+    print(f"\nFarms: {len(results)} ({len(done)} refreshed, {len(skipped)} unchanged, {len(failed)} failed)")
+    print(f"Wall-clock: {wall_s:.1f} s, throughput: {len(results) / max(wall_s, 1e-9) * 60:.1f} farms/min")
+
+    # Average and slowest time per stage over the farms that ran it
+    stages = {}
+    for result in results:
+        for stage, seconds in result["timings"].items():
+            stages.setdefault(stage, []).append(seconds)
+    for stage, values in stages.items():
+        title = REPORTS[stage]["title"] if stage in REPORTS else STAGE_TITLES[stage]
+        print(f"  {title}: avg {sum(values) / len(values):.1f} s, max {max(values):.1f} s ({len(values)} farms)")
+
+    for result in failed:
+        print(f"  ❌ {result['farm']}: {result['error']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Refresh the reports of every farm.")
+    parser.add_argument("--farms", nargs="+", help=f"farm folder names (default: all under {FOLDER_BASE})")
+    parser.add_argument("--reports", nargs="+", choices=ALL_REPORTS, default=ALL_REPORTS)
+    parser.add_argument("--workers", type=int, default=FARM_WORKERS, help="farms refreshed at the same time")
+    parser.add_argument("--force", action="store_true", help="run reports even when their inputs are unchanged")
+    parser.add_argument("--kpis", action="store_true", help="also recompute the local sustainability KPIs")
+    parser.add_argument("--assistant-id", help=f"defaults to the id stored in {AGENT_FILE}")
+    args = parser.parse_args()
+
+    # OPENAI_API_KEY comes from the environment or a .env file
+    load_dotenv()
+    assistant_id = args.assistant_id
+    if not assistant_id:
+        assistant_id = registered_assistant_id()
+        if not assistant_id:
+            parser.error(f"No assistant registered in {AGENT_FILE}; run create-agent.py first")
+
+    farms = args.farms or list_farms()
+    missing = [farm for farm in farms if not os.path.isdir(os.path.join(FOLDER_BASE, farm))]
+    if missing:
+        parser.error(f"Farm folders not found: {', '.join(missing)}")
+
+    def on_result(result):
+        icon = {"done": "✅", "skipped": "⏭️", "failed": "❌"}[result["status"]]
+        print(f"{icon} {result['farm']}: {result['status']} ({result['timings'].get('total', 0):.1f} s)", flush=True)
+
+    started = time.monotonic()
+    results = run_fleet(farms, assistant_id, args.reports, args.workers, args.force, args.kpis, on_result)
+    print_summary(results, time.monotonic() - started)
+    sys.exit(1 if any(r["status"] == "failed" for r in results) else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from farm_state import refresh_state
+
+# === Sustainability KPIs computed locally from the farm CSVs ===
+# Produces the same JSON schema as the assistant's sustainability_report.json
+# so "View Last Report" renders it unchanged. The KPIs are sums over the
+# incremental farm state, so only newly appended rows are read.
+REPORT_NAME = "sustainability_report.json"
+
+DEFAULT_MILK_PRICE = 10.0  # CZK per litre, used when the data has no price column
+HIGH_RISK_TREATMENTS = 3  # treatments per cow from which the animal counts as high-risk
+
+
+def compute_kpis(state, milk_price=DEFAULT_MILK_PRICE):
+    # state: the farm state from farm_state.refresh_state. Raises ValueError
+    # when it has no milk or treatment rows (e.g. unrecognised column names):
+    # all-zero KPIs would read as a healthy farm.
+    cow_month, treat, cows = state["cow_month"], state["treat"], state["cows"]
+    missing = [name for name, table in (("milk yield", cow_month), ("treatment", treat)) if table.empty]
+    if missing:
+        raise ValueError(f"No {' or '.join(missing)} rows found in the farm CSVs; check their column names.")
+
+    herd = pd.unique(np.concatenate([
+        cows["cow_id"].unique() if cows is not None else [], cow_month["cow_id"].unique(), treat["cow_id"].unique()
+    ]).astype(str))
+    herd_size = max(len(herd), 1)
+
+    # --- Economic ---
+    total_milk_income = float(cow_month["income_priced"].sum() + milk_price * cow_month["yield_unpriced"].sum())
+    total_treatment_costs = float(treat["cost"].sum())
+    months = cow_month["month"].nunique()
+    monthly_profit_loss = (total_milk_income - total_treatment_costs) / max(months, 1)
+
+    # --- Environmental ---
+    antibiotic_usage_frequency = int(treat["antibiotic_treatments"].sum())
+    # Treatments per cow in the herd
+    treatment_intensity = float(treat["treatments"].sum()) / herd_size
+
+    # --- Animal welfare ---
+    per_cow = treat.groupby("cow_id")["treatments"].sum()
+    percentage_sick_cows = 100.0 * len(per_cow) / herd_size
+    high_risk_animals_percentage = 100.0 * int((per_cow >= HIGH_RISK_TREATMENTS).sum()) / herd_size
+    days_count = treat["days_count"].sum()
+    avg_treatment_duration = treat["days_sum"].sum() / days_count if days_count else np.nan
+
+    return {
+        "economic": {
+            "total_milk_income": round(total_milk_income, 2),
+            "total_treatment_costs": round(total_treatment_costs, 2),
+            "monthly_profit_loss": round(monthly_profit_loss, 2),
+        },
+        "environmental": {
+            "antibiotic_usage_frequency": antibiotic_usage_frequency,
+            "treatment_intensity": round(treatment_intensity, 2),
+        },
+        "animal_welfare": {
+            "percentage_sick_cows": round(percentage_sick_cows, 1),
+            "avg_treatment_duration": round(float(avg_treatment_duration), 2) if pd.notna(avg_treatment_duration) else 0.0,
+            "high_risk_animals_percentage": round(high_risk_animals_percentage, 1),
+        },
+    }
+
+
+def default_text(kpis):
+    # Rule-based summary and recommendations, replaced when the assistant
+    # is asked to write them
+    economic, environmental, welfare = kpis["economic"], kpis["environmental"], kpis["animal_welfare"]
+    summary = (
+        f"Milk income {economic['total_milk_income']:.0f} CZK against treatment costs of "
+        f"{economic['total_treatment_costs']:.0f} CZK ({economic['monthly_profit_loss']:.0f} CZK per month). "
+        f"{welfare['percentage_sick_cows']:.1f} % of cows were treated, "
+        f"{environmental['antibiotic_usage_frequency']} treatments used antibiotics."
+    )
+
+    recommendations = []
+    if welfare["high_risk_animals_percentage"] > 10:
+        recommendations.append("Review the high-risk animals with repeated treatments together with the vet.")
+    if welfare["percentage_sick_cows"] > 25:
+        recommendations.append("Check housing, hygiene and transition-cow management to reduce the illness rate.")
+    if environmental["antibiotic_usage_frequency"] > 0:
+        recommendations.append("Use selective dry-cow therapy and culture-based treatment to cut antibiotic use.")
+    if economic["monthly_profit_loss"] < 0:
+        recommendations.append("Treatment costs exceed milk income; prioritise prevention over treatment.")
+    if not recommendations:
+        recommendations.append("Indicators are within normal ranges; keep monitoring monthly.")
+    return summary, recommendations
+
+
+def write_sustainability_report(folder, milk_price=DEFAULT_MILK_PRICE):
+    kpis = compute_kpis(refresh_state(folder), milk_price=milk_price)
+    summary, recommendations = default_text(kpis)
+    result = {"summary": summary, "sustainability": kpis, "recommendations": recommendations}
+    with open(os.path.join(folder, REPORT_NAME), "w") as f:
+        json.dump(result, f, indent=2)
+    return result
@@ -0,0 +1,83 @@
+import streamlit as st
+
+from job_queue import ACTIVE_STATUSES, cancel_job, get_job, latest_job
+from reports import REPORTS, changed_inputs, load_report
+from upload_cache import input_hashes, list_data_files
+
+JOB_STATUS_REFRESH_SECONDS = 3
+
+
+# === Progress bar for uploading farm files, returns progress(done, total) ===
+def upload_progress(count):
+    bar = st.progress(0.0, text=f"⬆️ Uploading {count} files...")
+
+    def progress(done, total):
+        bar.progress(done / total if total else 1.0, text=f"⬆️ Uploaded {done}/{total} files")
+        if done == total:
+            bar.empty()
+
+    return progress
+
+
+# === Saved Markdown report, one expander per "## " section ===
+def show_report_sections(sections):
+    for title, content in sections:
+        with st.expander(title, expanded=True):
+            st.markdown(content)
+
+
+def show_saved_report(folder, report_key):
+    # Renders the pre-parsed sections of the saved artifact and flags it as
+    # stale when the farm files differ from the ones it was built from
+    report = load_report(folder, report_key)
+    if report is None:
+        st.info("No saved report found. Click below to generate a new one.")
+        return
+
+    show_report_sections(report["sections"])
+    changed = changed_inputs(report["inputs"], input_hashes(folder, list_data_files(folder)))
+    if not report["inputs"]:
+        st.info("📁 Loaded from saved report.")
+    elif changed:
+        st.warning(f"⚠️ Farm data changed since this report was generated ({', '.join(changed)}). Run the analysis again to refresh it.")
+    else:
+        st.info(f"📁 Loaded from saved report ({report['generated_at']}).")
+
+    details = [report.get("model"), f"{report['duration_s']:.0f} s" if report.get("duration_s") is not None else None]
+    if report.get("usage"):
+        details.append(f"{report['usage']['total_tokens']:,} tokens")
+    if any(details):
+        st.caption(" · ".join(d for d in details if d))
+
+
+# === Status of the latest background job for a report ===
+@st.fragment(run_every=JOB_STATUS_REFRESH_SECONDS)
+def _active_job_status(folder, job_id):
+    job = get_job(folder, job_id)
+    if job is None or job["status"] not in ACTIVE_STATUSES:
+        # Finished: rerun the whole page so the new report is shown
+        st.rerun()
+
+    title = REPORTS[job["report"]]["title"]
+    if job["status"] == "queued":
+        st.info(f"⏳ {title} job queued at {job['created_at']}.")
+    else:
+        st.info(f"⚙️ {title} job running since {job['started_at']}. You can leave this page.")
+    if st.button("✖️ Cancel job", key=f"cancel_{job_id}"):
+        cancel_job(folder, job_id)
+
+
+def show_job_status(folder, report_key):
+    job = latest_job(folder, report_key)
+    if job is None:
+        return None
+    if job["status"] in ACTIVE_STATUSES:
+        _active_job_status(folder, job["id"])
+    elif job["status"] == "done":
+        took = f" in {job['duration_s']:.1f} s" if job.get("duration_s") is not None else ""
+        st.caption(f"✅ Last run finished at {job['finished_at']}{took}.")
+    elif job["status"] == "cancelled":
+        st.warning(f"✖️ Last run was cancelled at {job['finished_at']}.")
+    else:
+        st.error(f"❌ Last run failed: {job['error']}")
+    return job
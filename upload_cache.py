@@ -0,0 +1,232 @@
+import asyncio
+import hashlib
+import json
+import os
+import threading
+import time
+
+import openai
+
+from farm_cache import cached, cached_listdir
+from farm_files import INTERNAL_FILES as BOOKKEEPING_FILES, PROFILE_NAME, REGISTRY_NAME
+from openai_async import create_file, relay, retrieve_file, run_sync
+from reports import REPORTS
+
+# === Per-farm registry of files already uploaded to OpenAI ===
+# Maps each farm file to the sha256 of its content plus size/mtime and the
+# remote file_id, so unchanged files are never sent twice. Stored in
+# <farm folder>/uploaded_files.json (REGISTRY_NAME).
+#
+# Every remote file the app uploads or attaches is logged, one JSON line per
+# upload or use, to remote_files.jsonl next to the farm folders (farm, sha256,
+# bytes, time); file_gc.py deletes remote files from it.
+REMOTE_LOG_NAME = "remote_files.jsonl"
+
+# Bookkeeping files and everything the app generates (reports, profile) live
+# in the farm folder but are not farm data: they must not count as report
+# inputs, cache keys or fleet fingerprints
+INTERNAL_FILES = BOOKKEEPING_FILES | {spec["report_file"] for spec in REPORTS.values()} | {PROFILE_NAME}
+
+_lock = threading.Lock()
+_inflight = {}  # sha256 -> upload task on the shared event loop
+
+
+def stream_sha256(fileobj, chunk_size=1024 * 1024):
+    digest = hashlib.sha256()
+    for chunk in iter(lambda: fileobj.read(chunk_size), b""):
+        digest.update(chunk)
+    return digest.hexdigest()
+
+
+def file_sha256(path, chunk_size=1024 * 1024):
+    with open(path, "rb") as f:
+        return stream_sha256(f, chunk_size)
+
+
+def list_data_files(folder):
+    return [
+        os.path.join(folder, f)
+        for f in cached_listdir(folder)
+        if (f.endswith(".csv") or f.endswith(".json")) and f not in INTERNAL_FILES
+    ]
+
+
+def load_registry(folder):
+    path = os.path.join(folder, REGISTRY_NAME)
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_registry(folder, registry):
+    path = os.path.join(folder, REGISTRY_NAME)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(registry, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def file_hash(folder, path, registry=None):
+    if registry is None:
+        registry = load_registry(folder)
+    entry = registry.get(os.path.basename(path))
+    stat = os.stat(path)
+    if entry and entry["size"] == stat.st_size and entry["mtime"] == stat.st_mtime:
+        return entry["sha256"]
+    return cached("sha256", path, lambda: file_sha256(path))
+
+
+def files_fingerprint(folder, paths):
+    # One hash over the names and contents of all input files
+    registry = load_registry(folder)
+    digest = hashlib.sha256()
+    for path in sorted(paths):
+        digest.update(f"{os.path.basename(path)}:{file_hash(folder, path, registry)}\n".encode())
+    return digest.hexdigest()
+
+
+def input_hashes(folder, paths):
+    # {file name relative to the farm folder: sha256}, as recorded in reports
+    registry = load_registry(folder)
+    return {os.path.relpath(path, folder): file_hash(folder, path, registry) for path in sorted(paths)}
+
+
+def _resolve(path, registry):
+    # -> (sha256, stat, file_id already known for this content or None)
+    name = os.path.basename(path)
+    stat = os.stat(path)
+    entry = registry.get(name)
+
+    # Same size and mtime -> trust the stored hash, no need to re-read the file
+    if entry and entry["size"] == stat.st_size and entry["mtime"] == stat.st_mtime:
+        return entry["sha256"], stat, entry["file_id"]
+
+    sha256 = file_sha256(path)
+    candidates = ([entry] if entry else []) + list(registry.values())
+    known = next((e for e in candidates if e["sha256"] == sha256), None)
+    return sha256, stat, known["file_id"] if known else None
+
+
+def remote_log_path(folder):
+    return os.path.join(os.path.dirname(os.path.abspath(folder)), REMOTE_LOG_NAME)
+
+
+def log_remote_files(folder, entries):
+    # entries: [{"event": "upload"|"use", "file_id", "sha256", "bytes"}]; one
+    # small append per line, so app, jobs and CLIs can log at the same time
+    farm = os.path.basename(os.path.abspath(folder))
+    now = time.time()
+    lines = "".join(json.dumps({**entry, "farm": farm, "at": now}) + "\n" for entry in entries)
+    with open(remote_log_path(folder), "a", encoding="utf-8") as f:
+        f.write(lines)
+
+
+async def _upload(path):
+    return (await create_file(path)).id
+
+
+def _track(sha256, task):
+    # Each new content hash is uploaded once, also across concurrent callers;
+    # a finished upload is forgotten, its file_id is in the registry
+    _inflight[sha256] = task
+    task.add_done_callback(lambda done: _inflight.pop(sha256, None) if _inflight.get(sha256) is done else None)
+    return task
+
+
+async def upload_files_async(folder, paths, progress=None):
+    # Hashes run in worker threads, uploads on the event loop; file_ids come
+    # back in the same order as paths. progress(done, total) is called on
+    # the loop.
+    registry = await asyncio.to_thread(load_registry, folder)
+    total = len(paths)
+    resolved = await asyncio.gather(*(asyncio.to_thread(_resolve, path, registry) for path in paths))
+
+    tasks = {}
+    for path, (sha256, _, file_id) in zip(paths, resolved):
+        if file_id is None and sha256 not in tasks:
+            tasks[sha256] = _inflight.get(sha256) or _track(sha256, asyncio.ensure_future(_upload(path)))
+
+    waiting = {sha256: sum(1 for r in resolved if r[0] == sha256 and r[2] is None) for sha256 in tasks}
+    done = total - sum(waiting.values())
+    if progress:
+        progress(done, total)
+
+    async def finish(sha256, task):
+        # A cancelled caller leaves an upload shared with others running
+        return sha256, await asyncio.shield(task)
+
+    uploaded = {}
+    for next_done in asyncio.as_completed([finish(sha256, task) for sha256, task in tasks.items()]):
+        sha256, file_id = await next_done
+        uploaded[sha256] = file_id
+        done += waiting[sha256]
+        if progress:
+            progress(done, total)
+
+    file_ids = []
+    used = {}
+    with _lock:
+        registry = load_registry(folder)
+        for path, (sha256, stat, file_id) in zip(paths, resolved):
+            event = "use" if file_id else "upload"
+            file_id = file_id or uploaded[sha256]
+            if used.get(file_id, {}).get("event") != "upload":
+                used[file_id] = {"event": event, "file_id": file_id, "sha256": sha256, "bytes": stat.st_size}
+            registry[os.path.basename(path)] = {
+                "sha256": sha256,
+                "size": stat.st_size,
+                "mtime": stat.st_mtime,
+                "file_id": file_id,
+            }
+            file_ids.append(file_id)
+        save_registry(folder, registry)
+        log_remote_files(folder, used.values())
+    return file_ids
+
+
+async def _missing(file_id):
+    try:
+        await retrieve_file(file_id)
+    except openai.NotFoundError:
+        return True
+    return False
+
+
+async def forget_missing_files(folder, file_ids):
+    # After a request with these files failed: the ids that are gone on the
+    # OpenAI side (deleted by file_gc.py, or expired) are dropped from the
+    # registry, so upload_files_async() uploads their files again -> those ids
+    unique = list(dict.fromkeys(file_ids))
+    missing = {fid for fid, gone in zip(unique, await asyncio.gather(*(_missing(fid) for fid in unique))) if gone}
+    if missing:
+        with _lock:
+            registry = load_registry(folder)
+            save_registry(folder, {name: entry for name, entry in registry.items() if entry["file_id"] not in missing})
+    return missing
+
+
+def upload_files(folder, paths, progress=None):
+    # progress(done, total) is called from the calling thread
+    updates, on_progress = relay(progress)
+    return run_sync(upload_files_async(folder, paths, on_progress), updates, progress)
+
+
+def upload_file(folder, path):
+    return upload_files(folder, [path])[0]
+
+
+def attachments_for(file_ids):
+    unique = []
+    for file_id in file_ids:
+        # Identical content under two names maps to one remote file
+        if file_id not in unique:
+            unique.append(file_id)
+    return [{"file_id": fid, "tools": [{"type": "code_interpreter"}]} for fid in unique]
+
+
+def build_attachments(folder, paths, progress=None):
+    return attachments_for(upload_files(folder, paths, progress=progress))